@@ -0,0 +1,113 @@
+# ai_agent/explanation.py
+
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+from ai_agent.money import DEFAULT_CURRENCY, minor_exponent
+from ai_agent.state import GroupState
+from ai_agent.warnings import risk_band
+
+# template: local report rendered from the state (default)
+# rich: LLM-written report, falling back to the template when the LLM is unavailable
+EXPLANATION_MODES = ("template", "rich")
+
+LEVEL_ORDER = ("LEVEL_3", "LEVEL_2", "LEVEL_1")
+
+RISK_WORDS = {
+    "NONE": "low",
+    "LEVEL_1": "elevated",
+    "LEVEL_2": "high",
+    "LEVEL_3": "critical",
+}
+
+
+def format_amount(amount: float, currency: str) -> str:
+    return f"{amount:,.{minor_exponent(currency)}f} {currency}"
+
+
+def _transfer_line(transfer: Dict) -> str:
+    currency = transfer.get("currency") or DEFAULT_CURRENCY
+    return f"{transfer['from']} pays {transfer['to']} {format_amount(transfer['amount'], currency)}"
+
+
+def _balance_text(balance: float, currency: str) -> str:
+    # Positive = paid more than their share (creditor), negative = owes the group
+    if balance < 0:
+        return f"owes {format_amount(-balance, currency)}"
+    if balance > 0:
+        return f"is owed {format_amount(balance, currency)}"
+    return "settled"
+
+
+def render_explanation(state: GroupState) -> str:
+    """
+    Settlement report built from the graph state alone: summary, transfers,
+    one section per member (balance, risk, warning, what they pay / receive)
+    and the reason for every exclusion. Same headings and bullets as the LLM
+    report, no network call, and identical output for identical state.
+    """
+
+    currency = state.get("currency_default") or DEFAULT_CURRENCY
+    balances = state.get("balances", {})
+    transfers = state.get("pending_settlements", [])
+    risk_scores = state.get("risk_scores", {})
+    levels = state.get("warning_levels", {})
+    counts = state.get("warning_counts", {})
+    excluded = state.get("excluded_members", [])
+    stats = state.get("settlement_stats") or {}
+
+    member_ids = [m["user_id"] for m in state.get("members", [])] or sorted(balances)
+    issued = Counter(level for level in levels.values() if level in LEVEL_ORDER)
+
+    totals: Dict[str, float] = defaultdict(float)
+    pays: Dict[str, List[str]] = defaultdict(list)
+    receives: Dict[str, List[str]] = defaultdict(list)
+    for t in transfers:
+        t_currency = t.get("currency") or DEFAULT_CURRENCY
+        totals[t_currency] += t["amount"]
+        pays[t["from"]].append(f"{format_amount(t['amount'], t_currency)} to {t['to']}")
+        receives[t["to"]].append(f"{format_amount(t['amount'], t_currency)} from {t['from']}")
+
+    lines = ["# Settlement Report", "", "## Summary"]
+    lines.append(f"- Members: {len(member_ids)}")
+    lines.append(f"- Transfers: {len(transfers)} ({stats.get('mode', 'greedy')} settlement)")
+    if totals:
+        lines.append("- Total to settle: " + ", ".join(format_amount(v, c) for c, v in sorted(totals.items())))
+    if issued:
+        breakdown = ", ".join(f"{level}: {issued[level]}" for level in LEVEL_ORDER if issued[level])
+        lines.append(f"- Warnings issued: {sum(issued.values())} ({breakdown})")
+    else:
+        lines.append("- Warnings issued: none")
+    lines.append(f"- Excluded members: {len(excluded)}")
+
+    lines += ["", "## Transfers"]
+    if transfers:
+        lines += [f"- {_transfer_line(t)}" for t in transfers]
+    else:
+        lines.append("- No transfers needed: every balance is already settled.")
+
+    lines += ["", "## Members"]
+    for uid in member_ids:
+        risk = risk_scores.get(uid, 0.0)
+        level = levels.get(uid, "NONE")
+        lines += ["", f"### {uid}"]
+        lines.append(f"- Balance: {_balance_text(balances.get(uid, 0.0), currency)}")
+        lines.append(f"- Risk score: {risk:.2f} ({RISK_WORDS.get(risk_band(risk), 'low')})")
+        lines.append(f"- Warning level: {level} (strikes: {counts.get(uid, 0)})")
+        if pays[uid]:
+            lines.append("- Pays: " + "; ".join(pays[uid]))
+        if receives[uid]:
+            lines.append("- Receives: " + "; ".join(receives[uid]))
+        if uid in excluded:
+            lines.append("- Status: excluded from this settlement")
+
+    if excluded:
+        lines += ["", "## Exclusions"]
+        for uid in excluded:
+            lines.append(
+                f"- {uid}: {counts.get(uid, 0)} LEVEL_3 warnings while still owing the group "
+                f"({_balance_text(balances.get(uid, 0.0), currency)}). "
+                f"Excluded until the outstanding amount is paid; further late or missed payments keep the risk score critical."
+            )
+
+    return "\n".join(lines)
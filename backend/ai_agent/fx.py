@@ -0,0 +1,86 @@
+from decimal import Decimal, ROUND_HALF_EVEN
+from typing import Callable, Dict, Optional
+import threading
+import time
+
+from ai_agent.money import DEFAULT_CURRENCY, minor_exponent
+
+FX_CACHE_TTL_SECONDS = 300
+
+
+class FxRateTable:
+    """
+    One version of the local FX rate table.
+    rates: currency -> units of `pivot` per 1 unit of currency (pivot itself = 1)
+    """
+
+    def __init__(self, rates: Dict[str, Decimal], version: int, pivot: str = DEFAULT_CURRENCY):
+        self.pivot = pivot.upper()
+        self.version = version
+        self.rates = {c.upper(): Decimal(str(r)) for c, r in rates.items()}
+        self.rates[self.pivot] = Decimal(1)
+
+    def has(self, currency: str) -> bool:
+        return currency.upper() in self.rates
+
+    def convert_minor(self, minor: int, src: str, dst: str) -> int:
+        src, dst = src.upper(), dst.upper()
+        if src == dst:
+            return minor
+        if src not in self.rates or dst not in self.rates:
+            raise KeyError(f"No FX rate for {src}->{dst} in table v{self.version}")
+
+        major = Decimal(minor).scaleb(-minor_exponent(src))
+        converted = major * self.rates[src] / self.rates[dst]
+        return int(converted.scaleb(minor_exponent(dst)).quantize(Decimal(1), rounding=ROUND_HALF_EVEN))
+
+    def convert_balances(self, balances_minor: Dict[str, int], src: str, dst: str) -> Dict[str, int]:
+        """
+        Convert a zero-sum balance set. Rounding each member separately can
+        leave a few units of residue, which is absorbed by the member with the
+        largest balance (ties by user id) so the result still nets to zero.
+        """
+
+        converted = {uid: self.convert_minor(v, src, dst) for uid, v in balances_minor.items()}
+        residue = sum(converted.values()) - self.convert_minor(sum(balances_minor.values()), src, dst)
+        if residue and converted:
+            largest = max(converted, key=lambda uid: (abs(converted[uid]), uid))
+            converted[largest] -= residue
+        return converted
+
+    def to_dict(self) -> Dict:
+        return {
+            "version": self.version,
+            "pivot": self.pivot,
+            "rates": {c: str(r) for c, r in self.rates.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> Optional["FxRateTable"]:
+        if not data:
+            return None
+        return cls(data.get("rates", {}), data.get("version", 0), data.get("pivot", DEFAULT_CURRENCY))
+
+
+class FxRateCache:
+    """
+    Process-wide cache of the latest rate table. The loader is only called
+    when the cached table is older than `ttl` or after invalidate().
+    """
+
+    def __init__(self, ttl: float = FX_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._table: Optional[FxRateTable] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, loader: Callable[[], Optional[FxRateTable]]) -> Optional[FxRateTable]:
+        with self._lock:
+            if self._table is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._table = loader()
+                self._loaded_at = time.monotonic()
+            return self._table
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._table = None
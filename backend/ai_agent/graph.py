@@ -1,118 +1,83 @@
 # ai_agent/graph.py
 
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from datetime import datetime
-from typing import Dict
+from typing import Callable, Dict, Optional
+from langgraph.config import get_stream_writer
 from langgraph.graph import StateGraph, START, END
-from state import GroupState   # assuming state.py is next to this file
-from tex import tex_optimize
-from risk import calculate_risk_scores
-from warnings import evaluate_warnings
-from onchain_logic import onchain_node
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_groq import ChatGroq
+from ai_agent.state import GroupState
+from ai_agent.pipeline import compute_balances, tex_node, risk_node, warning_node
+from ai_agent.onchain_logic import onchain_node
+from ai_agent.explanation import render_explanation
+from ai_agent.llm import get_llm, invoke_llm, llm_config
 from langchain_core.prompts import ChatPromptTemplate
 import json
-import os
 import logging
-from dotenv import load_dotenv
-
-load_dotenv()
+import math
+import threading
+import time
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# LLM Initialization with fallback
-llm = None
-llm_governance = None
+# ────────────────────────────────────────────────
+# Prompts (data goes in as template variables, so JSON braces are not parsed)
+# ────────────────────────────────────────────────
 
-try:
-    llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0.6)   # updated model name (2025/2026 naming)
-except Exception as e:
-    logger.warning(f"Google Gemini init failed: {e}")
+EXPLANATION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system",
+     """You are AlgoSettler's transparent Explanation Engine.
+Analyze ONLY the provided data.
+Rules:
+- Never invent numbers or facts
+- Explain settlement logic, risk levels, warnings, exclusions
+- For excluded members: describe expected future behavior patterns
+- Tone: professional, audit-ready, clear
+- Structure: use headings and bullet points"""),
+    ("human", "Data:\n{data}\n\nGenerate full explanation report.")
+])
 
-try:
-    llm_governance = ChatGroq(model="llama3-8b-8192", temperature=0.7)
-except Exception as e:
-    logger.warning(f"Groq Llama init failed: {e}")
+GOVERNANCE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """Respond ONLY with valid JSON. No extra text.
+Format:
+{{
+  "remove_user": true/false,
+  "deduct_wallet": true/false,
+  "amount_to_deduct": number,
+  "reason": "short reason"
+}}"""),
+    ("human", """User: {user_id}
+Warning Level: {level}
+Balance: {balance}
 
-# Fallback if both fail
-if llm is None:
-    logger.error("No usable LLM available for explanation node")
-if llm_governance is None:
-    logger.error("No usable LLM available for governance node")
+Rules:
+- Level >= 3 → recommend removal
+- Negative balance → consider deduction
+- amount_to_deduct > 0 or 0""")
+])
 
 # ────────────────────────────────────────────────
 # Nodes
 # ────────────────────────────────────────────────
+# explanation and governance run in the same step, so each returns only the
+# keys it owns (two full-state writes to one key in a step are rejected)
 
-def compute_balances(state: GroupState) -> GroupState:
-    balances: Dict[str, float] = {m["user_id"]: 0.0 for m in state["members"]}
-
-    for expense in state.get("expenses", []):
-        payer = expense["paid_by"]
-        amount = expense["amount"]
-        if len(state["members"]) == 0:
-            continue
-        split_amount = amount / len(state["members"])
-
-        for member in state["members"]:
-            uid = member["user_id"]
-            if uid == payer:
-                balances[uid] += amount - split_amount
-            else:
-                balances[uid] -= split_amount
-
-    state["balances"] = balances
-    state["last_updated"] = datetime.now()
-    return state
-
-
-def tex_node(state: GroupState) -> GroupState:
-    # Assuming tex_optimize returns list of settlement dicts
-    settlements = tex_optimize(state.get("balances", {}))
-    state["pending_settlements"] = settlements   # ← using consistent key from your state schema
-    state["last_updated"] = datetime.now()
-    return state
-
-
-def risk_node(state: GroupState) -> GroupState:
-    # Placeholder – replace with real DB fetch later
-    payment_history = {}
-    warning_history = {}
-    settlement_history = {}
-
-    state["risk_scores"] = calculate_risk_scores(
-        balances=state.get("balances", {}),
-        payment_history=payment_history,
-        warning_history=warning_history,
-        settlement_history=settlement_history
-    )
-    state["last_updated"] = datetime.now()
-    return state
-
-
-def warning_node(state: GroupState) -> GroupState:
-    existing_counts = state.get("warning_counts", {})
-
-    warning_levels, updated_counts, enforcement_flags = evaluate_warnings(
-        risk_scores=state.get("risk_scores", {}),
-        existing_warning_counts=existing_counts,
-        balances=state.get("balances", {})
-    )
+def _stream_writer() -> Callable:
+    """Custom stream channel of the running graph (tokens for SSE clients); no-op outside a run"""
+    try:
+        return get_stream_writer()
+    except RuntimeError:
+        return lambda chunk: None
 
-    state["warning_levels"] = warning_levels
-    state["warning_counts"] = updated_counts
-    state["excluded_members"] = [
-        uid for uid, enforce in enforcement_flags.items() if enforce
-    ]
-    state["last_updated"] = datetime.now()
-    return state
 
+def explanation_node(state: GroupState) -> Dict:
+    # Template report by default; the LLM writes it only in "rich" mode
+    if state.get("settings", {}).get("explanation_mode", "template") != "rich":
+        return {"explanation": render_explanation(state)}
 
-def explanation_node(state: GroupState) -> GroupState:
+    llm = get_llm("explanation", state.get("settings"))
     if llm is None:
-        state["explanation"] = "Explanation unavailable – LLM not initialized."
-        return state
+        return {"explanation": render_explanation(state)}
 
     data = {
         "balances": state.get("balances", {}),
@@ -122,128 +87,280 @@ def explanation_node(state: GroupState) -> GroupState:
         "excluded_members": state.get("excluded_members", []),
     }
 
-    prompt = ChatPromptTemplate.from_messages([
-        ("system",
-         """You are AlgoSettler's transparent Explanation Engine.
-Analyze ONLY the provided data.
-Rules:
-- Never invent numbers or facts
-- Explain settlement logic, risk levels, warnings, exclusions
-- For excluded members: describe expected future behavior patterns
-- Tone: professional, audit-ready, clear
-- Structure: use headings and bullet points"""),
-        ("human", f"Data:\n{json.dumps(data, indent=2, default=str)}\n\nGenerate full explanation report.")
-    ])
-
     try:
-        chain = prompt | llm
-        response = chain.invoke({})
-        state["explanation"] = response.content.strip()
+        # sort_keys: the same data always renders the same prompt (cache key)
+        writer = _stream_writer()
+        explanation = invoke_llm("explanation", llm, EXPLANATION_PROMPT, {
+            "data": json.dumps(data, indent=2, default=str, sort_keys=True)
+        }, state.get("settings"), on_token=lambda text: writer({"text": text}))
     except Exception as e:
-        logger.error(f"Explanation LLM failed: {e}")
-        state["explanation"] = f"Failed to generate explanation: {str(e)}"
+        logger.error(f"Explanation LLM failed, using template report: {e}")
+        explanation = render_explanation(state)
+
+    return {"explanation": explanation}
+
+
+def _evaluated_levels(state: GroupState) -> Dict[str, str]:
+    """Warning levels decided this run (change-driven mode: only members whose level may have moved)"""
+    warning_levels = state.get("warning_levels", {})
+    changed = state.get("warning_changes")
+    if changed is not None:
+        warning_levels = {uid: level for uid, level in warning_levels.items() if uid in changed}
+    return warning_levels
+
+
+def _no_action(reason: str) -> Dict:
+    """Safe default decision: nothing enforced"""
+    return {
+        "remove_user": False,
+        "deduct_wallet": False,
+        "amount_to_deduct": 0,
+        "reason": reason
+    }
+
+
+def _flag(value) -> bool:
+    """LLM booleans: true / false, also as strings ("true", "false")"""
+    if isinstance(value, str):
+        return value.strip().lower() == "true"
+    return value is True
+
+
+def _deduct_amount(action) -> float:
+    """amount_to_deduct as a finite number >= 0; anything else counts as 0"""
+    if not isinstance(action, dict):
+        return 0.0
+    try:
+        amount = float(action.get("amount_to_deduct") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+    return amount if math.isfinite(amount) and amount > 0 else 0.0
+
+
+def parse_decision(raw: str) -> Dict:
+    """
+    Governance reply -> decision with the types onchain_node relies on.
+    Raises ValueError (with the reason) unless the reply is a JSON object
+    whose amount_to_deduct is a finite number >= 0.
+    """
+    try:
+        decision = json.loads(raw)
+    except json.JSONDecodeError:
+        raise ValueError("Invalid LLM response format")
+    if not isinstance(decision, dict):
+        raise ValueError("Invalid LLM response format")
+
+    amount = decision.get("amount_to_deduct", 0)
+    if isinstance(amount, bool):
+        raise ValueError("Invalid amount_to_deduct")
+    try:
+        amount = float(amount or 0)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid amount_to_deduct")
+    if not math.isfinite(amount) or amount < 0:
+        raise ValueError("Invalid amount_to_deduct")
+
+    return {
+        "remove_user": _flag(decision.get("remove_user")),
+        "deduct_wallet": _flag(decision.get("deduct_wallet")),
+        "amount_to_deduct": amount,
+        "reason": str(decision.get("reason", ""))
+    }
+
+
+def _governance_decision(llm, settings: Optional[Dict], user_id: str, level_num: int, balance) -> Dict:
+    # Unusable replies are not cached, so the next run asks the model again
+    raw = invoke_llm("governance", llm, GOVERNANCE_PROMPT, {
+        "user_id": user_id,
+        "level": level_num,
+        "balance": balance
+    }, settings, validate=parse_decision)
 
-    state["last_updated"] = datetime.now()
-    return state
+    try:
+        return parse_decision(raw)
+    except ValueError as e:
+        return _no_action(str(e))
 
 
-def governance_node(state: GroupState) -> GroupState:
+def governance_node(state: GroupState) -> Dict:
+    settings = state.get("settings")
+    llm_governance = get_llm("governance", settings)
     if llm_governance is None:
-        state["governance_actions"] = {}
-        return state
+        return {"governance_actions": {}}
 
-    warning_levels = state.get("warning_levels", {})
+    warning_levels = _evaluated_levels(state)
     balances = state.get("balances", {})
     decisions = {}
 
+    flagged = []
     for user_id, level_str in warning_levels.items():
-        try:
-            level_num = {"LEVEL_3": 3, "LEVEL_2": 2, "LEVEL_1": 1}.get(level_str, 0)
-
-            if level_num < 3:
-                decisions[user_id] = {
-                    "remove_user": False,
-                    "deduct_wallet": False,
-                    "amount_to_deduct": 0,
-                    "reason": "No enforcement action required"
-                }
-                continue
-
-            prompt = ChatPromptTemplate.from_messages([
-                ("system", """Respond ONLY with valid JSON. No extra text.
-Format:
-{
-  "remove_user": true/false,
-  "deduct_wallet": true/false,
-  "amount_to_deduct": number,
-  "reason": "short reason"
-}"""),
-                ("human", f"""User: {user_id}
-Warning Level: {level_num}
-Balance: {balances.get(user_id, 0)}
+        level_num = {"LEVEL_3": 3, "LEVEL_2": 2, "LEVEL_1": 1}.get(level_str, 0)
+        if level_num < 3:
+            decisions[user_id] = _no_action("No enforcement action required")
+        else:
+            decisions[user_id] = None   # keeps warning_levels order in the merged result
+            flagged.append((user_id, level_num))
+
+    if flagged:
+        # One LLM call per flagged member, at most `concurrency` in flight. The
+        # client enforces the per-call timeout; the deadline below is a backstop
+        # for calls that hang anyway (their worker is abandoned, not joined).
+        config = llm_config("governance", settings)
+        concurrency = max(1, int(config.get("concurrency", 1)))
+        timeout = float(config.get("timeout") or 30)
+        waves = -(-len(flagged) // concurrency)
+
+        pool = ThreadPoolExecutor(max_workers=min(concurrency, len(flagged)), thread_name_prefix="governance")
+        futures = {
+            user_id: pool.submit(
+                _governance_decision, llm_governance, settings, user_id, level_num, balances.get(user_id, 0)
+            )
+            for user_id, level_num in flagged
+        }
+        deadline = time.monotonic() + timeout * waves
+        for user_id, _ in flagged:
+            try:
+                decisions[user_id] = futures[user_id].result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                logger.error(f"Governance timed out for {user_id}")
+                decisions[user_id] = _no_action(f"Error: no decision within {timeout:g}s")
+            except Exception as e:
+                logger.error(f"Governance failed for {user_id}: {e}")
+                decisions[user_id] = _no_action(f"Error: {str(e)}")
+        pool.shutdown(wait=False, cancel_futures=True)
 
-Rules:
-- Level >= 3 → recommend removal
-- Negative balance → consider deduction
-- amount_to_deduct > 0 or 0""")
-            ])
+    return {"governance_actions": decisions, "last_updated": datetime.now()}
 
-            chain = prompt | llm_governance
-            raw = chain.invoke({}).content.strip()
 
-            try:
-                parsed = json.loads(raw)
-                decisions[user_id] = parsed
-            except json.JSONDecodeError:
-                decisions[user_id] = {
-                    "remove_user": False,
-                    "deduct_wallet": False,
-                    "amount_to_deduct": 0,
-                    "reason": "Invalid LLM response format"
-                }
-
-        except Exception as e:
-            logger.error(f"Governance failed for {user_id}: {e}")
-            decisions[user_id] = {
-                "remove_user": False,
-                "deduct_wallet": False,
-                "amount_to_deduct": 0,
-                "reason": f"Error: {str(e)}"
-            }
-
-    state["governance_actions"] = decisions
-    state["last_updated"] = datetime.now()
-    return state
+# ────────────────────────────────────────────────
+# Routing
+# ────────────────────────────────────────────────
+
+def needs_governance(state: GroupState) -> bool:
+    """Only LEVEL_3 members get an LLM enforcement decision"""
+    return any(level == "LEVEL_3" for level in _evaluated_levels(state).values())
+
+
+def needs_explanation(state: GroupState) -> bool:
+    """
+    settings["explain"]: True / False forces the report on / off. Unset
+    (auto): the template report is always written (it costs microseconds);
+    a rich (LLM) report only when something noteworthy happened this run:
+    a warning issued or a member excluded.
+    """
+    settings = state.get("settings", {})
+    explain = settings.get("explain")
+    if explain is not None:
+        return bool(explain)
+    if settings.get("explanation_mode", "template") != "rich":
+        return True
+    return bool(state.get("excluded_members")) or any(
+        level != "NONE" for level in _evaluated_levels(state).values()
+    )
+
+
+def needs_onchain(state: GroupState) -> bool:
+    """A governance decision that moves funds or removes a member"""
+    return any(
+        isinstance(action, dict) and (
+            _flag(action.get("remove_user")) or (_flag(action.get("deduct_wallet")) and _deduct_amount(action) > 0)
+        )
+        for action in (state.get("governance_actions") or {}).values()
+    )
+
+
+def route_after_warnings(state: GroupState):
+    """Fan out to the LLM nodes that have work; a quiet group ends here (deterministic fast path)"""
+    targets = []
+    if needs_explanation(state):
+        targets.append("explanation")
+    if needs_governance(state):
+        targets.append("governance")
+    return targets or END
 
 
 # ────────────────────────────────────────────────
 # Graph Builder
 # ────────────────────────────────────────────────
 
-def build_graph():
-    workflow = StateGraph(GroupState)
-
+def _add_deterministic_stages(workflow: StateGraph) -> None:
     workflow.add_node("compute_balances", compute_balances)
     workflow.add_node("tex", tex_node)
     workflow.add_node("risk", risk_node)
     workflow.add_node("warnings", warning_node)
-    workflow.add_node("explanation", explanation_node)
-    workflow.add_node("governance", governance_node)
-    workflow.add_node("onchain", onchain_node)
 
-    # Flow
     workflow.add_edge(START, "compute_balances")
     workflow.add_edge("compute_balances", "tex")
     workflow.add_edge("tex", "risk")
     workflow.add_edge("risk", "warnings")
 
-    # After warnings → parallel explanation + governance
-    workflow.add_edge("warnings", "explanation")
-    workflow.add_edge("warnings", "governance")
 
-    # Both converge to onchain
-    workflow.add_edge("explanation", "onchain")
-    workflow.add_edge("governance", "onchain")
-    workflow.add_edge("onchain", END)
+def _build_full(onchain: bool = True):
+    workflow = StateGraph(GroupState)
+    _add_deterministic_stages(workflow)
+
+    workflow.add_node("explanation", explanation_node)
+    workflow.add_node("governance", governance_node)
+
+    # After warnings → explanation and / or governance, in parallel, only when needed
+    workflow.add_conditional_edges("warnings", route_after_warnings, ["explanation", "governance", END])
+    workflow.add_edge("explanation", END)
+
+    if onchain:
+        # Enforcement decisions that touch funds / membership go on-chain
+        workflow.add_node("onchain", onchain_node)
+        workflow.add_conditional_edges(
+            "governance", lambda state: "onchain" if needs_onchain(state) else END, ["onchain", END]
+        )
+        workflow.add_edge("onchain", END)
+    else:
+        workflow.add_edge("governance", END)
+
+    return workflow.compile()
+
+
+def _build_deterministic():
+    workflow = StateGraph(GroupState)
+    _add_deterministic_stages(workflow)
+    workflow.add_edge("warnings", END)
+    return workflow.compile()
+
+
+# Graph variants by name -> builder. Compiled graphs are immutable and
+# safe to invoke concurrently, so each variant is compiled once per process.
+GRAPH_VARIANTS: Dict[str, Callable] = {
+    "full": _build_full,                                  # LLM explanation + governance + on-chain
+    "offchain": lambda: _build_full(onchain=False),       # LLM nodes, no on-chain execution
+    "deterministic": _build_deterministic,                # balances -> TEX -> risk -> warnings only
+}
+
+_compiled_graphs: Dict[str, object] = {}
+_compile_lock = threading.Lock()
+
+
+def register_graph(name: str, builder: Callable) -> None:
+    """Add (or replace) a named graph variant; it is compiled on first use"""
+    with _compile_lock:
+        GRAPH_VARIANTS[name] = builder
+        _compiled_graphs.pop(name, None)
 
-    return workflow.compile()
\ No newline at end of file
+
+def get_graph(name: str = "full"):
+    """Process-wide compiled graph for a variant, built lazily on first use"""
+    graph = _compiled_graphs.get(name)
+    if graph is not None:
+        return graph
+
+    if name not in GRAPH_VARIANTS:
+        raise KeyError(f"Unknown graph variant: {name}")
+
+    with _compile_lock:
+        if name not in _compiled_graphs:
+            _compiled_graphs[name] = GRAPH_VARIANTS[name]()
+            logger.info(f"Compiled settlement graph '{name}'")
+        return _compiled_graphs[name]
+
+
+def build_graph():
+    """A freshly compiled full graph (prefer get_graph, which reuses one)"""
+    return _build_full()
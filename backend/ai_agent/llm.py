@@ -0,0 +1,185 @@
+# ai_agent/llm.py
+
+from typing import Callable, Dict, Optional, Tuple
+import logging
+import os
+import threading
+import time
+
+from ai_agent.llm_cache import llm_cache, prompt_key
+
+logger = logging.getLogger(__name__)
+
+
+def _gemini(model: str, temperature: float, timeout: Optional[float] = None):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=model, temperature=temperature, timeout=timeout)
+
+
+def _groq(model: str, temperature: float, timeout: Optional[float] = None):
+    from langchain_groq import ChatGroq
+    return ChatGroq(model=model, temperature=temperature, timeout=timeout)
+
+
+# Provider name -> factory(model, temperature, timeout). SDKs are imported by
+# the factory, so nothing is loaded until a node actually needs that provider.
+LLM_PROVIDERS: Dict[str, Callable] = {
+    "gemini": _gemini,
+    "groq": _groq,
+}
+
+# Default client per graph node (timeout: seconds per call; concurrency: calls
+# a node may have in flight). Override per node with LLM_<NODE>_<KEY>
+# (e.g. LLM_GOVERNANCE_CONCURRENCY), or per run with
+# settings["llm"][node] = {"provider": ..., "model": ..., ...}.
+LLM_NODES: Dict[str, Dict] = {
+    "explanation": {"provider": "gemini", "model": "gemini-1.5-flash", "temperature": 0.6, "timeout": 30},
+    "governance": {
+        "provider": "groq", "model": "llama3-8b-8192", "temperature": 0.7, "timeout": 20, "concurrency": 8
+    },
+}
+LLM_CONFIG_KEYS = ("provider", "model", "temperature", "timeout", "concurrency")
+
+# A client that failed to build is not retried for this long, so a missing
+# key does not cost a factory call per request but recovers once it is set
+LLM_RETRY_SECONDS = float(os.getenv("LLM_RETRY_SECONDS", "30"))
+
+_clients: Dict[Tuple[str, str, float, Optional[float]], object] = {}
+_failed_until: Dict[Tuple[str, str, float, Optional[float]], float] = {}
+_clients_lock = threading.Lock()
+_env_loaded = False
+
+
+def _load_env() -> None:
+    """Read .env once, the first time a client is built"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def register_llm_provider(name: str, factory: Callable) -> None:
+    """Add (or replace) a provider; factory(model, temperature, timeout) returns a chat model"""
+    with _clients_lock:
+        LLM_PROVIDERS[name] = factory
+        for key in [key for key in _clients if key[0] == name]:
+            del _clients[key]
+        for key in [key for key in _failed_until if key[0] == name]:
+            del _failed_until[key]
+
+
+def llm_config(node: str, settings: Optional[Dict] = None) -> Dict:
+    """Provider / model / temperature / limits for a node: defaults < environment < run settings"""
+    config = dict(LLM_NODES.get(node, {}))
+    prefix = f"LLM_{node.upper()}_"
+    for key in LLM_CONFIG_KEYS:
+        value = os.getenv(prefix + key.upper())
+        if value:
+            config[key] = value
+    config.update(((settings or {}).get("llm") or {}).get(node) or {})
+    config["temperature"] = float(config.get("temperature", 0.0))
+    if config.get("timeout") is not None:
+        config["timeout"] = float(config["timeout"])
+    if config.get("concurrency") is not None:
+        config["concurrency"] = int(config["concurrency"])
+    return config
+
+
+def get_llm(node: str, settings: Optional[Dict] = None):
+    """
+    Chat model for a graph node, or None when it cannot be built (missing
+    SDK, API key, unknown provider). Clients are built on first use and
+    kept for the life of the process, so their HTTP connections are reused.
+    A failed build is retried after LLM_RETRY_SECONDS, not on every request.
+    """
+
+    config = llm_config(node, settings)
+    provider = config.get("provider")
+    if not provider:
+        return None
+    key = (provider, config.get("model", ""), config["temperature"], config.get("timeout"))
+    if key in _clients:
+        return _clients[key]
+    if _failed_until.get(key, 0) > time.monotonic():
+        return None
+
+    with _clients_lock:
+        if key in _clients:
+            return _clients[key]
+        if _failed_until.get(key, 0) > time.monotonic():
+            return None
+
+        client = None
+        factory = LLM_PROVIDERS.get(provider)
+        if factory is None:
+            logger.error(f"Unknown LLM provider '{provider}' for {node} node")
+        else:
+            _load_env()
+            try:
+                client = factory(key[1], key[2], timeout=key[3])
+                logger.info(f"Initialized {provider} ({key[1]}) for {node} node")
+            except Exception as e:
+                logger.warning(f"{provider} init failed for {node} node: {e}")
+
+        if client is None:
+            _failed_until[key] = time.monotonic() + LLM_RETRY_SECONDS
+        else:
+            _clients[key] = client
+            _failed_until.pop(key, None)
+        return client
+
+
+def invoke_llm(
+    node: str,
+    llm,
+    prompt,
+    inputs: Dict,
+    settings: Optional[Dict] = None,
+    on_token: Optional[Callable[[str], None]] = None,
+    validate: Optional[Callable[[str], object]] = None
+) -> str:
+    """
+    Response text of `llm` for the formatted prompt. Identical calls (same
+    normalized messages, provider, model, temperature) are answered from the
+    shared response cache; only successful responses are stored, and with
+    `validate` only those it accepts (it raises on a reply the caller cannot
+    use, so a retry asks the model again). With on_token the response is
+    streamed and each chunk passed on as it arrives (a cache hit arrives as
+    one chunk).
+    """
+
+    messages = prompt.format_messages(**inputs)
+    config = llm_config(node, settings)
+    key = prompt_key(messages, config.get("provider", ""), config.get("model", ""), config["temperature"])
+
+    cached = llm_cache.get(key)
+    if cached is not None:
+        if on_token:
+            on_token(cached)
+        return cached
+
+    if on_token:
+        chunks = []
+        for chunk in llm.stream(messages):
+            if chunk.content:
+                chunks.append(chunk.content)
+                on_token(chunk.content)
+        text = "".join(chunks).strip()
+    else:
+        text = llm.invoke(messages).content.strip()
+
+    if validate is not None:
+        try:
+            validate(text)
+        except Exception as e:
+            logger.warning(f"{node} LLM reply not cached: {e}")
+            return text
+    llm_cache.set(key, text)
+    return text
+
+
+def clear_llm_clients() -> None:
+    """Drop cached clients (e.g. after rotating API keys)"""
+    with _clients_lock:
+        _clients.clear()
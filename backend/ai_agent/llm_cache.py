@@ -0,0 +1,134 @@
+# ai_agent/llm_cache.py
+
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", 1024))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 3600))   # seconds; 0 disables caching
+REDIS_PREFIX = "llm:response:"
+
+_WHITESPACE = re.compile(r"[ \t]+")
+
+
+def prompt_key(messages: Iterable, provider: str, model: str, temperature: float) -> str:
+    """
+    Content address of one LLM call: sha256 over the normalized messages
+    (role + text, runs of blanks collapsed, lines stripped) plus the
+    provider, model and temperature that would answer it.
+    """
+
+    normalized = [
+        (message.type, "\n".join(_WHITESPACE.sub(" ", line).strip() for line in str(message.content).splitlines()))
+        for message in messages
+    ]
+    payload = json.dumps([provider, model, round(float(temperature), 4), normalized], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    TTL + LRU cache of LLM response texts, in process memory and optionally
+    in Redis (shared across workers, expiry via SET EX). A Redis hit is copied
+    into memory. Redis errors are logged and treated as misses.
+    """
+
+    def __init__(self, max_entries: int = LLM_CACHE_SIZE, ttl_seconds: int = LLM_CACHE_TTL, redis=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.redis = redis
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+        value = None
+        if self.redis is not None:
+            try:
+                value = self.redis.get(REDIS_PREFIX + key)
+            except Exception as e:
+                logger.warning(f"LLM cache Redis read failed: {e}")
+        if value is not None:
+            if isinstance(value, bytes):
+                value = value.decode("utf-8")
+            self._remember(key, value)
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.redis_hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        if not self.enabled:
+            return
+        self._remember(key, value)
+        if self.redis is not None:
+            try:
+                self.redis.set(REDIS_PREFIX + key, value, ex=self.ttl_seconds)
+            except Exception as e:
+                logger.warning(f"LLM cache Redis write failed: {e}")
+
+    def _remember(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.redis_hits = self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "entries": len(self._entries)
+            }
+
+
+# Process-wide cache used by the graph nodes (see llm.invoke_llm)
+llm_cache = LLMResponseCache()
+
+
+def configure_llm_cache(redis=None, max_entries: Optional[int] = None, ttl_seconds: Optional[int] = None) -> LLMResponseCache:
+    """Attach a Redis client (e.g. src.config.db.get_redis()) and / or resize the shared cache"""
+    llm_cache.redis = redis
+    if max_entries is not None:
+        llm_cache.max_entries = max_entries
+    if ttl_seconds is not None:
+        llm_cache.ttl_seconds = ttl_seconds
+    return llm_cache
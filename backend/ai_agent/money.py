@@ -0,0 +1,156 @@
+from dataclasses import dataclass
+from decimal import Decimal, ROUND_HALF_EVEN
+from typing import Dict, List, Optional, Sequence
+import zlib
+
+# Minor units per currency (10^exponent minor units = 1 major unit)
+MINOR_UNIT_EXPONENTS = {
+    "USD": 2,
+    "EUR": 2,
+    "INR": 2,
+    "GBP": 2,
+    "JPY": 0,
+    "ALGO": 6,      # microAlgos
+    "USDC": 6,
+}
+DEFAULT_CURRENCY = "USD"
+DEFAULT_EXPONENT = 2
+
+
+def minor_exponent(currency: Optional[str]) -> int:
+    return MINOR_UNIT_EXPONENTS.get((currency or DEFAULT_CURRENCY).upper(), DEFAULT_EXPONENT)
+
+
+def to_minor(amount, currency: Optional[str] = None) -> int:
+    """
+    Convert a major-unit amount (float / str / Decimal) to integer minor units.
+    Goes through str() so 0.1 becomes exactly 10 cents, not 9.999... cents.
+    """
+
+    exponent = minor_exponent(currency)
+    value = Decimal(str(amount)).scaleb(exponent)
+    return int(value.quantize(Decimal(1), rounding=ROUND_HALF_EVEN))
+
+
+def from_minor(minor: int, currency: Optional[str] = None) -> float:
+    """Integer minor units -> major-unit float (for display / JSON only)"""
+    return float(Decimal(minor).scaleb(-minor_exponent(currency)))
+
+
+def allocate_minor(total: int, weights: Sequence[int], seed: str = "") -> List[int]:
+    """
+    Split `total` minor units proportionally to integer `weights` so that the
+    parts always add back up to `total`.
+
+    Each part gets its floor share; the leftover units go one each to the
+    largest fractional remainders. Ties are broken by walking the parts
+    starting at a position derived from `seed` (e.g. the expense id), so the
+    extra cent does not always land on the same member but the result is
+    reproducible.
+    """
+
+    if not weights:
+        return []
+
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        raise ValueError("allocation weights must sum to a positive number")
+
+    sign = -1 if total < 0 else 1
+    total = abs(total)
+
+    parts = [total * w // weight_sum for w in weights]
+    leftover = total - sum(parts)
+
+    n = len(weights)
+    start = zlib.crc32(seed.encode()) % n if seed else 0
+    order = sorted(
+        range(n),
+        key=lambda i: (-(total * weights[i] % weight_sum), (i - start) % n)
+    )
+    for i in order[:leftover]:
+        parts[i] += 1
+
+    return [sign * p for p in parts]
+
+
+def split_equally(amount_minor: int, member_ids: Sequence[str], seed: str = "") -> Dict[str, int]:
+    """
+    Equal split of one expense. Shares are assigned over member ids in sorted
+    order so the result does not depend on the order members were loaded in.
+    """
+
+    ordered = sorted(member_ids)
+    return dict(zip(ordered, allocate_minor(amount_minor, [1] * len(ordered), seed)))
+
+
+def expense_shares(expense: dict, member_ids: Sequence[str]) -> Dict[str, int]:
+    """
+    Per-participant shares (minor units) of one expense. Scalar reference
+    for the vectorized tex_array.compute_balances_array.
+
+    expense["split_type"]:
+        "equal"    - equal split over expense["involved_members"] (default: all members)
+        "weighted" - proportional to integer weights in expense["split_shares"]
+        "exact"    - expense["split_shares"] holds each share in minor units;
+                     any difference from the amount stays with the payer
+
+    Participants who are not members are ignored; shares are allocated over
+    participant ids in sorted order.
+    """
+
+    amount_minor = expense["amount_minor"]
+    split_type = expense.get("split_type") or "equal"
+    members = set(member_ids)
+
+    if split_type == "exact":
+        shares = {uid: int(v) for uid, v in (expense.get("split_shares") or {}).items() if uid in members}
+        residual = amount_minor - sum(shares.values())
+        if residual and expense.get("paid_by") in members:
+            shares[expense["paid_by"]] = shares.get(expense["paid_by"], 0) + residual
+        return shares
+
+    if split_type == "weighted":
+        weights = {uid: int(w) for uid, w in (expense.get("split_shares") or {}).items() if uid in members and int(w) > 0}
+    else:
+        weights = {uid: 1 for uid in (expense.get("involved_members") or []) if uid in members}
+    if not weights:
+        weights = {uid: 1 for uid in member_ids}
+
+    ordered = sorted(weights)
+    parts = allocate_minor(amount_minor, [weights[uid] for uid in ordered], seed=expense.get("expense_id", ""))
+    return dict(zip(ordered, parts))
+
+
+@dataclass(frozen=True)
+class Money:
+    """Fixed-point amount: integer minor units plus currency code"""
+
+    minor: int
+    currency: str = DEFAULT_CURRENCY
+
+    @classmethod
+    def of(cls, amount, currency: str = DEFAULT_CURRENCY) -> "Money":
+        return cls(to_minor(amount, currency), currency.upper())
+
+    @property
+    def amount(self) -> float:
+        return from_minor(self.minor, self.currency)
+
+    def allocate(self, weights: Sequence[int], seed: str = "") -> List["Money"]:
+        return [Money(p, self.currency) for p in allocate_minor(self.minor, weights, seed)]
+
+    def _check(self, other: "Money") -> None:
+        if other.currency != self.currency:
+            raise ValueError(f"Currency mismatch: {self.currency} vs {other.currency}")
+
+    def __add__(self, other: "Money") -> "Money":
+        self._check(other)
+        return Money(self.minor + other.minor, self.currency)
+
+    def __sub__(self, other: "Money") -> "Money":
+        self._check(other)
+        return Money(self.minor - other.minor, self.currency)
+
+    def __neg__(self) -> "Money":
+        return Money(-self.minor, self.currency)
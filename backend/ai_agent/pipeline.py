@@ -0,0 +1,188 @@
+# ai_agent/pipeline.py
+#
+# Deterministic settlement stages (balances -> TEX -> risk -> warnings).
+# No LLM or network dependencies, so these can run in worker processes
+# (see src/services/batch_settlement.py) as well as inside the LangGraph.
+
+from datetime import datetime
+from typing import Dict
+import logging
+
+from ai_agent.state import GroupState
+from ai_agent.tex import tex_optimize, tex_optimize_min_transfers
+from ai_agent.tex_array import LARGE_GROUP_THRESHOLD, compute_balances_array, tex_optimize_array
+from ai_agent.tex_fees import tex_optimize_min_fee
+from ai_agent.money import DEFAULT_CURRENCY, from_minor
+from ai_agent.fx import FxRateTable
+from ai_agent.risk import calculate_risk_scores_from_features
+from ai_agent.warnings import evaluate_warning_changes, evaluate_warnings
+
+logger = logging.getLogger(__name__)
+
+# settings["settlement_mode"]: greedy (default, array kernel for large
+# groups), min_transfers (exact), min_fee (pair_fees aware)
+SETTLEMENT_MODES = ("greedy", "min_transfers", "min_fee")
+
+# settings["fx_mode"]: per_currency (default, one plan per currency) or
+# convert (one plan in the settlement currency when rates are loaded)
+FX_MODES = ("per_currency", "convert")
+
+
+def compute_balances(state: GroupState) -> GroupState:
+    settle_currency = state.get("currency_default") or DEFAULT_CURRENCY
+    members = state["members"]
+
+    if state.get("expenses") or not state.get("balances_by_currency"):
+        # Net each currency separately (minor units, per-expense splits,
+        # remainders allocated so every bucket nets to exactly zero)
+        expenses_by_currency: Dict[str, list] = {}
+        for expense in state.get("expenses", []):
+            currency = (expense.get("currency") or settle_currency).upper()
+            expenses_by_currency.setdefault(currency, []).append(expense)
+
+        by_currency = {
+            currency: compute_balances_array(members, expenses, currency)
+            for currency, expenses in expenses_by_currency.items()
+        }
+    else:
+        # Aggregates supplied up front (materialized member balances)
+        by_currency = state["balances_by_currency"]
+
+    # `balances` is the group's position in the settlement currency: every
+    # bucket converted when an FX table is supplied, else that bucket only.
+    # Buckets with no rate are listed so tex_node settles them on their own.
+    fx = FxRateTable.from_dict(state.get("fx_rates"))
+    balances_minor: Dict[str, int] = {m["user_id"]: 0 for m in members}
+    unconverted = []
+    for currency, bucket in by_currency.items():
+        if currency == settle_currency:
+            converted = bucket
+        elif fx and fx.has(currency) and fx.has(settle_currency):
+            converted = fx.convert_balances(bucket, currency, settle_currency)
+        else:
+            if any(bucket.values()):
+                logger.warning(f"No FX rate {currency}->{settle_currency}; {currency} balances settled separately")
+                unconverted.append(currency)
+            continue
+        for uid, v in converted.items():
+            balances_minor[uid] = balances_minor.get(uid, 0) + v
+
+    state["balances_by_currency"] = by_currency
+    state["unconverted_currencies"] = sorted(unconverted)
+    state["balances_minor"] = balances_minor
+    state["balances"] = {uid: from_minor(v, settle_currency) for uid, v in balances_minor.items()}
+    state["last_updated"] = datetime.now()
+    return state
+
+
+def _settle(balances: Dict[str, float], currency: str, mode: str, settings: Dict) -> Dict:
+    if mode == "min_transfers":
+        return tex_optimize_min_transfers(balances, currency=currency)
+
+    if mode == "min_fee":
+        result = tex_optimize_min_fee(
+            balances,
+            pair_fees=settings.get("pair_fees"),
+            currency=currency
+        )
+        result["transfer_count"] = len(result["settlements"])
+        return result
+
+    if len(balances) >= LARGE_GROUP_THRESHOLD:
+        settlements = tex_optimize_array(balances, currency)
+    else:
+        settlements = tex_optimize(balances, currency=currency)
+    return {"settlements": settlements, "transfer_count": len(settlements)}
+
+
+def tex_node(state: GroupState) -> GroupState:
+    settings = state.get("settings", {})
+    mode = settings.get("settlement_mode", "greedy")
+    fx_mode = settings.get("fx_mode", "per_currency")
+    settle_currency = state.get("currency_default") or DEFAULT_CURRENCY
+
+    if fx_mode == "convert" and state.get("fx_rates"):
+        # One plan in the settlement currency across every convertible
+        # currency; a currency without a rate keeps its own plan, so its
+        # debts are never dropped
+        buckets = {settle_currency: state.get("balances", {})}
+        for currency in state.get("unconverted_currencies", []):
+            buckets[currency] = {
+                uid: from_minor(v, currency) for uid, v in state["balances_by_currency"][currency].items()
+            }
+    else:
+        buckets = {
+            currency: {uid: from_minor(v, currency) for uid, v in bucket.items()}
+            for currency, bucket in state.get("balances_by_currency", {}).items()
+        }
+
+    settlements = []
+    stats = {"mode": mode, "fx_mode": fx_mode, "transfer_count": 0, "by_currency": {}}
+    for currency, balances in buckets.items():
+        result = _settle(balances, currency, mode, settings)
+        settlements.extend(result["settlements"])
+        stats["transfer_count"] += result["transfer_count"]
+        stats["by_currency"][currency] = {
+            k: v for k, v in result.items() if k != "settlements"
+        }
+
+    state["pending_settlements"] = settlements
+    state["settlement_stats"] = stats
+    state["last_updated"] = datetime.now()
+    return state
+
+
+def risk_node(state: GroupState) -> GroupState:
+    # Per-member aggregates (payment / late / missed / warning counts) are
+    # loaded with the state; no raw history is scanned here
+    state["risk_scores"] = calculate_risk_scores_from_features(
+        balances=state.get("balances", {}),
+        features=state.get("risk_features", {})
+    )
+    state["last_updated"] = datetime.now()
+    return state
+
+
+def warning_node(state: GroupState) -> GroupState:
+    existing_counts = state.get("warning_counts", {})
+
+    if state.get("settings", {}).get("warning_mode") == "changes":
+        # Only members whose score crossed a band / moved past the delta
+        changes, updated_counts, enforcement_flags = evaluate_warning_changes(
+            risk_scores=state.get("risk_scores", {}),
+            previous_scores=state.get("previous_risk_scores", {}),
+            previous_levels=state.get("previous_warning_levels", {}),
+            existing_warning_counts=existing_counts,
+            balances=state.get("balances", {})
+        )
+        warning_levels = {
+            uid: state.get("previous_warning_levels", {}).get(uid, "NONE")
+            for uid in state.get("risk_scores", {})
+        }
+        warning_levels.update({uid: change["level"] for uid, change in changes.items()})
+        state["warning_changes"] = changes
+    else:
+        warning_levels, updated_counts, enforcement_flags = evaluate_warnings(
+            risk_scores=state.get("risk_scores", {}),
+            existing_warning_counts=existing_counts,
+            balances=state.get("balances", {})
+        )
+        state["warning_changes"] = None
+
+    state["warning_levels"] = warning_levels
+    state["warning_counts"] = updated_counts
+    state["excluded_members"] = [
+        uid for uid, enforce in enforcement_flags.items() if enforce
+    ]
+    state["last_updated"] = datetime.now()
+    return state
+
+
+DETERMINISTIC_STAGES = [compute_balances, tex_node, risk_node, warning_node]
+
+
+def run_deterministic_pipeline(state: GroupState) -> GroupState:
+    """Run every stage that needs no LLM / chain access, in graph order"""
+    for stage in DETERMINISTIC_STAGES:
+        state = stage(state)
+    return state
@@ -1,4 +1,6 @@
-from typing import Dict, List
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import numpy as np
 
 # Risk Calculation Configuration
 LATE_PAYMENT_WEIGHT = 0.4
@@ -8,6 +10,8 @@ MISSED_SETTLEMENT_WEIGHT = 0.1
 
 MAX_BALANCE_THRESHOLD = 10000  # for normalization
 
+RISK_HALF_LIFE_DAYS = 90  # decayed mode: an event counts half as much after this long
+
 
 # Core Risk Calculation Function
 def calculate_risk_scores(
@@ -69,3 +73,108 @@ def calculate_late_payment_factor(payments: List[dict]) -> float:
             late_count += 1
 
     return min(late_count / len(payments), 1)
+
+
+# Batch (columnar) scoring
+def calculate_risk_scores_from_features(
+    balances: Dict[str, float],
+    features: Dict[str, Dict[str, int]]
+) -> Dict[str, float]:
+    """
+    Risk scores from pre-aggregated per-user counters
+    (payment_count, late_count, missed_settlements, warning_count)
+    instead of raw history lists.
+    """
+
+    user_ids = list(balances)
+    empty = {}
+
+    def column(name):
+        return [features.get(uid, empty).get(name, 0) for uid in user_ids]
+
+    scores = score_risk_columns(
+        [balances[uid] for uid in user_ids],
+        column("late_count"),
+        column("payment_count"),
+        column("warning_count"),
+        column("missed_settlements")
+    )
+    return dict(zip(user_ids, scores.tolist()))
+
+
+def score_risk_columns(
+    balances: np.ndarray,
+    late_counts: np.ndarray,
+    payment_counts: np.ndarray,
+    warning_counts: np.ndarray,
+    missed_settlements: np.ndarray
+) -> np.ndarray:
+    """
+    Same formula as calculate_risk_scores, one vectorized pass over
+    aligned arrays (one entry per member, across any number of groups).
+    Balances are in major units; the late factor is late / total payments
+    (0 for members with no payments).
+    """
+
+    balances = np.asarray(balances, dtype=np.float64)
+    late_counts = np.asarray(late_counts, dtype=np.float64)
+    payment_counts = np.asarray(payment_counts, dtype=np.float64)
+
+    outstanding_factor = np.minimum(np.abs(balances) / MAX_BALANCE_THRESHOLD, 1)
+    late_factor = np.minimum(
+        np.divide(late_counts, payment_counts, out=np.zeros_like(late_counts), where=payment_counts > 0), 1
+    )
+    warning_factor = np.minimum(np.asarray(warning_counts, dtype=np.float64) / 5, 1)
+    missed_factor = np.minimum(np.asarray(missed_settlements, dtype=np.float64) / 5, 1)
+
+    risk = (
+        LATE_PAYMENT_WEIGHT * late_factor +
+        OUTSTANDING_BALANCE_WEIGHT * outstanding_factor +
+        WARNING_HISTORY_WEIGHT * warning_factor +
+        MISSED_SETTLEMENT_WEIGHT * missed_factor
+    )
+    return np.round(np.minimum(risk, 1), 3)
+
+
+# Time-decayed counters
+def decay_factor(elapsed_seconds: float, half_life_days: float = RISK_HALF_LIFE_DAYS) -> float:
+    return 0.5 ** (max(elapsed_seconds, 0) / (half_life_days * 86400))
+
+
+def decay_counters(
+    counters: Dict[str, float],
+    since: Optional[datetime],
+    now: datetime,
+    half_life_days: float = RISK_HALF_LIFE_DAYS
+) -> Dict[str, float]:
+    """Counters last updated at `since`, as they stand at `now`"""
+    if since is None:
+        return dict(counters)
+    factor = decay_factor((now - since).total_seconds(), half_life_days)
+    return {name: value * factor for name, value in counters.items()}
+
+
+def bump_decayed_counters(
+    counters: Dict[str, float],
+    since: Optional[datetime],
+    event_at: datetime,
+    increments: Dict[str, float],
+    half_life_days: float = RISK_HALF_LIFE_DAYS
+) -> Tuple[Dict[str, float], datetime]:
+    """
+    O(1) update for one event: decay the stored counters up to the event,
+    then add it. Events older than the counters are decayed instead, so
+    out-of-order events give the same result. Returns (counters, as_of).
+    """
+
+    if since is not None and event_at < since:
+        factor = decay_factor((since - event_at).total_seconds(), half_life_days)
+        updated = dict(counters)
+        for name, amount in increments.items():
+            updated[name] = updated.get(name, 0.0) + amount * factor
+        return updated, since
+
+    updated = decay_counters(counters, since, event_at, half_life_days)
+    for name, amount in increments.items():
+        updated[name] = updated.get(name, 0.0) + amount
+    return updated, event_at
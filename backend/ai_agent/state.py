@@ -7,6 +7,7 @@ import operator
 UserID = str
 WalletAddress = str
 Amount = float
+AmountMinor = int       # fixed-point: integer minor units (cents, microAlgos, ...)
 Currency = str          # e.g. "USD", "INR", "USDC", etc.
 ExpenseID = str
 
@@ -35,10 +36,13 @@ class Expense(TypedDict):
     created_by: UserID
     paid_by: UserID                         # who actually paid (may differ from creator)
     amount: Amount
+    amount_minor: AmountMinor               # authoritative value; `amount` is for display
     currency: Currency                      # important for multi-currency groups
     description: str
     timestamp: datetime
     involved_members: List[UserID]          # who participated in this expense
+    split_type: str                         # "equal" (default) / "weighted" / "exact"
+    split_shares: Dict[UserID, int]         # weighted: integer weights; exact: minor units
     splits: List[ExpenseSplit]              # detailed per-user breakdown
     receipt_url: Optional[str]              # IPFS / Arweave / cloud link
     status: str                             # "pending", "approved", "disputed", "settled"
@@ -49,6 +53,7 @@ class Settlement(TypedDict):
     from_user: UserID
     to_user: UserID
     amount: Amount
+    amount_minor: AmountMinor
     currency: Currency
     reason: str                             # e.g. "Expense #exp123 share", "Reimbursement"
     expense_ids: List[ExpenseID]            # which expenses this covers
@@ -72,16 +77,27 @@ class GroupState(TypedDict):
 
     # Current net balances (positive = owes group, negative = group owes)
     balances: Dict[UserID, Amount]
+    balances_minor: Dict[UserID, AmountMinor]   # same balances in minor units (nets to exactly 0)
+    balances_by_currency: Dict[Currency, Dict[UserID, AmountMinor]]   # per-currency netting
+    fx_rates: Optional[Dict]                # FX table snapshot {version, pivot, rates} for conversion mode
+    unconverted_currencies: List[Currency]  # buckets with no FX rate: settled per currency, not converted
 
     # Pending / recommended settlements (usually produced by min-cost flow / TEX algo)
     pending_settlements: List[Settlement]
+    settlement_stats: Dict[str, any]        # solver mode / transfer count vs greedy baseline
 
     # Already executed settlements (history)
     settlement_history: List[Settlement]
 
     # ── Risk, trust & moderation ────────────────────────────────────────
     trust_scores: Dict[UserID, float]       # can be different view from member.trust_score
+    risk_scores: Dict[UserID, float]        # 0..1, produced by the risk stage
+    warning_counts: Dict[UserID, int]       # strikes carried across runs (3rd strike enforces)
+    risk_features: Dict[UserID, Dict[str, int]]   # payment_count / late_count / missed_settlements / warning_count
     warning_levels: Dict[UserID, str]       # "NONE", "LEVEL_1", "LEVEL_2", "LEVEL_3", "BANNED"
+    previous_risk_scores: Dict[UserID, float]   # last persisted score / level, for change-driven warnings
+    previous_warning_levels: Dict[UserID, str]
+    warning_changes: Optional[Dict[UserID, dict]]   # members re-evaluated this run (None = everyone)
     flagged_expenses: List[ExpenseID]       # disputed or suspicious
 
     # ── Governance & state machine ──────────────────────────────────────
@@ -89,6 +105,8 @@ class GroupState(TypedDict):
     voting_threshold: float                 # e.g. 0.6 for majority
     last_major_action: Optional[str]        # "expense_added", "settlement_executed", etc.
     last_updated: datetime
+    governance_actions: Dict[UserID, dict]  # per-user enforcement decision (remove / deduct)
+    onchain_results: Dict[str, any]         # executed on-chain actions per user
 
     # ── Explainability & debugging (very useful for agents) ─────────────
     explanation: Optional[str]              # last agent's reasoning summary
@@ -1,26 +1,167 @@
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
+import time
 
+from ai_agent.money import DEFAULT_CURRENCY, from_minor, to_minor
 
-def tex_optimize(balances: Dict[str, float]) -> List[Dict]:
+# Min-transfer solver configuration
+EXACT_SOLVER_LIMIT = 14        # max non-zero members searched exhaustively (2^n states)
+HEURISTIC_TIME_BUDGET = 0.25   # seconds spent hunting zero-sum sub-groups in large groups
+
+
+def tex_optimize(
+    balances: Dict[str, float],
+    mode: str = "greedy",
+    currency: str = DEFAULT_CURRENCY
+) -> List[Dict]:
     """
     TEX Settlement Algorithm
     Input:
         balances: user_id -> net balance
                   +ve means user should receive
                   -ve means user owes
+        mode: "greedy" (single pass) or "min_transfers" (zero-sum sub-group search)
 
     Output:
         List of optimized transactions
-        [{from, to, amount}]
+        [{from, to, amount, amount_minor, currency}]
+
+    Matching is done in integer minor units, so every transfer fully clears
+    a debtor or a creditor and no 0.00 dust transfers are produced.
     """
 
+    if mode == "min_transfers":
+        return tex_optimize_min_transfers(balances, currency=currency)["settlements"]
+
+    return _greedy_settle(_to_minor_items(balances, currency), currency)
+
+
+def tex_optimize_min_transfers(
+    balances: Dict[str, float],
+    exact_limit: int = EXACT_SOLVER_LIMIT,
+    time_budget: float = HEURISTIC_TIME_BUDGET,
+    currency: str = DEFAULT_CURRENCY
+) -> Dict:
+    """
+    Minimum-transfer settlement.
+
+    Every zero-sum sub-group of k members can be settled internally with
+    k - 1 transfers, so the fewest transfers for n members is n minus the
+    largest number of disjoint zero-sum sub-groups. Small groups are searched
+    exactly; large groups peel off zero-sum pairs/triples within a time
+    budget and fall back to the exact search once the remainder is small.
+
+    Output:
+        {
+            "settlements": [{from, to, amount, amount_minor, currency}],
+            "transfer_count": int,
+            "baseline_transfer_count": int,   # greedy tex_optimize on the same input
+            "method": "exact" / "heuristic"
+        }
+    """
+
+    entries = [(uid, minor) for uid, minor in _to_minor_items(balances, currency) if minor != 0]
+    baseline = _greedy_settle(entries, currency)
+
+    if len(entries) <= exact_limit:
+        groups = _exact_zero_sum_groups(entries)
+        method = "exact"
+    else:
+        groups = _heuristic_zero_sum_groups(entries, exact_limit, time_budget)
+        method = "heuristic"
+
+    settlements = []
+    for group in groups:
+        settlements.extend(_greedy_settle(group, currency))
+
+    # Never hand back a plan that is worse than the single greedy pass
+    if len(settlements) > len(baseline):
+        settlements = baseline
+
+    return {
+        "settlements": settlements,
+        "transfer_count": len(settlements),
+        "baseline_transfer_count": len(baseline),
+        "method": method
+    }
+
+
+def tex_update_plan(
+    balances_minor: Dict[str, int],
+    transfers: List[Dict],
+    deltas: Dict[str, int],
+    currency: str = DEFAULT_CURRENCY
+) -> Tuple[Dict[str, int], List[Dict]]:
+    """
+    Incrementally maintain a settlement plan.
+
+    Input:
+        balances_minor: current plan balances (minor units)
+        transfers: current plan transfers [{from, to, amount_minor, ...}]
+        deltas: user_id -> balance change from one new expense (sums to 0)
+
+    Output:
+        (new balances_minor, new transfers)
+
+    The deltas are settled among the changed members only and netted into
+    the existing transfers (same pair adds up, opposite pair cancels), so
+    untouched transfers are reused as-is. If netting leaves more transfers
+    than a fresh greedy pass could need (non-zero members - 1), the plan is
+    rebuilt from the maintained balances instead.
+    """
+
+    new_balances = dict(balances_minor)
+    for user_id, delta in deltas.items():
+        new_balances[user_id] = new_balances.get(user_id, 0) + delta
+
+    edges: Dict[Tuple[str, str], int] = {}
+    for t in transfers:
+        key = (t["from"], t["to"])
+        edges[key] = edges.get(key, 0) + t["amount_minor"]
+
+    for t in _greedy_settle(list(deltas.items()), currency):
+        forward = (t["from"], t["to"])
+        reverse = (t["to"], t["from"])
+        amount = t["amount_minor"]
+
+        if edges.get(reverse, 0) > 0:
+            cancelled = min(edges[reverse], amount)
+            edges[reverse] -= cancelled
+            amount -= cancelled
+        if amount > 0:
+            edges[forward] = edges.get(forward, 0) + amount
+
+    new_transfers = [
+        {
+            "from": debtor,
+            "to": creditor,
+            "amount": from_minor(amount, currency),
+            "amount_minor": amount,
+            "currency": currency
+        }
+        for (debtor, creditor), amount in edges.items()
+        if amount > 0
+    ]
+
+    nonzero = sum(1 for v in new_balances.values() if v != 0)
+    if len(new_transfers) > max(nonzero - 1, 0):
+        new_transfers = _greedy_settle(list(new_balances.items()), currency)
+
+    return new_balances, new_transfers
+
+
+def _to_minor_items(balances: Dict[str, float], currency: str) -> List[Tuple[str, int]]:
+    return [(user_id, to_minor(balance, currency)) for user_id, balance in balances.items()]
+
+
+# Helper: Greedy two-pointer pass (original TEX behaviour) over integer minor units
+def _greedy_settle(balance_items: List[Tuple[str, int]], currency: str = DEFAULT_CURRENCY) -> List[Dict]:
     settlements = []
 
     # Separate creditors and debtors
     creditors = []
     debtors = []
 
-    for user_id, balance in balances.items():
+    for user_id, balance in balance_items:
         if balance > 0:
             creditors.append([user_id, balance])
         elif balance < 0:
@@ -38,7 +179,9 @@ def tex_optimize(balances: Dict[str, float]) -> List[Dict]:
         settlements.append({
             "from": debtor_id,
             "to": creditor_id,
-            "amount": round(settle_amount, 2)
+            "amount": from_minor(settle_amount, currency),
+            "amount_minor": settle_amount,
+            "currency": currency
         })
 
         # Update remaining amounts
@@ -52,3 +195,143 @@ def tex_optimize(balances: Dict[str, float]) -> List[Dict]:
             j += 1
 
     return settlements
+
+
+# Helper: Exact search (bitmask DP over subsets)
+def _exact_zero_sum_groups(entries: List[Tuple[str, int]]) -> List[List[Tuple[str, int]]]:
+    """
+    best[mask] = most zero-sum groups that a member ordering of `mask` can
+    be cut into. Members are appended one at a time; a group closes whenever
+    the running subset sum returns to zero.
+    """
+
+    n = len(entries)
+    if n == 0:
+        return []
+
+    full = (1 << n) - 1
+    subset_sum = [0] * (full + 1)
+    best = [0] * (full + 1)
+    last = [0] * (full + 1)   # member index appended last on the best path
+
+    for mask in range(1, full + 1):
+        low_bit = mask & -mask
+        idx = low_bit.bit_length() - 1
+        subset_sum[mask] = subset_sum[mask ^ low_bit] + entries[idx][1]
+
+        closes = 1 if subset_sum[mask] == 0 else 0
+        best_value = -1
+        rest = mask
+        while rest:
+            bit = rest & -rest
+            rest ^= bit
+            value = best[mask ^ bit]
+            if value > best_value:
+                best_value = value
+                last[mask] = bit.bit_length() - 1
+        best[mask] = best_value + closes
+
+    # Walk back the ordering, cutting a group wherever the prefix sums to zero
+    order = []
+    mask = full
+    while mask:
+        idx = last[mask]
+        order.append(idx)
+        mask ^= 1 << idx
+    order.reverse()
+
+    groups = []
+    current = []
+    running = 0
+    for idx in order:
+        current.append(entries[idx])
+        running += entries[idx][1]
+        if running == 0:
+            groups.append(current)
+            current = []
+    if current:
+        groups.append(current)
+
+    return groups
+
+
+# Helper: Time-budgeted heuristic for large groups
+def _heuristic_zero_sum_groups(
+    entries: List[Tuple[str, int]],
+    exact_limit: int,
+    time_budget: float
+) -> List[List[Tuple[str, int]]]:
+    deadline = time.monotonic() + time_budget
+    groups = []
+    remaining = list(entries)
+
+    # Zero-sum pairs: a debtor who owes exactly what a creditor is owed
+    remaining, pairs = _peel_pairs(remaining)
+    groups.extend(pairs)
+
+    # Zero-sum triples, until the budget runs out
+    remaining, triples = _peel_triples(remaining, deadline)
+    groups.extend(triples)
+
+    if len(remaining) <= exact_limit:
+        groups.extend(_exact_zero_sum_groups(remaining))
+    elif remaining:
+        # Largest-first greedy keeps big balances from fragmenting
+        remaining.sort(key=lambda entry: -abs(entry[1]))
+        groups.append(remaining)
+
+    return groups
+
+
+def _peel_pairs(entries: List[Tuple[str, int]]) -> Tuple[List, List]:
+    waiting: Dict[int, List[Tuple[str, int]]] = {}
+    pairs = []
+
+    for entry in entries:
+        partners = waiting.get(-entry[1])
+        if partners:
+            pairs.append([partners.pop(), entry])
+        else:
+            waiting.setdefault(entry[1], []).append(entry)
+
+    remaining = [entry for bucket in waiting.values() for entry in bucket]
+    return remaining, pairs
+
+
+def _peel_triples(entries: List[Tuple[str, int]], deadline: float) -> Tuple[List, List]:
+    by_amount: Dict[int, List[int]] = {}
+    for idx, (_, minor) in enumerate(entries):
+        by_amount.setdefault(minor, []).append(idx)
+
+    used = [False] * len(entries)
+    triples = []
+
+    for i in range(len(entries)):
+        if time.monotonic() > deadline:
+            break
+        if used[i]:
+            continue
+        for j in range(i + 1, len(entries)):
+            if used[i]:
+                break
+            if used[j]:
+                continue
+            k = _find_unused(by_amount, -(entries[i][1] + entries[j][1]), used, (i, j))
+            if k is not None:
+                used[i] = used[j] = used[k] = True
+                triples.append([entries[i], entries[j], entries[k]])
+
+    remaining = [entry for idx, entry in enumerate(entries) if not used[idx]]
+    return remaining, triples
+
+
+def _find_unused(
+    by_amount: Dict[int, List[int]],
+    minor: int,
+    used: List[bool],
+    exclude: Tuple[int, int]
+) -> Optional[int]:
+    for idx in by_amount.get(minor, []):
+        if not used[idx] and idx not in exclude:
+            return idx
+    return None
@@ -0,0 +1,271 @@
+from typing import Dict, List, Tuple
+import zlib
+import numpy as np
+
+from ai_agent.money import DEFAULT_CURRENCY, minor_exponent, to_minor
+
+# Groups at or above this many members use the array-backed engine
+LARGE_GROUP_THRESHOLD = 1000
+
+
+def build_member_index(member_ids: List[str]) -> Tuple[np.ndarray, Dict[str, int]]:
+    """
+    Maps user_id -> dense integer index so balances can live in one
+    contiguous array instead of a dict of floats.
+    """
+
+    ids = np.asarray(member_ids, dtype=object)
+    index = {user_id: i for i, user_id in enumerate(member_ids)}
+    return ids, index
+
+
+def compute_balances_array(
+    members: List[dict],
+    expenses: List[dict],
+    currency: str = DEFAULT_CURRENCY
+) -> Dict[str, int]:
+    """
+    Vectorized balances honoring per-expense splits (see money.expense_shares
+    for the split rules). Returns user_id -> balance in integer minor units.
+
+    Expenses are reduced to index arrays (payer index, amount) plus one flat
+    participant table (expense index, member index, weight / exact share).
+    Paid amounts and shares are accumulated with bincount, so the cost is
+    O(expenses + participant rows) rather than expenses x members:
+
+    - equal split over all members (the common case) never materializes
+      participant rows: remainder units go to a wrapped run of members in
+      sorted-id order starting at crc32(expense_id), via a difference array
+    - equal / weighted splits over a subset use floor shares plus one extra
+      unit for the largest remainders, ranked per expense with lexsort
+    - exact splits add the given shares; any difference stays with the payer
+    """
+
+    accumulator = BalanceAccumulator([m["user_id"] for m in members], currency)
+    accumulator.add(expenses)
+    return accumulator.balances()
+
+
+class BalanceAccumulator:
+    """
+    Running balances for one group and currency. Every expense contributes
+    independently, so expenses can be folded in chunk by chunk (e.g. rows
+    streamed from the database) and only the O(members) array is kept.
+    """
+
+    def __init__(self, member_ids: List[str], currency: str = DEFAULT_CURRENCY):
+        self.member_ids = list(member_ids)
+        self.currency = currency
+        self.ids, self.index = build_member_index(self.member_ids)
+        self.totals = np.zeros(len(self.member_ids), dtype=np.int64)
+
+        # Sorted-id position of every member (allocation order)
+        self.rank = np.empty(len(self.member_ids), dtype=np.int64)
+        self.rank[np.argsort(self.ids, kind="stable")] = np.arange(len(self.member_ids))
+
+    def add(self, expenses: List[dict]) -> None:
+        n = len(self.member_ids)
+        count = len(expenses)
+        if n == 0 or count == 0:
+            return
+
+        index = self.index
+        payer_idx = np.fromiter(
+            (index.get(e["paid_by"], -1) for e in expenses), dtype=np.int64, count=count
+        )
+        amounts = np.fromiter(
+            (e["amount_minor"] if "amount_minor" in e else to_minor(e["amount"], self.currency) for e in expenses),
+            dtype=np.int64, count=count
+        )
+        seeds = np.fromiter(
+            (zlib.crc32(e["expense_id"].encode()) if e.get("expense_id") else 0 for e in expenses),
+            dtype=np.int64, count=count
+        )
+
+        # Expenses paid by non-members are still split, but credit nobody
+        known = payer_idx >= 0
+        balances = np.bincount(payer_idx[known], weights=amounts[known], minlength=n)
+        balances = np.rint(balances).astype(np.int64)
+
+        default, rows = _participant_rows(expenses, index)
+
+        balances -= _equal_all_members(amounts[default], seeds[default], n)[self.rank]
+
+        if rows["alloc_exp"].size:
+            shares = _allocate_rows(rows["alloc_exp"], rows["alloc_weight"], amounts, seeds)
+            balances -= np.rint(np.bincount(rows["alloc_mem"], weights=shares, minlength=n)).astype(np.int64)
+
+        if rows["exact_expenses"].size:
+            balances -= np.rint(np.bincount(rows["exact_mem"], weights=rows["exact_share"], minlength=n)).astype(np.int64)
+
+            # Unassigned remainder of an exact split stays with the payer
+            exact_total = np.bincount(rows["exact_exp"], weights=rows["exact_share"], minlength=count)
+            residual = np.zeros(count, dtype=np.int64)
+            residual[rows["exact_expenses"]] = amounts[rows["exact_expenses"]] - np.rint(
+                exact_total[rows["exact_expenses"]]
+            ).astype(np.int64)
+            has_payer = known & (residual != 0)
+            np.subtract.at(balances, payer_idx[has_payer], residual[has_payer])
+
+        self.totals += balances
+
+    def balances(self) -> Dict[str, int]:
+        return dict(zip(self.member_ids, self.totals.tolist()))
+
+
+def _participant_rows(expenses: List[dict], index: Dict[str, int]):
+    """
+    Flatten explicit splits into participant rows. Returns a mask of the
+    expenses that are a plain equal split over all members, and the row
+    arrays for subset / weighted (alloc_*) and exact (exact_*) splits.
+    Allocated rows are emitted in sorted user-id order per expense.
+    """
+
+    default = np.ones(len(expenses), dtype=bool)
+    alloc_exp, alloc_mem, alloc_weight = [], [], []
+    exact_exp, exact_mem, exact_share, exact_expenses = [], [], [], []
+
+    # Plain equal splits over everyone need no rows; skip them up front
+    explicit = [
+        e_i for e_i, expense in enumerate(expenses)
+        if expense.get("involved_members") or (expense.get("split_type") or "equal") != "equal"
+    ]
+
+    for e_i in explicit:
+        expense = expenses[e_i]
+        split_type = expense.get("split_type") or "equal"
+
+        if split_type == "exact":
+            default[e_i] = False
+            exact_expenses.append(e_i)
+            for uid, share in (expense.get("split_shares") or {}).items():
+                if uid in index:
+                    exact_exp.append(e_i)
+                    exact_mem.append(index[uid])
+                    exact_share.append(int(share))
+            continue
+
+        if split_type == "weighted":
+            weights = {
+                uid: int(w) for uid, w in (expense.get("split_shares") or {}).items()
+                if uid in index and int(w) > 0
+            }
+        else:
+            weights = {uid: 1 for uid in (expense.get("involved_members") or []) if uid in index}
+
+        if not weights:
+            continue   # no known participants -> equal split over all members
+
+        default[e_i] = False
+        for uid in sorted(weights):
+            alloc_exp.append(e_i)
+            alloc_mem.append(index[uid])
+            alloc_weight.append(weights[uid])
+
+    rows = {
+        "alloc_exp": np.asarray(alloc_exp, dtype=np.int64),
+        "alloc_mem": np.asarray(alloc_mem, dtype=np.int64),
+        "alloc_weight": np.asarray(alloc_weight, dtype=np.int64),
+        "exact_exp": np.asarray(exact_exp, dtype=np.int64),
+        "exact_mem": np.asarray(exact_mem, dtype=np.int64),
+        "exact_share": np.asarray(exact_share, dtype=np.int64),
+        "exact_expenses": np.asarray(exact_expenses, dtype=np.int64),
+    }
+    return default, rows
+
+
+def _equal_all_members(amounts: np.ndarray, seeds: np.ndarray, n: int) -> np.ndarray:
+    """Total owed per sorted-id position for equal splits over all n members"""
+    signs = np.where(amounts < 0, -1, 1)
+    quotient, remainder = np.divmod(np.abs(amounts), n)
+    starts = seeds % n
+
+    # +1 unit on [start, start + remainder), wrapping past the last member
+    diff = np.zeros(n + 1, dtype=np.int64)
+    ends = starts + remainder
+    np.add.at(diff, starts, signs)
+    np.add.at(diff, np.minimum(ends, n), -signs)
+    wrapped = ends > n
+    np.add.at(diff, np.zeros(int(wrapped.sum()), dtype=np.int64), signs[wrapped])
+    np.add.at(diff, ends[wrapped] - n, -signs[wrapped])
+
+    return int((signs * quotient).sum()) + np.cumsum(diff[:n])
+
+
+def _allocate_rows(exp_idx: np.ndarray, weights: np.ndarray, amounts: np.ndarray, seeds: np.ndarray) -> np.ndarray:
+    """
+    Vectorized money.allocate_minor over participant rows (grouped by
+    expense, sorted by user id within each expense): floor shares, then one
+    extra unit to the largest remainders, ties walked from the seed offset.
+    """
+
+    count = len(amounts)
+    weight_sum = np.bincount(exp_idx, weights=weights, minlength=count).astype(np.int64)
+    row_count = np.bincount(exp_idx, minlength=count)
+    first_row = np.concatenate([[0], np.cumsum(row_count)[:-1]])
+
+    total = np.abs(amounts)[exp_idx]
+    numerator = total * weights
+    floor = numerator // weight_sum[exp_idx]
+    fraction = numerator % weight_sum[exp_idx]
+
+    leftover = np.abs(amounts) - np.bincount(exp_idx, weights=floor, minlength=count).astype(np.int64)
+
+    k = row_count[exp_idx]
+    position = np.arange(len(exp_idx)) - first_row[exp_idx]
+    rotated = (position - seeds[exp_idx] % k) % k
+
+    order = np.lexsort((rotated, -fraction, exp_idx))
+    rank_in_expense = np.empty(len(exp_idx), dtype=np.int64)
+    rank_in_expense[order] = np.arange(len(exp_idx)) - first_row[exp_idx[order]]
+
+    shares = floor + (rank_in_expense < leftover[exp_idx])
+    return np.where(amounts[exp_idx] < 0, -shares, shares)
+
+
+def tex_optimize_array(balances: Dict[str, float], currency: str = DEFAULT_CURRENCY) -> List[Dict]:
+    """
+    Array version of tex.tex_optimize with the same output contract:
+    [{from, to, amount, amount_minor, currency}]
+
+    Debtors and creditors are sorted largest-first and laid end to end as
+    cumulative sums. Every boundary of either running total ends exactly one
+    transfer, so the two-pointer walk becomes a merge of the two cumulative
+    arrays. Amounts are matched in integer minor units.
+    """
+
+    if not balances:
+        return []
+
+    ids, _ = build_member_index(list(balances.keys()))
+    scale = 10 ** minor_exponent(currency)
+    minor = np.rint(np.fromiter(balances.values(), dtype=np.float64, count=len(balances)) * scale)
+    minor = minor.astype(np.int64)
+
+    debtor_idx = np.flatnonzero(minor < 0)
+    creditor_idx = np.flatnonzero(minor > 0)
+    if len(debtor_idx) == 0 or len(creditor_idx) == 0:
+        return []
+
+    # Largest balances first (stable, so ties keep input order)
+    debtor_idx = debtor_idx[np.argsort(minor[debtor_idx], kind="stable")]
+    creditor_idx = creditor_idx[np.argsort(-minor[creditor_idx], kind="stable")]
+
+    debt_cum = np.cumsum(-minor[debtor_idx])
+    credit_cum = np.cumsum(minor[creditor_idx])
+    total = min(debt_cum[-1], credit_cum[-1])
+
+    boundaries = np.union1d(debt_cum, credit_cum)
+    boundaries = boundaries[boundaries <= total]
+    amounts = np.diff(boundaries, prepend=0)
+
+    from_pos = np.searchsorted(debt_cum, boundaries, side="left")
+    to_pos = np.searchsorted(credit_cum, boundaries, side="left")
+
+    from_ids = ids[debtor_idx[from_pos]]
+    to_ids = ids[creditor_idx[to_pos]]
+
+    return [
+        {"from": f, "to": t, "amount": a / scale, "amount_minor": a, "currency": currency}
+        for f, t, a in zip(from_ids.tolist(), to_ids.tolist(), amounts.tolist())
+    ]
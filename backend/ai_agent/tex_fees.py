@@ -0,0 +1,127 @@
+from typing import Dict, List, Optional
+import logging
+import numpy as np
+from scipy.optimize import Bounds, LinearConstraint, milp
+from scipy.sparse import coo_matrix
+
+from ai_agent.money import DEFAULT_CURRENCY, from_minor, to_minor
+from ai_agent.tex import tex_optimize
+
+logger = logging.getLogger(__name__)
+
+# Fee-aware solver configuration
+ALGORAND_MIN_FEE = 1000            # microAlgos per payment transaction
+FEE_SOLVER_TIME_BUDGET = 2.0       # seconds before falling back to greedy
+FEE_SOLVER_MAX_PAIRS = 2500        # debtor x creditor pairs; larger problems go straight to greedy
+
+
+def tex_optimize_min_fee(
+    balances: Dict[str, float],
+    pair_fees: Optional[Dict[str, Dict[str, int]]] = None,
+    default_fee: int = ALGORAND_MIN_FEE,
+    time_budget: float = FEE_SOLVER_TIME_BUDGET,
+    currency: str = DEFAULT_CURRENCY
+) -> Dict:
+    """
+    Fee-aware settlement (fixed-charge min-cost flow, solved as a MILP).
+
+    Input:
+        balances: user_id -> net balance (+ve receives, -ve owes)
+        pair_fees: pair_fees[from][to] = fee for one transfer on that pair
+                   (e.g. opt-in assets, different wallets); missing pairs
+                   cost default_fee
+
+    Variables per debtor/creditor pair: x = amount moved (minor units) and
+    y = 1 if the transfer happens. Minimize sum(fee * y) with every debtor
+    paying exactly their debt, every creditor receiving exactly their
+    credit, and x <= min(debt, credit) * y.
+
+    Output:
+        {
+            "settlements": [{from, to, amount, amount_minor, currency}],
+            "total_fee": int,
+            "baseline_fee": int,     # fee of the greedy plan
+            "method": "milp" / "greedy_fallback"
+        }
+    """
+
+    pair_fees = pair_fees or {}
+
+    def fee(debtor: str, creditor: str) -> int:
+        return pair_fees.get(debtor, {}).get(creditor, default_fee)
+
+    def plan_fee(settlements: List[Dict]) -> int:
+        return sum(fee(s["from"], s["to"]) for s in settlements)
+
+    baseline = tex_optimize(balances, currency=currency)
+    fallback = {
+        "settlements": baseline,
+        "total_fee": plan_fee(baseline),
+        "baseline_fee": plan_fee(baseline),
+        "method": "greedy_fallback"
+    }
+
+    minor = {uid: to_minor(b, currency) for uid, b in balances.items()}
+    debtors = [uid for uid, v in minor.items() if v < 0]
+    creditors = [uid for uid, v in minor.items() if v > 0]
+    pairs = len(debtors) * len(creditors)
+
+    if pairs == 0 or pairs > FEE_SOLVER_MAX_PAIRS or sum(minor.values()) != 0:
+        return fallback
+
+    debts = np.array([-minor[uid] for uid in debtors], dtype=np.float64)
+    credits = np.array([minor[uid] for uid in creditors], dtype=np.float64)
+    m, k = len(debtors), len(creditors)
+
+    # Variable layout: x[0:pairs] amounts, y[pairs:2*pairs] transfer used (pair p = i * k + j)
+    fees = np.array([fee(d, c) for d in debtors for c in creditors], dtype=np.float64)
+    cost = np.concatenate([np.zeros(pairs), fees])
+
+    p = np.arange(pairs)
+    row_i, col_j = p // k, p % k
+    caps = np.minimum(debts[row_i], credits[col_j])
+
+    # Debtor rows, creditor rows, then x - cap * y <= 0 linking rows
+    rows = np.concatenate([row_i, m + col_j, m + k + p, m + k + p])
+    cols = np.concatenate([p, p, p, pairs + p])
+    vals = np.concatenate([np.ones(pairs), np.ones(pairs), np.ones(pairs), -caps])
+    A = coo_matrix((vals, (rows, cols)), shape=(m + k + pairs, 2 * pairs)).tocsr()
+
+    lower = np.concatenate([debts, credits, np.full(pairs, -np.inf)])
+    upper = np.concatenate([debts, credits, np.zeros(pairs)])
+
+    result = milp(
+        cost,
+        integrality=np.ones(2 * pairs),
+        bounds=Bounds(np.zeros(2 * pairs), np.concatenate([caps, np.ones(pairs)])),
+        constraints=LinearConstraint(A, lower, upper),
+        options={"time_limit": time_budget}
+    )
+
+    if result.x is None:
+        logger.warning(f"Fee solver found no plan ({result.message}); using greedy")
+        return fallback
+
+    amounts = np.rint(result.x[:pairs]).astype(np.int64)
+    settlements = [
+        {
+            "from": debtors[i],
+            "to": creditors[j],
+            "amount": from_minor(int(amounts[idx]), currency),
+            "amount_minor": int(amounts[idx]),
+            "currency": currency
+        }
+        for idx, (i, j) in enumerate(zip(row_i.tolist(), col_j.tolist()))
+        if amounts[idx] > 0
+    ]
+
+    # A time-limited incumbent can be worse than greedy
+    if plan_fee(settlements) > fallback["baseline_fee"]:
+        return fallback
+
+    return {
+        "settlements": settlements,
+        "total_fee": plan_fee(settlements),
+        "baseline_fee": fallback["baseline_fee"],
+        "method": "milp"
+    }
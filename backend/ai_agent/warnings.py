@@ -7,6 +7,22 @@ LEVEL_1_THRESHOLD = 0.4
 LEVEL_2_THRESHOLD = 0.6
 LEVEL_3_THRESHOLD = 0.8
 
+# Change-driven mode: re-evaluate a member only when their score moved more than this
+RISK_CHANGE_DELTA = 0.05
+
+# settings["warning_mode"]: full (every member, default) or changes (evaluate_warning_changes)
+WARNING_MODES = ("full", "changes")
+
+
+def risk_band(risk: float) -> str:
+    if risk >= LEVEL_3_THRESHOLD:
+        return "LEVEL_3"
+    if risk >= LEVEL_2_THRESHOLD:
+        return "LEVEL_2"
+    if risk >= LEVEL_1_THRESHOLD:
+        return "LEVEL_1"
+    return "NONE"
+
 
 def evaluate_warnings(
     risk_scores: Dict[str, float],
@@ -53,3 +69,49 @@ def evaluate_warnings(
 
     return warning_levels, updated_warning_counts, on_chain_enforcement_flags
 
+
+def evaluate_warning_changes(
+    risk_scores: Dict[str, float],
+    previous_scores: Dict[str, float],
+    previous_levels: Dict[str, str],
+    existing_warning_counts: Dict[str, int],
+    balances: Dict[str, float],
+    delta: float = RISK_CHANGE_DELTA
+) -> Tuple[Dict[str, dict], Dict[str, int], Dict[str, bool]]:
+    """
+    Change-driven evaluate_warnings: only members whose score crossed a
+    threshold band (vs their last persisted level), moved by more than
+    `delta` (vs their last persisted score), or sit at LEVEL_3 are
+    evaluated. LEVEL_3 members are always evaluated so they keep taking
+    strikes and stay excluded exactly as in evaluate_warnings. Everyone
+    else keeps their level and count.
+
+    Returns:
+        changes: user_id -> {level, previous_level, risk_score, previous_score, enforce}
+        updated_warning_counts
+        on_chain_enforcement_flags: only for the evaluated members
+    """
+
+    affected = {
+        user_id: risk for user_id, risk in risk_scores.items()
+        if user_id not in previous_scores
+        or risk_band(risk) != previous_levels.get(user_id, "NONE")
+        or abs(risk - previous_scores[user_id]) > delta
+        or risk >= LEVEL_3_THRESHOLD
+    }
+
+    levels, updated_warning_counts, enforcement_flags = evaluate_warnings(
+        affected, existing_warning_counts, balances
+    )
+
+    changes = {
+        user_id: {
+            "level": levels[user_id],
+            "previous_level": previous_levels.get(user_id, "NONE"),
+            "risk_score": risk,
+            "previous_score": previous_scores.get(user_id),
+            "enforce": enforcement_flags[user_id]
+        }
+        for user_id, risk in affected.items()
+    }
+    return changes, updated_warning_counts, enforcement_flags
@@ -6,6 +6,7 @@ from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from contextlib import asynccontextmanager
+from sqlalchemy import text
 import uvicorn
 
 # Add src to path
@@ -19,13 +20,16 @@ logging.basicConfig(
 logger = logging.getLogger("AlgoSettler")
 
 # Import database and models
-from src.config.db import engine, init_db, SessionLocal, get_db
+from src.config.db import engine, init_db, SessionLocal, get_db, get_redis
 from src.models.models import Base, User
 from src.utils.auth import decode_token
 from src.utils.schemas import HealthResponse
 
 # Import routes
 from src.routes import auth_routes, group_routes, expense_routes, settlement_routes
+from src.services.settlement_runner import shutdown_settlement_runner
+from src.services.settlement_jobs import get_job_queue, shutdown_job_queue
+from ai_agent.llm_cache import configure_llm_cache
 
 # ============== DATABASE CONNECTION CHECK ==============
 def check_db_connection():
@@ -38,7 +42,7 @@ def check_db_connection():
     try:
         # Try to connect and execute a simple query
         with engine.connect() as connection:
-            connection.execute("SELECT 1")
+            connection.execute(text("SELECT 1"))
         
         # Initialize tables
         init_db()
@@ -61,9 +65,15 @@ async def lifespan(app: FastAPI):
     db_up = check_db_connection()
     if not db_up:
         logger.error("System starting in degraded mode: Database is offline.")
+    # Share LLM responses across workers when Redis is up (in-process cache otherwise)
+    configure_llm_cache(redis=get_redis())
+    # Settlement job workers (SETTLEMENT_JOB_BACKEND=memory / redis)
+    get_job_queue()
     yield
     # Shutdown
     logger.info("AlgoSettler API shutting down...")
+    shutdown_job_queue()
+    shutdown_settlement_runner()
 
 # Create FastAPI app
 app = FastAPI(
@@ -99,7 +109,18 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         )
     return user_id
 
-# ... (Rest of your routes remain the same) ...
+# ============== ROUTES ==============
+app.include_router(auth_routes.router, prefix="/api/auth", tags=["auth"])
+app.include_router(group_routes.router, prefix="/api/groups", tags=["groups"])
+app.include_router(expense_routes.router, prefix="/api/expenses", tags=["expenses"])
+app.include_router(settlement_routes.router, prefix="/api/settlements", tags=["settlements"])
+
+
+@app.get("/health", response_model=HealthResponse)
+async def health():
+    """Liveness check; never waits on settlements, which run on their own pool"""
+    return HealthResponse(status="healthy", message="AlgoSettler API is running")
+
 
 if __name__ == "__main__":
     host = os.getenv("HOST", "127.0.0.1")
@@ -4,7 +4,7 @@ from typing import List, Dict, Optional
 from datetime import datetime
 import uuid
 
-from ai_agent.graph import build_graph
+from ai_agent.graph import get_graph
 from ai_agent.state import GroupState
 
 app = FastAPI(title="Smart Expense Vault API")
@@ -16,7 +16,7 @@ groups_db = {}
 expenses_db = {}
 settlements_db = {}
 
-graph = build_graph()
+graph = get_graph()
 
 # Pydantic Models
 
@@ -37,7 +37,10 @@ def init_db():
     # Import models here to avoid circular imports
     # Ensure your models inherit from this 'Base'
     from src.models.models import Base as ModelsBase
+    from src.config.migrations import upgrade_schema
     ModelsBase.metadata.create_all(bind=engine)
+    # Existing databases: columns changed since their tables were created
+    upgrade_schema(engine)
 
 def get_db():
     """Dependency to get the DB session for FastAPI routes"""
@@ -0,0 +1,115 @@
+from sqlalchemy import inspect, literal, text
+from sqlalchemy.engine import Connection, Engine
+from typing import List
+import logging
+
+from ai_agent.money import DEFAULT_CURRENCY, to_minor
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _columns(conn: Connection, table: str) -> set:
+    return {column["name"] for column in inspect(conn).get_columns(table)}
+
+
+def upgrade_expense_amounts(conn: Connection) -> bool:
+    """
+    expenses.amount (Float, major units) -> amount_minor (BigInteger) +
+    currency. The currency of a legacy expense is its group's settlement
+    currency (USD when the group predates that column too); amounts are
+    converted with money.to_minor, like the API does. Drops `amount` once
+    every row is backfilled. Returns False when there is nothing to do.
+    """
+
+    if not inspect(conn).has_table("expenses"):
+        return False
+    columns = _columns(conn, "expenses")
+    if "amount" not in columns:
+        return False
+
+    if "amount_minor" not in columns:
+        conn.execute(text("ALTER TABLE expenses ADD COLUMN amount_minor BIGINT"))
+    if "currency" not in columns:
+        # No default here: every legacy row takes its group's currency below
+        conn.execute(text("ALTER TABLE expenses ADD COLUMN currency VARCHAR(8)"))
+
+    group_currency = "g.currency_default" if "currency_default" in _columns(conn, "groups") else "NULL"
+    currency_expr = f"COALESCE(e.currency, {group_currency})" if "currency" in columns else group_currency
+    groups = conn.dialect.identifier_preparer.quote_identifier("groups")   # reserved word in MySQL 8
+    rows = conn.execute(text(
+        f"SELECT e.id, e.amount, {currency_expr} AS currency "
+        f"FROM expenses e LEFT JOIN {groups} g ON g.id = e.group_id "
+        f"WHERE e.amount_minor IS NULL"
+    )).all()
+
+    updates: List[dict] = []
+    for row in rows:
+        currency = (row.currency or DEFAULT_CURRENCY).upper()
+        updates.append({"id": row.id, "amount_minor": to_minor(row.amount or 0, currency), "currency": currency})
+    for i in range(0, len(updates), BACKFILL_BATCH_SIZE):
+        conn.execute(
+            text("UPDATE expenses SET amount_minor = :amount_minor, currency = :currency WHERE id = :id"),
+            updates[i:i + BACKFILL_BATCH_SIZE]
+        )
+
+    dialect = conn.dialect.name
+    if dialect == "mysql":
+        conn.execute(text("ALTER TABLE expenses MODIFY amount_minor BIGINT NOT NULL"))
+        conn.execute(text(f"ALTER TABLE expenses MODIFY currency VARCHAR(8) NOT NULL DEFAULT '{DEFAULT_CURRENCY}'"))
+    elif dialect == "postgresql":
+        conn.execute(text("ALTER TABLE expenses ALTER COLUMN amount_minor SET NOT NULL"))
+        conn.execute(text("ALTER TABLE expenses ALTER COLUMN currency SET NOT NULL"))
+    # SQLite cannot add NOT NULL to an existing column; the model enforces it on insert
+
+    conn.execute(text("ALTER TABLE expenses DROP COLUMN amount"))
+    logger.info(f"Migrated {len(updates)} expense(s) from amount to amount_minor + currency")
+    return True
+
+
+def add_missing_columns(conn: Connection) -> bool:
+    """
+    Columns added to the models since an existing table was created
+    (splits, settlement currency, risk / warning state, ...). Scalar
+    defaults are written into the DDL, so existing rows get them; other
+    new columns start out NULL.
+    """
+
+    from src.models.models import Base
+
+    preparer = conn.dialect.identifier_preparer
+    changed = False
+    for table in Base.metadata.sorted_tables:
+        if not inspect(conn).has_table(table.name):
+            continue
+        existing = _columns(conn, table.name)
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = (
+                f"ALTER TABLE {preparer.quote_identifier(table.name)} "
+                f"ADD COLUMN {preparer.quote_identifier(column.name)} {column.type.compile(dialect=conn.dialect)}"
+            )
+            default = column.default.arg if column.default is not None and column.default.is_scalar else None
+            if isinstance(default, (bool, int, float, str)):
+                ddl += f" DEFAULT {literal(default).compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True})}"
+            conn.execute(text(ddl))
+            logger.info(f"Added column {table.name}.{column.name}")
+            changed = True
+    return changed
+
+
+# Run in order by init_db, each in its own transaction; every step checks
+# the live schema first, so running them again is a no-op
+MIGRATIONS = [upgrade_expense_amounts, add_missing_columns]
+
+
+def upgrade_schema(engine: Engine) -> List[str]:
+    """Bring an existing database up to the models (call after create_all); returns the steps applied"""
+    applied = []
+    for migration in MIGRATIONS:
+        with engine.begin() as conn:
+            if migration(conn):
+                applied.append(migration.__name__)
+    return applied
@@ -1,7 +1,9 @@
 from .models import (
-    Base, User, Group, GroupMember, Expense, Settlement, AuditLog
+    Base, User, Group, GroupMember, Expense, Settlement, SettlementPlan, GroupMemberBalance, PaymentEvent,
+    MemberRiskStats, FxRate, AuditLog
 )
 
 __all__ = [
-    'Base', 'User', 'Group', 'GroupMember', 'Expense', 'Settlement', 'AuditLog'
+    'Base', 'User', 'Group', 'GroupMember', 'Expense', 'Settlement', 'SettlementPlan', 'GroupMemberBalance', 'PaymentEvent',
+    'MemberRiskStats', 'FxRate', 'AuditLog'
 ]
@@ -1,9 +1,11 @@
-from sqlalchemy import Column, String, Float, DateTime, ForeignKey, Integer, JSON, Boolean
+from sqlalchemy import Column, String, Float, DateTime, ForeignKey, Integer, BigInteger, Numeric, JSON, Boolean, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
 
+from ai_agent.money import DEFAULT_CURRENCY, from_minor, to_minor
+
 Base = declarative_base()
 
 
@@ -30,6 +32,8 @@ class Group(Base):
     description = Column(String, nullable=True)
     creator_id = Column(String, ForeignKey("users.id"), nullable=False)
     vault_address = Column(String, nullable=True)  # Algorand escrow address
+    currency_default = Column(String(8), nullable=False, default=DEFAULT_CURRENCY)  # settlement currency
+    balances_materialized = Column(Boolean, nullable=False, default=False)  # group_member_balances kept in step
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -37,6 +41,8 @@ class Group(Base):
     members = relationship("GroupMember", back_populates="group", cascade="all, delete-orphan")
     expenses = relationship("Expense", back_populates="group", cascade="all, delete-orphan")
     settlements = relationship("Settlement", back_populates="group", cascade="all, delete-orphan")
+    settlement_plans = relationship("SettlementPlan", back_populates="group", cascade="all, delete-orphan")
+    member_balances = relationship("GroupMemberBalance", back_populates="group", cascade="all, delete-orphan")
 
 
 class GroupMember(Base):
@@ -47,8 +53,11 @@ class GroupMember(Base):
     user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
     wallet_address = Column(String, nullable=True)
     trust_score = Column(Float, default=0.5)
+    risk_score = Column(Float, default=0.0)  # refreshed by the nightly rescoring job
+    risk_scored_at = Column(DateTime, nullable=True)
     joined_at = Column(DateTime, default=datetime.utcnow)
     warning_count = Column(Integer, default=0)
+    warning_level = Column(String(16), default="NONE")  # last persisted level (change-driven warnings)
     is_active = Column(Boolean, default=True)
     
     group = relationship("Group", back_populates="members")
@@ -61,7 +70,11 @@ class Expense(Base):
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     group_id = Column(String, ForeignKey("groups.id"), nullable=False, index=True)
     paid_by_id = Column(String, ForeignKey("users.id"), nullable=False)
-    amount = Column(Float, nullable=False)
+    amount_minor = Column(BigInteger, nullable=False)  # fixed-point, integer minor units
+    currency = Column(String(8), nullable=False, default=DEFAULT_CURRENCY)
+    split_type = Column(String(16), nullable=False, default="equal")  # equal, weighted, exact
+    split_among = Column(JSON, nullable=True)  # [user_ids] for equal splits; null = all members
+    split_shares = Column(JSON, nullable=True)  # {user_id: weight} (weighted) / {user_id: minor units} (exact)
     description = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     settled = Column(Boolean, default=False)
@@ -69,6 +82,15 @@ class Expense(Base):
     group = relationship("Group", back_populates="expenses")
     paid_by_user = relationship("User", back_populates="expenses")
 
+    @property
+    def amount(self) -> float:
+        """Major-unit amount for display; amount_minor is authoritative"""
+        return from_minor(self.amount_minor, self.currency)
+
+    @amount.setter
+    def amount(self, value) -> None:
+        self.amount_minor = to_minor(value, self.currency or DEFAULT_CURRENCY)
+
 
 class Settlement(Base):
     __tablename__ = "settlements"
@@ -77,7 +99,7 @@ class Settlement(Base):
     group_id = Column(String, ForeignKey("groups.id"), nullable=False, index=True)
     
     # Settlement data from LangGraph
-    settlements = Column(JSON, default={})  # List of {from, to, amount}
+    settlements = Column(JSON, default={})  # List of {from, to, amount, amount_minor, currency}
     risk_scores = Column(JSON, default={})  # {user_id: score}
     warnings = Column(JSON, default={})  # {user_id: level}
     excluded_members = Column(JSON, default=[])  # [user_ids]
@@ -96,6 +118,89 @@ class Settlement(Base):
     group = relationship("Group", back_populates="settlements")
 
 
+class SettlementPlan(Base):
+    """Maintained "current plan" per group and currency, updated on every expense insert"""
+    __tablename__ = "settlement_plans"
+    __table_args__ = (UniqueConstraint("group_id", "currency", name="uq_settlement_plan_group_currency"),)
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    group_id = Column(String, ForeignKey("groups.id"), nullable=False, index=True)
+    currency = Column(String(8), nullable=False, default=DEFAULT_CURRENCY)
+    balances = Column(JSON, default={})  # {user_id: balance in minor units}
+    transfers = Column(JSON, default=[])  # List of {from, to, amount, amount_minor, currency}
+    version = Column(Integer, default=0)  # bumped on every incremental update
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    group = relationship("Group", back_populates="settlement_plans")
+
+
+class GroupMemberBalance(Base):
+    """Materialized running balance per member and currency, kept in step with expense writes"""
+    __tablename__ = "group_member_balances"
+    __table_args__ = (
+        UniqueConstraint("group_id", "user_id", "currency", name="uq_member_balance_group_user_currency"),
+    )
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    group_id = Column(String, ForeignKey("groups.id"), nullable=False, index=True)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    currency = Column(String(8), nullable=False, default=DEFAULT_CURRENCY)
+    balance_minor = Column(BigInteger, nullable=False, default=0)  # +ve receives, -ve owes
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    group = relationship("Group", back_populates="member_balances")
+
+
+class PaymentEvent(Base):
+    """One debtor's leg of a settlement: paid (possibly late) or missed"""
+    __tablename__ = "payment_events"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    settlement_id = Column(String, ForeignKey("settlements.id"), nullable=False, index=True)
+    group_id = Column(String, ForeignKey("groups.id"), nullable=False)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)  # payer
+    to_user_id = Column(String, ForeignKey("users.id"), nullable=True)
+    amount_minor = Column(BigInteger, nullable=False, default=0)
+    currency = Column(String(8), nullable=False, default=DEFAULT_CURRENCY)
+    kind = Column(String(16), nullable=False)  # paid, missed
+    is_late = Column(Boolean, default=False)
+    due_at = Column(DateTime, nullable=False)
+    paid_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class MemberRiskStats(Base):
+    """Per-user risk aggregates, maintained as payment events and warnings are recorded"""
+    __tablename__ = "member_risk_stats"
+    
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    payment_count = Column(Integer, nullable=False, default=0)
+    late_count = Column(Integer, nullable=False, default=0)
+    missed_settlements = Column(Integer, nullable=False, default=0)
+    warning_count = Column(Integer, nullable=False, default=0)
+    
+    # Exponentially decayed counterparts, valid as of decayed_at (see ai_agent.risk.decay_counters)
+    decayed_payments = Column(Float, nullable=False, default=0.0)
+    decayed_late = Column(Float, nullable=False, default=0.0)
+    decayed_missed = Column(Float, nullable=False, default=0.0)
+    decayed_warnings = Column(Float, nullable=False, default=0.0)
+    decayed_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class FxRate(Base):
+    """Versioned local FX rate table: one row per (version, currency)"""
+    __tablename__ = "fx_rates"
+    __table_args__ = (UniqueConstraint("version", "currency", name="uq_fx_rate_version_currency"),)
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    version = Column(Integer, nullable=False, index=True)
+    currency = Column(String(8), nullable=False)
+    pivot = Column(String(8), nullable=False, default=DEFAULT_CURRENCY)
+    rate = Column(Numeric(24, 12), nullable=False)  # units of pivot per 1 unit of currency
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
     
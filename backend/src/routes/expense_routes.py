@@ -11,6 +11,9 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../../'))
 
 from src.config.db import get_db
 from src.models.models import Group, GroupMember, Expense, Settlement, User
+from src.services.settlement_plan import apply_expense_to_plan, invalidate_plans
+from src.services.member_balances import apply_expense_balances, revert_expense_balances
+from ai_agent.money import DEFAULT_CURRENCY, to_minor
 from src.utils.schemas import (
     CreateExpenseRequest, ExpenseResponse, SettlementRequest,
     SettlementResponse, SettlementDetailResponse
@@ -19,9 +22,45 @@ from src.utils.schemas import (
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+SPLIT_TYPES = ("equal", "weighted", "exact")
+SPLIT_WEIGHT_SCALE = 1000   # weights are stored as integers (1.5 -> 1500)
+
+
+def _split_fields(req: CreateExpenseRequest, member_ids: set, currency: str, amount_minor: int) -> dict:
+    """Validate the requested split and convert it to the stored (integer) form"""
+    split_type = (req.split_type or "equal").lower()
+    if split_type not in SPLIT_TYPES:
+        raise HTTPException(status_code=400, detail=f"split_type must be one of {', '.join(SPLIT_TYPES)}")
+
+    requested = {
+        "equal": req.split_among or [],
+        "weighted": req.split_weights or {},
+        "exact": req.split_amounts or {}
+    }[split_type]
+    outsiders = sorted(set(requested) - member_ids)
+    if outsiders:
+        raise HTTPException(status_code=400, detail=f"Not group members: {', '.join(outsiders)}")
+
+    if split_type == "equal":
+        return {"split_type": "equal", "split_among": sorted(set(requested)) or None, "split_shares": None}
+
+    if not requested:
+        raise HTTPException(status_code=400, detail=f"{split_type} split needs at least one participant")
+
+    if split_type == "weighted":
+        weights = {uid: int(round(w * SPLIT_WEIGHT_SCALE)) for uid, w in requested.items()}
+        if any(w < 0 for w in weights.values()) or not any(weights.values()):
+            raise HTTPException(status_code=400, detail="Split weights must be non-negative and not all zero")
+        return {"split_type": "weighted", "split_among": None, "split_shares": weights}
+
+    shares = {uid: to_minor(a, currency) for uid, a in requested.items()}
+    if sum(shares.values()) != amount_minor:
+        raise HTTPException(status_code=400, detail="Split amounts must add up to the expense amount")
+    return {"split_type": "exact", "split_among": None, "split_shares": shares}
+
 
 @router.post("/{group_id}/add", response_model=ExpenseResponse)
-async def add_expense(group_id: str, req: CreateExpenseRequest, user_id: str, db: Session = Depends(get_db)):
+def add_expense(group_id: str, req: CreateExpenseRequest, user_id: str, db: Session = Depends(get_db)):
     """Add an expense to a group"""
     
     group = db.query(Group).filter(Group.id == group_id).first()
@@ -36,15 +75,26 @@ async def add_expense(group_id: str, req: CreateExpenseRequest, user_id: str, db
     if not is_member:
         raise HTTPException(status_code=403, detail="Not a member of this group")
     
+    currency = (req.currency or DEFAULT_CURRENCY).upper()
+    amount_minor = to_minor(req.amount, currency)
+    member_ids = {
+        m.user_id for m in db.query(GroupMember.user_id).filter(GroupMember.group_id == group_id)
+    }
+
     expense = Expense(
         id=str(uuid.uuid4()),
         group_id=group_id,
         paid_by_id=user_id,
-        amount=req.amount,
-        description=req.description or ""
+        currency=currency,
+        amount_minor=amount_minor,
+        description=req.description or "",
+        **_split_fields(req, member_ids, currency, amount_minor)
     )
     
     db.add(expense)
+    # Keep the group's current settlement plan and member balances in step, same transaction
+    apply_expense_to_plan(db, expense)
+    apply_expense_balances(db, expense)
     db.commit()
     db.refresh(expense)
     
@@ -69,3 +119,33 @@ async def list_expenses(group_id: str, user_id: str, db: Session = Depends(get_d
     
     expenses = db.query(Expense).filter(Expense.group_id == group_id).all()
     return [ExpenseResponse.from_orm(e) for e in expenses]
+
+
+@router.delete("/{group_id}/{expense_id}")
+def delete_expense(group_id: str, expense_id: str, user_id: str, db: Session = Depends(get_db)):
+    """Delete an unsettled expense (payer or group creator only)"""
+    
+    group = db.query(Group).filter(Group.id == group_id).first()
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    expense = db.query(Expense).filter(
+        Expense.id == expense_id,
+        Expense.group_id == group_id
+    ).first()
+    if not expense:
+        raise HTTPException(status_code=404, detail="Expense not found")
+    
+    if user_id not in (expense.paid_by_id, group.creator_id):
+        raise HTTPException(status_code=403, detail="Only the payer or group creator can delete an expense")
+    
+    if expense.settled:
+        raise HTTPException(status_code=400, detail="Cannot delete a settled expense")
+    
+    # Take it back out of the member balances before the row goes, same transaction
+    revert_expense_balances(db, expense)
+    invalidate_plans(db, group_id)
+    db.delete(expense)
+    db.commit()
+    
+    return {"message": "Expense deleted", "expense_id": expense_id}
@@ -4,6 +4,8 @@ import uuid
 
 from src.config.db import get_db
 from src.models.models import Group, GroupMember, User, Expense
+from src.services.settlement_plan import invalidate_plans
+from src.services.member_balances import rebuild_member_balances
 from src.utils.schemas import (
     CreateGroupRequest, GroupResponse, GroupDetailResponse, AddMemberRequest
 )
@@ -27,7 +29,9 @@ async def create_group(req: CreateGroupRequest, user_id: str, db: Session = Depe
         id=group_id,
         name=req.name,
         description=req.description or "",
-        creator_id=user_id
+        creator_id=user_id,
+        currency_default=(req.currency_default or "USD").upper(),
+        balances_materialized=True
     )
     
     # Add creator as first member
@@ -122,7 +126,7 @@ async def get_group(group_id: str, user_id: str, db: Session = Depends(get_db)):
 
 
 @router.post("/{group_id}/members")
-async def add_member(group_id: str, req: AddMemberRequest, user_id: str, db: Session = Depends(get_db)):
+def add_member(group_id: str, req: AddMemberRequest, user_id: str, db: Session = Depends(get_db)):
     """Add a member to a group"""
     
     group = db.query(Group).filter(Group.id == group_id).first()
@@ -154,13 +158,17 @@ async def add_member(group_id: str, req: AddMemberRequest, user_id: str, db: Ses
     )
     
     db.add(member)
+    db.flush()
+    # Equal-split shares change with the member count
+    invalidate_plans(db, group_id)
+    rebuild_member_balances(db, group_id)
     db.commit()
     
     return {"message": "Member added", "group_id": group_id, "user_id": req.user_id}
 
 
 @router.delete("/{group_id}/members/{member_id}")
-async def remove_member(group_id: str, member_id: str, user_id: str, db: Session = Depends(get_db)):
+def remove_member(group_id: str, member_id: str, user_id: str, db: Session = Depends(get_db)):
     """Remove a member from a group"""
     
     group = db.query(Group).filter(Group.id == group_id).first()
@@ -176,6 +184,9 @@ async def remove_member(group_id: str, member_id: str, user_id: str, db: Session
         raise HTTPException(status_code=404, detail="Member not found")
     
     db.delete(member)
+    db.flush()
+    invalidate_plans(db, group_id)
+    rebuild_member_balances(db, group_id)
     db.commit()
     
     return {"message": "Member removed"}
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from datetime import datetime
-import uuid
 import sys
 import os
+import json
 import logging
 
 # Add parent directories to path for imports
@@ -11,17 +12,29 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../../'))
 
 from src.config.db import get_db
 from src.models.models import Group, GroupMember, Expense, Settlement, User
+from ai_agent.money import DEFAULT_CURRENCY
+from src.services.settlement_plan import get_plan, invalidate_plans
+from src.services.member_balances import clear_member_balances
+from src.services.risk_features import RISK_MODES, record_missed_settlement, record_settlement_payments
+from src.services.settlement_calculation import run_settlement, save_settlement, settlement_state, settlement_summary
+from src.services.settlement_jobs import SettlementJobQueue, get_job_queue
+from src.services.batch_settlement import clamp_workers, due_group_ids, run_batch_settlement
+from src.services.settlement_runner import run_batch, run_blocking, run_quick, stream_settlement_graph
+from ai_agent.graph import GRAPH_VARIANTS
+from ai_agent.explanation import EXPLANATION_MODES
+from ai_agent.pipeline import FX_MODES, SETTLEMENT_MODES
+from ai_agent.warnings import WARNING_MODES
 from src.utils.schemas import (
-    SettlementRequest, SettlementResponse, SettlementDetailResponse
+    SettlementRequest, SettlementResponse, SettlementDetailResponse, SettlementPlanResponse,
+    BatchSettlementRequest, BatchSettlementResponse, SettlementJobResponse
 )
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-@router.post("/calculate", response_model=SettlementResponse)
-async def calculate_settlement(req: SettlementRequest, user_id: str, db: Session = Depends(get_db)):
-    """Calculate settlement for a group using LangGraph"""
+def _checked_request(req: SettlementRequest, user_id: str, db: Session):
+    """Group, run settings and graph variant for a calculate request (404 / 403 / 400 on bad input)"""
     
     # Fetch group
     group = db.query(Group).filter(Group.id == req.group_id).first()
@@ -36,85 +49,64 @@ async def calculate_settlement(req: SettlementRequest, user_id: str, db: Session
     if not is_member:
         raise HTTPException(status_code=403, detail="Not a member of this group")
     
+    risk_mode = req.risk_mode or "lifetime"
+    if risk_mode not in RISK_MODES:
+        raise HTTPException(status_code=400, detail=f"risk_mode must be one of {', '.join(RISK_MODES)}")
+    
+    graph_variant = req.graph_variant or "full"
+    if graph_variant not in GRAPH_VARIANTS:
+        raise HTTPException(status_code=400, detail=f"graph_variant must be one of {', '.join(GRAPH_VARIANTS)}")
+    
+    explanation_mode = req.explanation_mode or "template"
+    if explanation_mode not in EXPLANATION_MODES:
+        raise HTTPException(status_code=400, detail=f"explanation_mode must be one of {', '.join(EXPLANATION_MODES)}")
+    
+    settlement_mode = req.settlement_mode or "greedy"
+    if settlement_mode not in SETTLEMENT_MODES:
+        raise HTTPException(status_code=400, detail=f"settlement_mode must be one of {', '.join(SETTLEMENT_MODES)}")
+    
+    fx_mode = req.fx_mode or "per_currency"
+    if fx_mode not in FX_MODES:
+        raise HTTPException(status_code=400, detail=f"fx_mode must be one of {', '.join(FX_MODES)}")
+    
+    warning_mode = req.warning_mode or "full"
+    if warning_mode not in WARNING_MODES:
+        raise HTTPException(status_code=400, detail=f"warning_mode must be one of {', '.join(WARNING_MODES)}")
+    
+    settings = {
+        "settlement_mode": settlement_mode,
+        "fx_mode": fx_mode,
+        "pair_fees": req.pair_fees or {},
+        "risk_mode": risk_mode,
+        "warning_mode": warning_mode,
+        "explain": req.explain,
+        "explanation_mode": explanation_mode
+    }
+    return group, settings, graph_variant
+
+
+def _is_member(db: Session, group_id: str, user_id: str) -> bool:
+    return db.query(GroupMember).filter(
+        GroupMember.group_id == group_id,
+        GroupMember.user_id == user_id
+    ).first() is not None
+
+
+def _settlement_response(settlement: Settlement) -> SettlementResponse:
+    return SettlementResponse(**settlement_summary(settlement))
+
+
+@router.post("/calculate", response_model=SettlementResponse)
+async def calculate_settlement(req: SettlementRequest, user_id: str, db: Session = Depends(get_db)):
+    """Calculate settlement for a group using LangGraph"""
+    
+    group, settings, graph_variant = await run_quick(_checked_request, req, user_id, db)
+    
     try:
-        # Import LangGraph here to avoid circular imports
-        sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../../backend'))
-        from ai_agent.graph import build_graph
-        
-        # Fetch all data for the group
-        members = db.query(GroupMember).filter(GroupMember.group_id == req.group_id).all()
-        expenses = db.query(Expense).filter(
-            Expense.group_id == req.group_id,
-            Expense.settled == False
-        ).all()
-        
-        # Build state for LangGraph
-        from ai_agent.state import GroupState
-        
-        state: GroupState = {
-            "group_id": group.id,
-            "group_name": group.name,
-            "members": [
-                {
-                    "user_id": m.user_id,
-                    "wallet_address": m.wallet_address or "",
-                    "trust_score": m.trust_score,
-                    "joined_at": m.joined_at
-                }
-                for m in members
-            ],
-            "expenses": [
-                {
-                    "expense_id": e.id,
-                    "paid_by": e.paid_by_id,
-                    "amount": e.amount,
-                    "description": e.description or "",
-                    "timestamp": e.created_at
-                }
-                for e in expenses
-            ],
-            "balances": {},
-            "optimized_settlements": [],
-            "risk_scores": {},
-            "warning_levels": {},
-            "excluded_members": [],
-            "last_action": None,
-            "explanation": None,
-            "last_updated": datetime.utcnow(),
-            "warning_counts": {},
-            "governance_actions": {},
-            "onchain_results": {}
-        }
-        
-        # Run LangGraph
-        graph = build_graph()
-        result = graph.invoke(state)
-        
-        # Save settlement to database
-        settlement = Settlement(
-            id=str(uuid.uuid4()),
-            group_id=group.id,
-            settlements=result.get("optimized_settlements", []),
-            risk_scores=result.get("risk_scores", {}),
-            warnings=result.get("warning_levels", {}),
-            excluded_members=result.get("excluded_members", []),
-            governance_actions=result.get("governance_actions", {}),
-            onchain_results=result.get("onchain_results", {}),
-            explanation=result.get("explanation", ""),
-            status="pending"
-        )
-        db.add(settlement)
-        db.commit()
-        db.refresh(settlement)
-        
-        return SettlementResponse(
-            settlement_id=settlement.id,
-            settlements=settlement.settlements,
-            risk_scores=settlement.risk_scores,
-            warnings=settlement.warnings,
-            excluded_members=settlement.excluded_members,
-            explanation=settlement.explanation or "Settlement calculated successfully"
-        )
+        # State load -> LangGraph (compiled once per process) -> save, as one
+        # call on the settlement pool: nothing here blocks the event loop
+        settlement = await run_blocking(run_settlement, db, group, settings, graph_variant, actor_id=user_id)
+        return _settlement_response(settlement)
         
     except Exception as e:
         logger.error(f"Settlement calculation failed: {str(e)}", exc_info=True)
@@ -124,8 +116,160 @@ async def calculate_settlement(req: SettlementRequest, user_id: str, db: Session
         )
 
 
+# Graph node -> SSE event name and the state keys it reports
+STREAM_EVENTS = {
+    "compute_balances": ("balances", ("balances", "balances_by_currency")),
+    "tex": ("transfers", ("pending_settlements", "settlement_stats")),
+    "risk": ("risk", ("risk_scores",)),
+    "warnings": ("warnings", ("warning_levels", "warning_counts", "excluded_members")),
+    "explanation": ("explanation", ("explanation",)),
+    "governance": ("governance", ("governance_actions",)),
+    "onchain": ("onchain", ("onchain_results",)),
+}
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.post("/calculate/stream")
+async def calculate_settlement_stream(req: SettlementRequest, user_id: str, db: Session = Depends(get_db)):
+    """
+    Same as /calculate, streamed as server-sent events: one event per graph
+    node as it finishes (balances, transfers, risk, warnings, ...), "token"
+    events while a rich explanation is written, then "done" with the stored
+    settlement (or "error").
+    """
+    
+    group, settings, graph_variant = await run_quick(_checked_request, req, user_id, db)
+    group_id = group.id
+    state = await run_blocking(settlement_state, db, group, settings)
+    counts_before = dict(state["warning_counts"])
+    
+    async def events():
+        result = dict(state)
+        try:
+            async for mode, chunk in stream_settlement_graph(state, graph_variant):
+                if mode == "custom":
+                    yield _sse("token", chunk)
+                    continue
+                for node, update in chunk.items():
+                    update = update or {}
+                    result.update(update)
+                    event, keys = STREAM_EVENTS.get(node, (node, tuple(update)))
+                    yield _sse(event, {key: update.get(key) for key in keys if key in update})
+            
+            settlement = await run_blocking(save_settlement, db, group_id, result, counts_before, actor_id=user_id)
+            yield _sse("done", _settlement_response(settlement).model_dump())
+        except Exception as e:
+            await run_quick(db.rollback)
+            logger.error(f"Settlement stream failed: {str(e)}", exc_info=True)
+            yield _sse("error", {"detail": f"Settlement calculation failed: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/jobs", response_model=SettlementJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_settlement_job(
+    req: SettlementRequest,
+    user_id: str,
+    db: Session = Depends(get_db),
+    jobs: SettlementJobQueue = Depends(get_job_queue)
+):
+    """Queue a settlement calculation and return at once; poll GET /jobs/{job_id} for the result"""
+    
+    group, settings, graph_variant = await run_quick(_checked_request, req, user_id, db)
+    
+    # One job per group at a time: a second request gets the queued / running one
+    job, created = await run_quick(jobs.submit, group.id, user_id, settings, graph_variant)
+    return SettlementJobResponse(**job, deduplicated=not created)
+
+
+@router.get("/jobs/{job_id}", response_model=SettlementJobResponse)
+async def get_settlement_job(
+    job_id: str,
+    user_id: str,
+    db: Session = Depends(get_db),
+    jobs: SettlementJobQueue = Depends(get_job_queue)
+):
+    """Status of a queued settlement job, with the settlement once it has succeeded"""
+    
+    job = await run_quick(jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    is_member = await run_quick(_is_member, db, job["group_id"], user_id)
+    if not is_member:
+        raise HTTPException(status_code=403, detail="Not authorized to view this job")
+    
+    return SettlementJobResponse(**job)
+
+
+@router.post("/batch", response_model=BatchSettlementResponse)
+async def batch_settlement(req: BatchSettlementRequest, user_id: str, db: Session = Depends(get_db)):
+    """Settle many groups at once (deterministic stages only, no LLM / on-chain)"""
+    
+    # Due-group scan, ownership check and the run itself all go to the batch
+    # thread: neither the event loop nor the settlement pool waits on them
+    summary = await run_batch(_run_batch, req, user_id, db)
+    return BatchSettlementResponse(**summary)
+
+
+def _run_batch(req: BatchSettlementRequest, user_id: str, db: Session):
+    settlement_mode = req.settlement_mode or "greedy"
+    if settlement_mode not in SETTLEMENT_MODES:
+        raise HTTPException(status_code=400, detail=f"settlement_mode must be one of {', '.join(SETTLEMENT_MODES)}")
+    
+    # Only groups the caller created, same rule as execute_settlement
+    group_ids = req.group_ids if req.group_ids is not None else due_group_ids(db)
+    owned = {
+        row.id for row in db.query(Group.id).filter(
+            Group.id.in_(group_ids),
+            Group.creator_id == user_id
+        )
+    }
+    if req.group_ids is not None and len(owned) != len(set(req.group_ids)):
+        raise HTTPException(status_code=403, detail="Only group creator can batch-settle a group")
+    
+    return run_batch_settlement(
+        db,
+        group_ids=sorted(owned),
+        max_workers=clamp_workers(req.max_workers),
+        settings={"settlement_mode": settlement_mode},
+        actor_id=user_id
+    )
+
+
+@router.get("/plan/{group_id}", response_model=SettlementPlanResponse)
+def get_settlement_plan(group_id: str, user_id: str, currency: str = DEFAULT_CURRENCY, db: Session = Depends(get_db)):
+    """Get the group's maintained settlement plan (updated on every expense insert)"""
+    
+    is_member = db.query(GroupMember).filter(
+        GroupMember.group_id == group_id,
+        GroupMember.user_id == user_id
+    ).first()
+    if not is_member:
+        raise HTTPException(status_code=403, detail="Not a member of this group")
+    
+    plan = get_plan(db, group_id, currency.upper())
+    db.commit()
+    
+    return SettlementPlanResponse(
+        group_id=plan.group_id,
+        currency=plan.currency,
+        balances=plan.balances or {},
+        transfers=plan.transfers or [],
+        version=plan.version or 0,
+        updated_at=plan.updated_at
+    )
+
+
 @router.get("/{settlement_id}", response_model=SettlementDetailResponse)
-async def get_settlement(settlement_id: str, user_id: str, db: Session = Depends(get_db)):
+def get_settlement(settlement_id: str, user_id: str, db: Session = Depends(get_db)):
     """Get settlement details"""
     
     settlement = db.query(Settlement).filter(Settlement.id == settlement_id).first()
@@ -144,7 +288,7 @@ async def get_settlement(settlement_id: str, user_id: str, db: Session = Depends
 
 
 @router.post("/{settlement_id}/execute")
-async def execute_settlement(settlement_id: str, user_id: str, db: Session = Depends(get_db)):
+def execute_settlement(settlement_id: str, user_id: str, db: Session = Depends(get_db)):
     """Execute the settlement on Algorand"""
     
     settlement = db.query(Settlement).filter(Settlement.id == settlement_id).first()
@@ -172,6 +316,11 @@ async def execute_settlement(settlement_id: str, user_id: str, db: Session = Dep
         expenses = db.query(Expense).filter(Expense.group_id == settlement.group_id).all()
         for exp in expenses:
             exp.settled = True
+        invalidate_plans(db, settlement.group_id)
+        clear_member_balances(db, settlement.group_id)
+        
+        # Payment history + risk aggregates for every debtor, same transaction
+        record_settlement_payments(db, settlement)
         
         db.commit()
         
@@ -181,7 +330,9 @@ async def execute_settlement(settlement_id: str, user_id: str, db: Session = Dep
             "message": "Settlement executed successfully"
         }
     except Exception as e:
+        db.rollback()
         settlement.status = "failed"
+        record_missed_settlement(db, settlement)
         db.commit()
         logger.error(f"Settlement execution failed: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -0,0 +1,11 @@
+from . import (
+    expense_stream, settlement_plan, fx_rates, global_netting, group_state, batch_settlement, member_balances,
+    risk_features, risk_rescoring, warning_counts, settlement_runner, settlement_calculation,
+    settlement_jobs
+)
+
+__all__ = [
+    'expense_stream', 'settlement_plan', 'fx_rates', 'global_netting', 'group_state', 'batch_settlement', 'member_balances',
+    'risk_features', 'risk_rescoring', 'warning_counts', 'settlement_runner',
+    'settlement_calculation', 'settlement_jobs'
+]
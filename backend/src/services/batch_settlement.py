@@ -0,0 +1,198 @@
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from concurrent.futures import ProcessPoolExecutor
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+
+from src.models.models import Group, GroupMember, Expense, Settlement
+from src.services.expense_stream import stream_group_balances
+from src.services.fx_rates import get_rate_table
+from src.services.group_state import build_group_state
+from src.services.risk_features import load_risk_features
+from src.services.warning_counts import persist_warning_counts, warning_count_changes
+from ai_agent.pipeline import run_deterministic_pipeline
+from ai_agent.explanation import render_explanation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = os.cpu_count() or 2
+
+
+def clamp_workers(max_workers: Optional[int]) -> int:
+    """Worker processes to use: the stages are CPU-bound, so never more than the CPUs"""
+    return max(1, min(max_workers or DEFAULT_MAX_WORKERS, DEFAULT_MAX_WORKERS))
+
+
+def due_group_ids(db: Session) -> List[str]:
+    """Groups with at least one unsettled expense"""
+    rows = db.query(Expense.group_id).filter(Expense.settled == False).distinct()
+    return [row.group_id for row in rows]
+
+
+def load_group_states(db: Session, group_ids: List[str], settings: Optional[Dict] = None) -> List[Dict]:
+    """
+    Initial graph states for many groups from bulk queries. Expenses are
+    streamed and folded into balances, so states carry only aggregates.
+    """
+    groups = db.query(Group).filter(Group.id.in_(group_ids)).all()
+
+    members = defaultdict(list)
+    member_rows = db.query(
+        GroupMember.group_id, GroupMember.user_id, GroupMember.wallet_address,
+        GroupMember.trust_score, GroupMember.joined_at, GroupMember.warning_count,
+        GroupMember.risk_score, GroupMember.warning_level
+    ).filter(GroupMember.group_id.in_(group_ids))
+    for row in member_rows:
+        members[row.group_id].append(row)
+
+    balances = defaultdict(dict)
+    for (group_id, currency), group_balances in stream_group_balances(db, group_ids).items():
+        balances[group_id][currency] = group_balances
+
+    features = load_risk_features(
+        db, {row.user_id for rows in members.values() for row in rows},
+        mode=(settings or {}).get("risk_mode", "lifetime")
+    )
+
+    fx_table = get_rate_table(db)
+    return [
+        build_group_state(
+            group, members[group.id], [], fx_table, settings,
+            balances_by_currency=balances[group.id],
+            risk_features={row.user_id: features[row.user_id] for row in members[group.id]}
+        )
+        for group in groups
+    ]
+
+
+def _run_one(state: Dict) -> Dict:
+    """Worker entry point: deterministic stages only, errors returned not raised"""
+    try:
+        return {"group_id": state["group_id"], "state": run_deterministic_pipeline(state)}
+    except Exception as e:
+        return {"group_id": state["group_id"], "error": str(e)}
+
+
+def run_batch_settlement(
+    db: Session,
+    group_ids: Optional[List[str]] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    settings: Optional[Dict] = None,
+    actor_id: Optional[str] = None
+) -> Dict:
+    """
+    End-of-month batch: settle many groups in one pass.
+
+    Data is loaded with bulk queries, compute_balances / tex / risk /
+    warnings run across a process pool (no LLM explanation, governance or
+    on-chain stages; the explanation is the template report), and all
+    Settlement rows are written with one bulk INSERT. Changed warning
+    counts are written back in one bulk UPDATE.
+    group_ids=None means every group with unsettled expenses.
+
+    Output:
+        {
+            "groups": {group_id: {"status": "ok" / "failed", "settlement_id" / "error", "transfer_count"}},
+            "succeeded": int, "failed": int,
+            "elapsed_seconds": float, "groups_per_second": float
+        }
+    """
+
+    start = time.perf_counter()
+    if group_ids is None:
+        group_ids = due_group_ids(db)
+
+    states = load_group_states(db, group_ids, settings)
+    found = {state["group_id"] for state in states}
+    counts_before = {state["group_id"]: dict(state["warning_counts"]) for state in states}
+
+    max_workers = clamp_workers(max_workers)
+    if max_workers > 1 and len(states) > 1:
+        chunksize = max(1, len(states) // (max_workers * 4))
+        # spawn, not fork: this may run on a thread of the API process, and
+        # forking a multi-threaded process can copy held locks into the child
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(states)), mp_context=context) as pool:
+            outcomes = list(pool.map(_run_one, states, chunksize=chunksize))
+    else:
+        outcomes = [_run_one(state) for state in states]
+
+    report = {gid: {"status": "failed", "error": "Group not found"} for gid in group_ids if gid not in found}
+    rows = []
+    warning_changes = []
+    now = datetime.utcnow()
+    for outcome in outcomes:
+        if "error" in outcome:
+            report[outcome["group_id"]] = {"status": "failed", "error": outcome["error"]}
+            continue
+
+        result = outcome["state"]
+        settlement_id = str(uuid.uuid4())
+        rows.append({
+            "id": settlement_id,
+            "group_id": outcome["group_id"],
+            "settlements": result.get("pending_settlements", []),
+            "risk_scores": result.get("risk_scores", {}),
+            "warnings": result.get("warning_levels", {}),
+            "excluded_members": result.get("excluded_members", []),
+            "governance_actions": {},
+            "onchain_results": {},
+            "explanation": render_explanation(result),
+            "status": "pending",
+            "created_at": now
+        })
+        warning_changes.extend(warning_count_changes(outcome["group_id"], counts_before[outcome["group_id"]], result))
+        report[outcome["group_id"]] = {
+            "status": "ok",
+            "settlement_id": settlement_id,
+            "transfer_count": len(result.get("pending_settlements", []))
+        }
+
+    if rows:
+        db.execute(insert(Settlement), rows)
+        persist_warning_counts(db, warning_changes, actor_id)
+        db.commit()
+
+    elapsed = time.perf_counter() - start
+    succeeded = sum(1 for r in report.values() if r["status"] == "ok")
+    logger.info(f"Batch settlement: {succeeded}/{len(report)} groups in {elapsed:.2f}s")
+
+    return {
+        "groups": report,
+        "succeeded": succeeded,
+        "failed": len(report) - succeeded,
+        "elapsed_seconds": round(elapsed, 3),
+        "groups_per_second": round(len(report) / elapsed, 1) if elapsed else 0.0
+    }
+
+
+if __name__ == "__main__":
+    # python -m src.services.batch_settlement [--all-due | group_id ...] [--workers N]
+    from src.config.db import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Batch settlement across many groups")
+    parser.add_argument("group_ids", nargs="*", help="groups to settle")
+    parser.add_argument("--all-due", action="store_true", help="every group with unsettled expenses")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS)
+    parser.add_argument("--mode", default="greedy", help="settlement_mode (greedy / min_transfers / min_fee)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        summary = run_batch_settlement(
+            db,
+            group_ids=None if args.all_due or not args.group_ids else args.group_ids,
+            max_workers=args.workers,
+            settings={"settlement_mode": args.mode}
+        )
+        print(json.dumps(summary, indent=2, default=str))
+    finally:
+        db.close()
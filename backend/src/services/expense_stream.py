@@ -0,0 +1,88 @@
+from sqlalchemy.orm import Session
+from collections import defaultdict
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.models.models import GroupMember, Expense
+from ai_agent.tex_array import BalanceAccumulator
+
+EXPENSE_BATCH_SIZE = 5000
+
+
+def expense_split_dict(row) -> Dict:
+    """Expense row (ORM object or column row) -> the dict the balance engines read"""
+    return {
+        "expense_id": row.id,
+        "paid_by": row.paid_by_id,
+        "amount_minor": row.amount_minor,
+        "split_type": row.split_type or "equal",
+        "involved_members": row.split_among or [],
+        "split_shares": row.split_shares or {}
+    }
+
+
+def iter_chunks(rows: Iterable, size: int) -> Iterator[list]:
+    """Consume an iterator `size` items at a time"""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def stream_group_balances(
+    db: Session,
+    group_ids: Optional[List[str]] = None,
+    currency: Optional[str] = None,
+    exclude_expense_id: Optional[str] = None,
+    batch_size: int = EXPENSE_BATCH_SIZE
+) -> Dict[Tuple[str, str], Dict[str, int]]:
+    """
+    (group_id, currency) -> {user_id: balance in minor units} for unsettled
+    expenses, folded in chunk by chunk.
+
+    Expenses are read with a server-side cursor (yield_per) and each chunk
+    is added to a per-group BalanceAccumulator, then dropped; only the
+    O(members) balance arrays stay in memory, however many expenses a group
+    has accumulated. Members come from one bulk query.
+    """
+
+    member_query = db.query(GroupMember.group_id, GroupMember.user_id)
+    expense_query = db.query(
+        Expense.id, Expense.group_id, Expense.paid_by_id, Expense.amount_minor, Expense.currency,
+        Expense.split_type, Expense.split_among, Expense.split_shares
+    ).filter(Expense.settled == False)
+    if group_ids is not None:
+        member_query = member_query.filter(GroupMember.group_id.in_(group_ids))
+        expense_query = expense_query.filter(Expense.group_id.in_(group_ids))
+    if currency is not None:
+        expense_query = expense_query.filter(Expense.currency == currency)
+    if exclude_expense_id is not None:
+        expense_query = expense_query.filter(Expense.id != exclude_expense_id)
+
+    members: Dict[str, List[str]] = defaultdict(list)
+    for row in member_query:
+        members[row.group_id].append(row.user_id)
+
+    accumulators: Dict[Tuple[str, str], BalanceAccumulator] = {}
+    for chunk in iter_chunks(expense_query.yield_per(batch_size), batch_size):
+        by_key: Dict[Tuple[str, str], List[dict]] = defaultdict(list)
+        # Positional unpacking: named access on result rows dominates at this volume
+        for expense_id, group_id, paid_by, amount_minor, row_currency, split_type, among, shares in chunk:
+            if group_id in members:
+                by_key[(group_id, row_currency)].append({
+                    "expense_id": expense_id,
+                    "paid_by": paid_by,
+                    "amount_minor": amount_minor,
+                    "split_type": split_type or "equal",
+                    "involved_members": among or [],
+                    "split_shares": shares or {}
+                })
+
+        for key, expenses in by_key.items():
+            if key not in accumulators:
+                accumulators[key] = BalanceAccumulator(members[key[0]], key[1])
+            accumulators[key].add(expenses)
+
+    return {key: accumulator.balances() for key, accumulator in accumulators.items()}
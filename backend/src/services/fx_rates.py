@@ -0,0 +1,48 @@
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from typing import Dict, Optional
+import uuid
+
+from src.models.models import FxRate
+from ai_agent.fx import FxRateCache, FxRateTable
+from ai_agent.money import DEFAULT_CURRENCY
+
+# Shared across requests; refreshed from the database after the TTL
+fx_cache = FxRateCache()
+
+
+def load_rate_table(db: Session, version: Optional[int] = None) -> Optional[FxRateTable]:
+    """Load one version of the FX table (latest by default); None if no rates stored"""
+    if version is None:
+        version = db.query(func.max(FxRate.version)).scalar()
+    if version is None:
+        return None
+
+    rows = db.query(FxRate).filter(FxRate.version == version).all()
+    if not rows:
+        return None
+
+    return FxRateTable(
+        {row.currency: row.rate for row in rows},
+        version=version,
+        pivot=rows[0].pivot
+    )
+
+
+def get_rate_table(db: Session) -> Optional[FxRateTable]:
+    """Latest FX table from the in-memory cache"""
+    return fx_cache.get(lambda: load_rate_table(db))
+
+
+def publish_rates(db: Session, rates: Dict[str, str], pivot: str = DEFAULT_CURRENCY) -> int:
+    """Store a new version of the FX table and drop the cached one. Returns the new version."""
+    latest = db.query(func.max(FxRate.version)).scalar() or 0
+    version = latest + 1
+
+    db.add_all([
+        FxRate(id=str(uuid.uuid4()), version=version, currency=currency.upper(), pivot=pivot.upper(), rate=rate)
+        for currency, rate in rates.items()
+    ])
+    db.commit()
+    fx_cache.invalidate()
+    return version
@@ -0,0 +1,147 @@
+from sqlalchemy.orm import Session
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import logging
+import sys
+import time
+
+from src.models.models import GroupMember
+from src.services.expense_stream import stream_group_balances
+from ai_agent.money import from_minor
+from ai_agent.tex_array import tex_optimize_array
+
+logger = logging.getLogger(__name__)
+
+
+def groups_shared_by(db: Session, user_ids: Iterable[str]) -> List[str]:
+    """Every group that at least one user of the cohort belongs to"""
+    rows = db.query(GroupMember.group_id).filter(GroupMember.user_id.in_(list(user_ids))).distinct()
+    return [row.group_id for row in rows]
+
+
+def net_across_groups(group_balances: Dict[Tuple[str, str], Dict[str, int]]) -> Dict:
+    """
+    Cross-group netting.
+
+    Input:
+        (group_id, currency) -> {user_id: balance in minor units}
+
+    Output:
+        {
+            "transfers": [{from, to, amount, amount_minor, currency,
+                           "from_groups": {group_id: minor}, "to_groups": {group_id: minor}}],
+            "netted": {currency: {user_id: {group_id: minor offset internally}}},
+            "group_transfer_count": int,   # transfers if every group settled on its own
+            "transfer_count": int
+        }
+
+    A user's balances in all groups are summed first, so paying A in one
+    group while A pays them in another cancels out. Each global transfer is
+    attributed back to the debtor's owing groups and the creditor's owed
+    groups (largest first); the part of a user's group balances that
+    cancelled against their other groups is reported under "netted".
+    """
+
+    by_currency: Dict[str, Dict[str, List[Tuple[str, int]]]] = defaultdict(lambda: defaultdict(list))
+    group_transfer_count = 0
+    for (group_id, currency), balances in group_balances.items():
+        nonzero = 0
+        for user_id, balance in balances.items():
+            if balance != 0:
+                by_currency[currency][user_id].append((group_id, balance))
+                nonzero += 1
+        group_transfer_count += max(nonzero - 1, 0)
+
+    transfers = []
+    netted = {}
+    for currency, user_groups in by_currency.items():
+        net = {uid: sum(b for _, b in entries) for uid, entries in user_groups.items()}
+        queues, netted[currency] = _attribution_queues(user_groups, net)
+
+        for t in tex_optimize_array({uid: from_minor(v, currency) for uid, v in net.items() if v}, currency):
+            t["from_groups"] = _consume(queues[t["from"]], t["amount_minor"])
+            t["to_groups"] = _consume(queues[t["to"]], t["amount_minor"])
+            transfers.append(t)
+
+    return {
+        "transfers": transfers,
+        "netted": netted,
+        "group_transfer_count": group_transfer_count,
+        "transfer_count": len(transfers)
+    }
+
+
+def _attribution_queues(user_groups: Dict[str, List[Tuple[str, int]]], net: Dict[str, int]):
+    """
+    Per user, the group amounts that back their net position: for a net
+    debtor the owing groups left after offsetting their owed groups, and
+    vice versa.
+    """
+
+    queues = {}
+    netted = {}
+    for user_id, entries in user_groups.items():
+        sign = -1 if net[user_id] < 0 else 1
+        same = sorted([(g, abs(b)) for g, b in entries if b * sign > 0], key=lambda e: (-e[1], e[0]))
+        opposite = [(g, abs(b)) for g, b in entries if b * sign < 0]
+
+        offset = sum(b for _, b in opposite)
+        user_netted = {g: b for g, b in opposite}
+
+        queue = []
+        for group_id, amount in same:
+            used = min(amount, offset)
+            offset -= used
+            if used:
+                user_netted[group_id] = user_netted.get(group_id, 0) + used
+            if amount - used:
+                queue.append([group_id, amount - used])
+
+        queues[user_id] = queue
+        if user_netted:
+            netted[user_id] = user_netted
+
+    return queues, netted
+
+
+def _consume(queue: List[list], amount: int) -> Dict[str, int]:
+    taken = {}
+    while amount > 0 and queue:
+        group_id, available = queue[0]
+        used = min(available, amount)
+        taken[group_id] = taken.get(group_id, 0) + used
+        amount -= used
+        if used == available:
+            queue.pop(0)
+        else:
+            queue[0][1] -= used
+    return taken
+
+
+def run_global_netting(db: Session, user_ids: Optional[List[str]] = None, group_ids: Optional[List[str]] = None) -> Dict:
+    """Batch job: net every group a cohort shares (or the given / all groups)"""
+    start = time.perf_counter()
+    if user_ids is not None:
+        group_ids = groups_shared_by(db, user_ids)
+
+    result = net_across_groups(stream_group_balances(db, group_ids))
+    result["elapsed_seconds"] = round(time.perf_counter() - start, 3)
+
+    logger.info(
+        f"Global netting: {result['group_transfer_count']} per-group transfers -> "
+        f"{result['transfer_count']} in {result['elapsed_seconds']}s"
+    )
+    return result
+
+
+if __name__ == "__main__":
+    # python -m src.services.global_netting [user_id ...]
+    from src.config.db import SessionLocal
+
+    db = SessionLocal()
+    try:
+        cohort = sys.argv[1:] or None
+        print(json.dumps(run_global_netting(db, user_ids=cohort), indent=2, default=str))
+    finally:
+        db.close()
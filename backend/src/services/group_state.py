@@ -0,0 +1,76 @@
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from ai_agent.fx import FxRateTable
+from ai_agent.money import DEFAULT_CURRENCY, from_minor
+from ai_agent.state import GroupState
+
+
+def build_group_state(
+    group,
+    members: Iterable,
+    expenses: Iterable,
+    fx_table: Optional[FxRateTable] = None,
+    settings: Optional[Dict] = None,
+    balances_by_currency: Optional[Dict[str, Dict[str, int]]] = None,
+    risk_features: Optional[Dict[str, Dict[str, int]]] = None
+) -> GroupState:
+    """
+    Initial LangGraph state for one group. `members` / `expenses` may be ORM
+    objects or column rows with the same attribute names. Pass
+    `balances_by_currency` (e.g. the materialized member balances) with no
+    expenses to skip recomputing balances from expense rows, and
+    `risk_features` (per-user risk aggregates) for risk_node. Warning counts
+    are seeded from each member's persisted warning_count, and the last
+    persisted risk score / level for change-driven warnings.
+    """
+
+    members = list(members)
+    return {
+        "group_id": group.id,
+        "group_name": group.name,
+        "members": [
+            {
+                "user_id": m.user_id,
+                "wallet_address": m.wallet_address or "",
+                "trust_score": m.trust_score,
+                "joined_at": m.joined_at
+            }
+            for m in members
+        ],
+        "expenses": [
+            {
+                "expense_id": e.id,
+                "paid_by": e.paid_by_id,
+                "amount": from_minor(e.amount_minor, e.currency),
+                "amount_minor": e.amount_minor,
+                "currency": e.currency,
+                "split_type": e.split_type or "equal",
+                "involved_members": e.split_among or [],
+                "split_shares": e.split_shares or {},
+                "description": e.description or "",
+                "timestamp": e.created_at
+            }
+            for e in expenses
+        ],
+        "currency_default": group.currency_default or DEFAULT_CURRENCY,
+        "fx_rates": fx_table.to_dict() if fx_table else None,
+        "settings": settings or {},
+        "balances": {},
+        "balances_minor": {},
+        "balances_by_currency": balances_by_currency or {},
+        "pending_settlements": [],
+        "risk_features": risk_features or {},
+        "risk_scores": {},
+        "warning_levels": {},
+        "excluded_members": [],
+        "last_action": None,
+        "explanation": None,
+        "last_updated": datetime.utcnow(),
+        "warning_counts": {m.user_id: m.warning_count or 0 for m in members},
+        "previous_risk_scores": {m.user_id: m.risk_score for m in members if m.risk_score is not None},
+        "previous_warning_levels": {m.user_id: m.warning_level or "NONE" for m in members},
+        "warning_changes": None,
+        "governance_actions": {},
+        "onchain_results": {}
+    }
@@ -0,0 +1,203 @@
+from sqlalchemy.orm import Session
+from collections import defaultdict
+from typing import Dict, List, Optional
+import argparse
+import json
+import logging
+import time
+import uuid
+
+from src.models.models import Expense, Group, GroupMemberBalance
+from src.services.settlement_plan import expense_deltas, group_member_ids
+from src.services.expense_stream import stream_group_balances
+
+logger = logging.getLogger(__name__)
+
+
+def apply_expense_balances(db: Session, expense: Expense, sign: int = 1) -> Dict[str, int]:
+    """
+    Add one expense (sign=1) or take it back out (sign=-1) of the group's
+    materialized balances. Call in the same transaction as the expense write.
+    Returns the applied deltas.
+
+    A group not yet marked balances_materialized (created before the table
+    existed) is rebuilt from its other unsettled expenses first, like
+    build_plan does for the plan, so the first write does not stand in for
+    the whole history. Groups whose balances net to zero have no rows but
+    keep the flag, so they are not rebuilt again.
+    """
+
+    if not balances_materialized(db, expense.group_id):
+        # Added: rebuild without it, then apply the delta. Reverted: it is
+        # still stored, so the rebuild counts it and the delta takes it out.
+        rebuild_member_balances(db, expense.group_id, exclude_expense_id=expense.id if sign > 0 else None)
+        db.flush()
+
+    deltas = {
+        uid: sign * delta
+        for uid, delta in expense_deltas(expense, group_member_ids(db, expense.group_id)).items()
+        if delta
+    }
+    if not deltas:
+        return deltas
+
+    rows = db.query(GroupMemberBalance).filter(
+        GroupMemberBalance.group_id == expense.group_id,
+        GroupMemberBalance.currency == expense.currency,
+        GroupMemberBalance.user_id.in_(list(deltas))
+    ).with_for_update().all()
+    existing = {row.user_id: row for row in rows}
+
+    for uid, delta in deltas.items():
+        row = existing.get(uid)
+        if row is None:
+            db.add(GroupMemberBalance(
+                id=str(uuid.uuid4()),
+                group_id=expense.group_id,
+                user_id=uid,
+                currency=expense.currency,
+                balance_minor=delta
+            ))
+        else:
+            row.balance_minor += delta
+    return deltas
+
+
+def revert_expense_balances(db: Session, expense: Expense) -> Dict[str, int]:
+    """Undo an expense's effect (call before deleting it)"""
+    return apply_expense_balances(db, expense, sign=-1)
+
+
+def clear_member_balances(db: Session, group_id: str) -> None:
+    """Every unsettled expense of the group was settled: nothing is owed any more"""
+    db.query(GroupMemberBalance).filter(GroupMemberBalance.group_id == group_id).delete(synchronize_session=False)
+
+
+def balances_materialized(db: Session, group_id: str) -> bool:
+    """Whether the group's rows are kept in step (set by the first rebuild)"""
+    return bool(db.query(Group.balances_materialized).filter(Group.id == group_id).scalar())
+
+
+def rebuild_member_balances(db: Session, group_id: str, exclude_expense_id: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+    """
+    Full recompute from the group's unsettled expenses. Needed when the
+    equal-split basis changes (members added / removed) and for repairs.
+    Marks the group balances_materialized.
+    """
+
+    clear_member_balances(db, group_id)
+    db.query(Group).filter(Group.id == group_id).update({Group.balances_materialized: True})
+    by_currency: Dict[str, Dict[str, int]] = {}
+    for (_, currency), balances in stream_group_balances(db, [group_id], exclude_expense_id=exclude_expense_id).items():
+        by_currency[currency] = {uid: v for uid, v in balances.items() if v}
+        for uid, v in by_currency[currency].items():
+            db.add(GroupMemberBalance(
+                id=str(uuid.uuid4()),
+                group_id=group_id,
+                user_id=uid,
+                currency=currency,
+                balance_minor=v
+            ))
+    return by_currency
+
+
+def load_member_balances(db: Session, group_id: str) -> Dict[str, Dict[str, int]]:
+    """
+    currency -> {user_id: balance in minor units}, read from O(members) rows.
+    Groups not yet materialized (created before the table existed) are
+    rebuilt once.
+    """
+
+    if not balances_materialized(db, group_id):
+        return rebuild_member_balances(db, group_id)
+
+    rows = db.query(
+        GroupMemberBalance.user_id, GroupMemberBalance.currency, GroupMemberBalance.balance_minor
+    ).filter(GroupMemberBalance.group_id == group_id).all()
+
+    by_currency: Dict[str, Dict[str, int]] = defaultdict(dict)
+    for row in rows:
+        by_currency[row.currency][row.user_id] = row.balance_minor
+    return dict(by_currency)
+
+
+def reconcile_member_balances(db: Session, group_ids: Optional[List[str]] = None, repair: bool = False) -> Dict:
+    """
+    Reconciliation job: compare the materialized balances with a full
+    recompute from unsettled expenses (both loaded in bulk).
+
+    Output:
+        {
+            "checked": int,    # groups compared
+            "mismatched": {group_id: {currency: {user_id: {"materialized": int, "expected": int}}}},
+            "repaired": [group_id],
+            "elapsed_seconds": float
+        }
+    """
+
+    start = time.perf_counter()
+
+    expected: Dict[str, Dict[str, Dict[str, int]]] = defaultdict(dict)
+    for (group_id, currency), balances in stream_group_balances(db, group_ids).items():
+        expected[group_id][currency] = {uid: v for uid, v in balances.items() if v}
+
+    materialized: Dict[str, Dict[str, Dict[str, int]]] = defaultdict(lambda: defaultdict(dict))
+    query = db.query(
+        GroupMemberBalance.group_id, GroupMemberBalance.user_id,
+        GroupMemberBalance.currency, GroupMemberBalance.balance_minor
+    )
+    if group_ids is not None:
+        query = query.filter(GroupMemberBalance.group_id.in_(group_ids))
+    for row in query:
+        if row.balance_minor:
+            materialized[row.group_id][row.currency][row.user_id] = row.balance_minor
+
+    checked = set(expected) | set(materialized)
+    mismatched = {}
+    for group_id in checked:
+        diffs = {}
+        for currency in set(expected[group_id]) | set(materialized[group_id]):
+            want = expected[group_id].get(currency, {})
+            have = materialized[group_id].get(currency, {})
+            wrong = {
+                uid: {"materialized": have.get(uid, 0), "expected": want.get(uid, 0)}
+                for uid in set(want) | set(have)
+                if have.get(uid, 0) != want.get(uid, 0)
+            }
+            if wrong:
+                diffs[currency] = wrong
+        if diffs:
+            mismatched[group_id] = diffs
+
+    repaired = []
+    if mismatched:
+        logger.warning(f"Member balances out of step for {len(mismatched)} group(s): {sorted(mismatched)}")
+        if repair:
+            for group_id in sorted(mismatched):
+                rebuild_member_balances(db, group_id)
+                repaired.append(group_id)
+            db.commit()
+
+    return {
+        "checked": len(checked),
+        "mismatched": mismatched,
+        "repaired": repaired,
+        "elapsed_seconds": round(time.perf_counter() - start, 3)
+    }
+
+
+if __name__ == "__main__":
+    # python -m src.services.member_balances [group_id ...] [--repair]
+    from src.config.db import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Reconcile materialized member balances")
+    parser.add_argument("group_ids", nargs="*", help="groups to check (default: all)")
+    parser.add_argument("--repair", action="store_true", help="rebuild groups that do not match")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report = reconcile_member_balances(db, group_ids=args.group_ids or None, repair=args.repair)
+        print(json.dumps(report, indent=2, default=str))
+    finally:
+        db.close()
@@ -0,0 +1,145 @@
+from sqlalchemy.orm import Session
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+import uuid
+
+from src.models.models import Settlement, PaymentEvent, MemberRiskStats
+from ai_agent.risk import bump_decayed_counters, decay_counters
+
+# A settlement leg paid later than this after the settlement was calculated counts as late
+PAYMENT_GRACE_PERIOD = timedelta(days=7)
+
+RISK_FEATURES = ("payment_count", "late_count", "missed_settlements", "warning_count")
+RISK_MODES = ("lifetime", "decayed")
+
+# Lifetime counter -> its exponentially decayed column on MemberRiskStats
+DECAYED_COLUMNS = {
+    "payment_count": "decayed_payments",
+    "late_count": "decayed_late",
+    "missed_settlements": "decayed_missed",
+    "warning_count": "decayed_warnings"
+}
+
+
+def _stats_for_update(db: Session, user_ids: Iterable[str]) -> Dict[str, MemberRiskStats]:
+    """Locked aggregate rows for the users, created (zeroed) where missing"""
+    user_ids = set(user_ids)
+    rows = {
+        row.user_id: row
+        for row in db.query(MemberRiskStats).filter(MemberRiskStats.user_id.in_(list(user_ids))).with_for_update()
+    }
+    for user_id in user_ids - set(rows):
+        rows[user_id] = MemberRiskStats(
+            user_id=user_id,
+            **dict.fromkeys(RISK_FEATURES, 0),
+            **dict.fromkeys(DECAYED_COLUMNS.values(), 0.0)
+        )
+        db.add(rows[user_id])
+    return rows
+
+
+def _decayed(row: MemberRiskStats) -> Dict[str, float]:
+    return {name: getattr(row, column) or 0.0 for name, column in DECAYED_COLUMNS.items()}
+
+
+def bump_risk_stats(row: MemberRiskStats, event_at: datetime, **increments: int) -> None:
+    """Add one event to both the lifetime and the decayed counters (constant time)"""
+    for name, amount in increments.items():
+        setattr(row, name, (getattr(row, name) or 0) + amount)
+
+    decayed, as_of = bump_decayed_counters(_decayed(row), row.decayed_at, event_at, increments)
+    for name, value in decayed.items():
+        setattr(row, DECAYED_COLUMNS[name], value)
+    row.decayed_at = as_of
+
+
+def record_settlement_payments(db: Session, settlement: Settlement, paid_at: Optional[datetime] = None) -> int:
+    """
+    Record every transfer of an executed settlement as a paid event for its
+    debtor and bump their aggregates. Call in the same transaction as the
+    status change. Returns the number of events written.
+    """
+
+    paid_at = paid_at or settlement.executed_at or datetime.utcnow()
+    due_at = (settlement.created_at or paid_at) + PAYMENT_GRACE_PERIOD
+    is_late = paid_at > due_at
+
+    transfers = settlement.settlements or []
+    for transfer in transfers:
+        db.add(PaymentEvent(
+            id=str(uuid.uuid4()),
+            settlement_id=settlement.id,
+            group_id=settlement.group_id,
+            user_id=transfer["from"],
+            to_user_id=transfer["to"],
+            amount_minor=transfer.get("amount_minor", 0),
+            currency=transfer.get("currency"),
+            kind="paid",
+            is_late=is_late,
+            due_at=due_at,
+            paid_at=paid_at
+        ))
+
+    counts = Counter(transfer["from"] for transfer in transfers)
+    for user_id, row in _stats_for_update(db, counts).items():
+        bump_risk_stats(row, paid_at, payment_count=counts[user_id], late_count=counts[user_id] if is_late else 0)
+    return len(transfers)
+
+
+def record_missed_settlement(db: Session, settlement: Settlement) -> int:
+    """
+    The settlement could not be executed: one missed event per debtor and
+    one missed settlement on their aggregates. Returns the debtor count.
+    """
+
+    due_at = (settlement.created_at or datetime.utcnow()) + PAYMENT_GRACE_PERIOD
+    debtors = sorted({transfer["from"] for transfer in settlement.settlements or []})
+    for user_id in debtors:
+        db.add(PaymentEvent(
+            id=str(uuid.uuid4()),
+            settlement_id=settlement.id,
+            group_id=settlement.group_id,
+            user_id=user_id,
+            kind="missed",
+            due_at=due_at
+        ))
+
+    missed_at = datetime.utcnow()
+    for row in _stats_for_update(db, debtors).values():
+        bump_risk_stats(row, missed_at, missed_settlements=1)
+    return len(debtors)
+
+
+def record_warnings(db: Session, strikes: Dict[str, int], warned_at: Optional[datetime] = None) -> None:
+    """Add newly issued warning strikes (user_id -> count) to the users' aggregates"""
+    warned_at = warned_at or datetime.utcnow()
+    for user_id, row in _stats_for_update(db, strikes).items():
+        bump_risk_stats(row, warned_at, warning_count=strikes[user_id])
+
+
+def load_risk_features(
+    db: Session,
+    user_ids: Iterable[str],
+    mode: str = "lifetime",
+    now: Optional[datetime] = None
+) -> Dict[str, Dict[str, float]]:
+    """
+    user_id -> aggregate risk features, one row per user (missing users are
+    all zero). mode="decayed" returns the exponentially decayed counters as
+    they stand at `now`, so recent events weigh more than old ones.
+    """
+
+    if mode not in RISK_MODES:
+        raise ValueError(f"Unknown risk mode: {mode}")
+
+    user_ids = list(user_ids)
+    now = now or datetime.utcnow()
+    rows = db.query(MemberRiskStats).filter(MemberRiskStats.user_id.in_(user_ids))
+    features = {user_id: dict.fromkeys(RISK_FEATURES, 0) for user_id in user_ids}
+    for row in rows:
+        if mode == "decayed":
+            features[row.user_id] = decay_counters(_decayed(row), row.decayed_at, now)
+        else:
+            features[row.user_id] = {name: getattr(row, name) or 0 for name in RISK_FEATURES}
+    return features
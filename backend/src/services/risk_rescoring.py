@@ -0,0 +1,129 @@
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Dict, Optional
+import argparse
+import json
+import logging
+import time
+import numpy as np
+
+from src.models.models import Group, GroupMember, GroupMemberBalance
+from src.services.fx_rates import get_rate_table
+from src.services.risk_features import RISK_MODES, load_risk_features
+from ai_agent.fx import FxRateTable
+from ai_agent.money import DEFAULT_CURRENCY, minor_exponent
+from ai_agent.risk import score_risk_columns
+
+logger = logging.getLogger(__name__)
+
+
+def _balance_column(db: Session, member_index: Dict, fx_table: Optional[FxRateTable]) -> np.ndarray:
+    """
+    Outstanding balance per member in the group's settlement currency
+    (major units), summed from the materialized balances. Currencies with no
+    FX rate to the group currency are left out, as in compute_balances.
+    """
+
+    currency_default = {
+        row.id: (row.currency_default or DEFAULT_CURRENCY)
+        for row in db.query(Group.id, Group.currency_default)
+    }
+
+    positions, values = [], []
+    rows = db.query(
+        GroupMemberBalance.group_id, GroupMemberBalance.user_id,
+        GroupMemberBalance.currency, GroupMemberBalance.balance_minor
+    )
+    for group_id, user_id, currency, balance_minor in rows:
+        position = member_index.get((group_id, user_id))
+        if position is None or not balance_minor:
+            continue
+        target = currency_default.get(group_id, DEFAULT_CURRENCY)
+        if currency != target:
+            if not (fx_table and fx_table.has(currency) and fx_table.has(target)):
+                continue
+            balance_minor = fx_table.convert_minor(balance_minor, currency, target)
+        positions.append(position)
+        values.append(balance_minor / 10 ** minor_exponent(target))
+
+    return np.bincount(
+        np.asarray(positions, dtype=np.int64),
+        weights=np.asarray(values, dtype=np.float64),
+        minlength=len(member_index)
+    )
+
+
+def load_risk_columns(db: Session, mode: str = "lifetime", now: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+    """
+    Columnar risk inputs for every member of every group, aligned by
+    position: member ids plus balance / late / payment / warning / missed
+    arrays. Counters come from the per-user MemberRiskStats aggregates
+    (lifetime or decayed, see risk_features.load_risk_features).
+    """
+
+    members = db.query(GroupMember.id, GroupMember.group_id, GroupMember.user_id).all()
+    member_index = {(row.group_id, row.user_id): i for i, row in enumerate(members)}
+    count = len(members)
+
+    features = load_risk_features(db, {row.user_id for row in members}, mode=mode, now=now)
+
+    def column(name):
+        return np.fromiter((features[row.user_id][name] for row in members), dtype=np.float64, count=count)
+
+    return {
+        "member_ids": np.asarray([row.id for row in members], dtype=object),
+        "balances": _balance_column(db, member_index, get_rate_table(db)),
+        "late_counts": column("late_count"),
+        "payment_counts": column("payment_count"),
+        "warning_counts": column("warning_count"),
+        "missed_settlements": column("missed_settlements")
+    }
+
+
+def run_risk_rescoring(db: Session, mode: str = "lifetime") -> Dict:
+    """
+    Nightly job: score every member of every group in one vectorized pass
+    and write GroupMember.risk_score with one bulk UPDATE.
+    """
+
+    start = time.perf_counter()
+    columns = load_risk_columns(db, mode)
+    scores = score_risk_columns(
+        columns["balances"],
+        columns["late_counts"],
+        columns["payment_counts"],
+        columns["warning_counts"],
+        columns["missed_settlements"]
+    )
+
+    now = datetime.utcnow()
+    if len(scores):
+        db.execute(update(GroupMember), [
+            {"id": member_id, "risk_score": score, "risk_scored_at": now}
+            for member_id, score in zip(columns["member_ids"].tolist(), scores.tolist())
+        ])
+        db.commit()
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Risk rescoring: {len(scores)} members in {elapsed:.2f}s")
+    return {
+        "scored": len(scores),
+        "mean_score": round(float(scores.mean()), 3) if len(scores) else 0.0,
+        "elapsed_seconds": round(elapsed, 3)
+    }
+
+
+if __name__ == "__main__":
+    # python -m src.services.risk_rescoring [--mode lifetime|decayed]
+    from src.config.db import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rescore every group member")
+    parser.add_argument("--mode", choices=RISK_MODES, default="lifetime")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        print(json.dumps(run_risk_rescoring(db, args.mode), indent=2))
+    finally:
+        db.close()
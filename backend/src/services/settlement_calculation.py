@@ -0,0 +1,91 @@
+from sqlalchemy.orm import Session
+from typing import Dict, Optional
+import uuid
+
+from src.models.models import Group, GroupMember, Settlement
+from src.services.fx_rates import get_rate_table
+from src.services.group_state import build_group_state
+from src.services.member_balances import load_member_balances
+from src.services.risk_features import load_risk_features
+from src.services.warning_counts import persist_warning_counts, warning_count_changes
+from ai_agent.graph import get_graph
+
+
+def settlement_state(db: Session, group: Group, settings: Dict) -> Dict:
+    """
+    Initial graph state for one group: members, materialized balances and
+    risk aggregates (O(members) rows, no expense scan) plus the local FX
+    table (cached in memory) for cross-currency netting.
+    """
+
+    members = db.query(GroupMember).filter(GroupMember.group_id == group.id).all()
+    balances_by_currency = load_member_balances(db, group.id)
+    risk_features = load_risk_features(db, [m.user_id for m in members], mode=settings.get("risk_mode", "lifetime"))
+
+    return build_group_state(
+        group, members, [], get_rate_table(db), settings=settings,
+        balances_by_currency=balances_by_currency, risk_features=risk_features
+    )
+
+
+def save_settlement(
+    db: Session,
+    group_id: str,
+    result: Dict,
+    counts_before: Dict[str, int],
+    actor_id: Optional[str] = None
+) -> Settlement:
+    """
+    Store a graph result as a pending Settlement and carry strikes / levels
+    over to the next run (one bulk UPDATE + audit rows), then commit.
+    """
+
+    settlement = Settlement(
+        id=str(uuid.uuid4()),
+        group_id=group_id,
+        settlements=result.get("pending_settlements", []),
+        risk_scores=result.get("risk_scores", {}),
+        warnings=result.get("warning_levels", {}),
+        excluded_members=result.get("excluded_members", []),
+        governance_actions=result.get("governance_actions", {}),
+        onchain_results=result.get("onchain_results", {}),
+        explanation=result.get("explanation", ""),
+        status="pending"
+    )
+    db.add(settlement)
+
+    persist_warning_counts(db, warning_count_changes(group_id, counts_before, result), actor_id=actor_id)
+    db.commit()
+    db.refresh(settlement)
+    return settlement
+
+
+def run_settlement(
+    db: Session,
+    group: Group,
+    settings: Dict,
+    graph_variant: str = "full",
+    actor_id: Optional[str] = None
+) -> Settlement:
+    """
+    Whole blocking sequence for one group: load the state, invoke the
+    compiled graph, store the result. Run it on the settlement pool
+    (settlement_runner), never on the event loop.
+    """
+
+    state = settlement_state(db, group, settings)
+    counts_before = dict(state["warning_counts"])
+    result = get_graph(graph_variant).invoke(state)
+    return save_settlement(db, group.id, result, counts_before, actor_id=actor_id)
+
+
+def settlement_summary(settlement: Settlement) -> Dict:
+    """The fields a calculate call returns for a stored settlement"""
+    return {
+        "settlement_id": settlement.id,
+        "settlements": settlement.settlements,
+        "risk_scores": settlement.risk_scores,
+        "warnings": settlement.warnings,
+        "excluded_members": settlement.excluded_members,
+        "explanation": settlement.explanation or "Settlement calculated successfully"
+    }
@@ -0,0 +1,399 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+from src.models.models import Group
+from src.services.settlement_calculation import run_settlement, settlement_summary
+from src.services.settlement_runner import run_on_pool
+
+logger = logging.getLogger(__name__)
+
+SETTLEMENT_JOB_WORKERS = int(os.getenv("SETTLEMENT_JOB_WORKERS", 2))
+SETTLEMENT_JOB_BACKEND = os.getenv("SETTLEMENT_JOB_BACKEND", "memory")   # memory / redis
+JOB_TTL_SECONDS = 24 * 3600
+JOB_HISTORY = 1000   # finished jobs kept by the in-process backend
+# A running job's worker renews its lease every LEASE / 3 seconds; a job
+# whose lease lapsed lost its worker and is queued again, up to MAX_ATTEMPTS
+JOB_LEASE_SECONDS = int(os.getenv("SETTLEMENT_JOB_LEASE", 120))
+JOB_MAX_ATTEMPTS = 3
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def new_job(group_id: str, user_id: str, settings: Dict, graph_variant: str) -> Dict:
+    return {
+        "job_id": str(uuid.uuid4()),
+        "group_id": group_id,
+        "user_id": user_id,
+        "settings": settings,
+        "graph_variant": graph_variant,
+        "status": "queued",
+        "attempts": 0,
+        "settlement_id": None,
+        "result": None,
+        "error": None,
+        "created_at": datetime.utcnow().isoformat(),
+        "started_at": None,
+        "finished_at": None
+    }
+
+
+class InProcessJobBackend:
+    """Jobs in a dict, pending ids in a queue.Queue; one process only"""
+
+    def __init__(self, history: int = JOB_HISTORY):
+        self.history = history
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._active: Dict[str, str] = {}   # group_id -> queued / running job_id
+        self._pending: "queue.Queue[str]" = queue.Queue()
+        self._lock = threading.Lock()
+
+    def enqueue(self, job: Dict) -> Tuple[Dict, bool]:
+        with self._lock:
+            active_id = self._active.get(job["group_id"])
+            if active_id is not None:
+                return dict(self._jobs[active_id]), False
+            self._jobs[job["job_id"]] = dict(job)
+            self._active[job["group_id"]] = job["job_id"]
+            self._prune()
+        self._pending.put(job["job_id"])
+        return job, True
+
+    def dequeue(self, timeout: float) -> Optional[str]:
+        try:
+            return self._pending.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def release(self, job: Dict) -> None:
+        with self._lock:
+            if self._active.get(job["group_id"]) == job["job_id"]:
+                del self._active[job["group_id"]]
+
+    def renew_lease(self, job_id: str) -> None:
+        """Workers live in this process: a crash loses the queue with them"""
+
+    def recover_stale(self) -> List[str]:
+        return []
+
+    def _prune(self) -> None:
+        finished = [jid for jid, job in self._jobs.items() if job["status"] not in ACTIVE_STATUSES]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+
+class RedisJobBackend:
+    """
+    Jobs as JSON strings with a TTL, pending ids in a list and the active
+    job per group under SET NX, so any number of API and worker processes
+    share one queue.
+
+    A worker takes an id with BLMOVE into a processing list, so it stays
+    there until the job is finished, and keeps a lease key alive while it
+    runs. recover_stale() queues jobs whose lease lapsed again (a crashed
+    worker), or fails them after JOB_MAX_ATTEMPTS.
+    """
+
+    def __init__(
+        self,
+        redis,
+        prefix: str = "settlement:job:",
+        ttl_seconds: int = JOB_TTL_SECONDS,
+        lease_seconds: int = JOB_LEASE_SECONDS
+    ):
+        self.redis = redis
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self.queue_key = prefix + "queue"
+        self.processing_key = prefix + "processing"
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.prefix}{job_id}"
+
+    def _lease_key(self, job_id: str) -> str:
+        return f"{self.prefix}lease:{job_id}"
+
+    def _group_key(self, group_id: str) -> str:
+        return f"{self.prefix}group:{group_id}"
+
+    @staticmethod
+    def _text(value) -> Optional[str]:
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    def _delete_if(self, key: str, value: str) -> bool:
+        """Delete `key` only while it still holds `value` (WATCH / MULTI)"""
+        def delete(pipe) -> bool:
+            if self._text(pipe.get(key)) != value:
+                return False
+            pipe.multi()
+            pipe.delete(key)
+            return True
+        return self.redis.transaction(delete, key, value_from_callable=True)
+
+    def _claim(self, job: Dict) -> Optional[str]:
+        """
+        Job record, group marker and queue entry in one transaction when the
+        group is free; else the id the marker holds. No submitter ever sees
+        a marker without its job.
+        """
+        group_key = self._group_key(job["group_id"])
+
+        def claim(pipe) -> Optional[str]:
+            current = self._text(pipe.get(group_key))
+            if current:
+                return current
+            pipe.multi()
+            pipe.set(self._job_key(job["job_id"]), json.dumps(job), ex=self.ttl_seconds)
+            pipe.set(group_key, job["job_id"], ex=self.ttl_seconds)
+            pipe.lpush(self.queue_key, job["job_id"])
+            return None
+        return self.redis.transaction(claim, group_key, value_from_callable=True)
+
+    def enqueue(self, job: Dict) -> Tuple[Dict, bool]:
+        for _ in range(3):
+            active_id = self._claim(job)
+            if active_id is None:
+                return job, True
+
+            active = self.get(active_id)
+            if active is None:
+                # Record expired just ahead of its marker (same TTL): the
+                # marker is not ours to clear, it lapses on its own
+                raise RuntimeError(f"Settlement job {active_id} for group {job['group_id']} is expiring; retry")
+            if self._is_stale(active):
+                self._recover(active)
+                active = self.get(active_id) or active
+            if active["status"] in ACTIVE_STATUSES:
+                return active, False
+            # Marker of a finished job (release() did not get to it): take it over
+            self._delete_if(self._group_key(job["group_id"]), active_id)
+        raise RuntimeError(f"Could not enqueue settlement job for group {job['group_id']}")
+
+    def dequeue(self, timeout: float) -> Optional[str]:
+        # Oldest first (LPUSH / take from the right); the id stays in the
+        # processing list until release()
+        item = self.redis.blmove(self.queue_key, self.processing_key, max(1, int(timeout)), "RIGHT", "LEFT")
+        if item is None:
+            return None
+        job_id = self._text(item)
+        self.renew_lease(job_id)
+        return job_id
+
+    def renew_lease(self, job_id: str) -> None:
+        self.redis.set(self._lease_key(job_id), 1, ex=self.lease_seconds)
+
+    def _is_stale(self, job: Dict) -> bool:
+        return job["status"] == "running" and not self.redis.exists(self._lease_key(job["job_id"]))
+
+    def _recover(self, job: Dict) -> None:
+        """Queue a job whose worker was lost again, or fail it; only one caller wins the LREM"""
+        if not self.redis.lrem(self.processing_key, 0, job["job_id"]):
+            return
+        if job.get("attempts", 0) >= JOB_MAX_ATTEMPTS:
+            logger.error(f"Settlement job {job['job_id']} lost its worker {job['attempts']} times; failing it")
+            self.update(
+                job["job_id"], status="failed", error="Worker lost while running the job",
+                finished_at=datetime.utcnow().isoformat()
+            )
+            self.release(job)
+            return
+        logger.warning(f"Settlement job {job['job_id']} lost its worker; queued again")
+        self.update(job["job_id"], status="queued", started_at=None)
+        # Right end: it is the next one taken
+        self.redis.rpush(self.queue_key, job["job_id"])
+
+    def recover_stale(self) -> List[str]:
+        """Re-queue (or fail) running jobs whose lease lapsed; drop ids of jobs that no longer exist"""
+        recovered = []
+        for job_id in self.redis.lrange(self.processing_key, 0, -1):
+            job_id = self._text(job_id)
+            job = self.get(job_id)
+            if job is None:
+                self.redis.lrem(self.processing_key, 0, job_id)
+            elif self._is_stale(job):
+                self._recover(job)
+                recovered.append(job_id)
+        return recovered
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        raw = self.redis.get(self._job_key(job_id)) if job_id else None
+        return json.loads(self._text(raw)) if raw else None
+
+    def update(self, job_id: str, **fields) -> None:
+        """Merge fields into the stored job (WATCH / MULTI: concurrent updates are retried, not lost)"""
+        key = self._job_key(job_id)
+
+        def merge(pipe) -> None:
+            raw = pipe.get(key)
+            if not raw:
+                return   # expired
+            job = json.loads(self._text(raw))
+            job.update(fields)
+            pipe.multi()
+            pipe.set(key, json.dumps(job), ex=self.ttl_seconds)
+        self.redis.transaction(merge, key)
+
+    def release(self, job: Dict) -> None:
+        self.redis.lrem(self.processing_key, 0, job["job_id"])
+        self.redis.delete(self._lease_key(job["job_id"]))
+        self._delete_if(self._group_key(job["group_id"]), job["job_id"])
+
+
+class SettlementJobQueue:
+    """
+    POST-and-poll settlement calculation. submit() stores a queued job (or
+    returns the group's queued / running one: one job per group at a time)
+    and a fixed pool of worker threads runs them: its own DB session and
+    run_settlement on the bounded settlement pool, exactly like /calculate.
+    """
+
+    def __init__(
+        self,
+        backend,
+        session_factory: Callable,
+        workers: int = SETTLEMENT_JOB_WORKERS,
+        poll_seconds: float = 1.0,
+        lease_seconds: float = JOB_LEASE_SECONDS
+    ):
+        self.backend = backend
+        self.session_factory = session_factory
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._last_recovery = 0.0
+        self._recovery_lock = threading.Lock()
+
+    def start(self) -> "SettlementJobQueue":
+        if not self._threads:
+            self._stopping.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"settlement-job-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, group_id: str, user_id: str, settings: Dict, graph_variant: str = "full") -> Tuple[Dict, bool]:
+        """(job, created); created=False means an active job for the group was returned instead"""
+        return self.backend.enqueue(new_job(group_id, user_id, settings, graph_variant))
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.backend.get(job_id)
+
+    def _recover_stale(self) -> None:
+        """At most once per lease / 3 across this queue's workers"""
+        now = time.monotonic()
+        if now - self._last_recovery < self.lease_seconds / 3 or not self._recovery_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_recovery = now
+            self.backend.recover_stale()
+        except Exception as e:
+            logger.error(f"Settlement job recovery failed: {e}")
+        finally:
+            self._recovery_lock.release()
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            self._recover_stale()
+            job_id = self.backend.dequeue(self.poll_seconds)
+            if job_id is None:
+                continue
+            job = self.backend.get(job_id)
+            if job is not None:
+                self.run_job(job)
+
+    def _keep_lease(self, job_id: str, done: threading.Event) -> None:
+        while not done.wait(self.lease_seconds / 3):
+            self.backend.renew_lease(job_id)
+
+    def run_job(self, job: Dict) -> None:
+        self.backend.update(
+            job["job_id"], status="running", attempts=job.get("attempts", 0) + 1,
+            started_at=datetime.utcnow().isoformat()
+        )
+        done = threading.Event()
+        threading.Thread(target=self._keep_lease, args=(job["job_id"], done), daemon=True).start()
+        db = self.session_factory()
+        try:
+            group = db.get(Group, job["group_id"])
+            if group is None:
+                raise ValueError("Group not found")
+            # Same bounded pool as /calculate: jobs never add graph runs on top of it
+            settlement = run_on_pool(
+                run_settlement, db, group, job["settings"], job["graph_variant"], actor_id=job["user_id"]
+            )
+            self.backend.update(
+                job["job_id"],
+                status="succeeded",
+                settlement_id=settlement.id,
+                result=json.loads(json.dumps(settlement_summary(settlement), default=str)),
+                finished_at=datetime.utcnow().isoformat()
+            )
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Settlement job {job['job_id']} failed: {e}", exc_info=True)
+            self.backend.update(
+                job["job_id"], status="failed", error=str(e), finished_at=datetime.utcnow().isoformat()
+            )
+        finally:
+            done.set()
+            db.close()
+            self.backend.release(job)
+
+
+def job_backend(redis=None, kind: str = SETTLEMENT_JOB_BACKEND):
+    """Backend by name; "redis" falls back to in-process when no Redis client is available"""
+    if kind == "redis":
+        if redis is not None:
+            return RedisJobBackend(redis)
+        logger.warning("SETTLEMENT_JOB_BACKEND=redis but Redis is unavailable; using the in-process queue")
+    return InProcessJobBackend()
+
+
+_job_queue: Optional[SettlementJobQueue] = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> SettlementJobQueue:
+    """Process-wide queue with its workers running (FastAPI dependency; built on first use)"""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                from src.config.db import SessionLocal, get_redis
+                _job_queue = SettlementJobQueue(job_backend(get_redis()), SessionLocal).start()
+    return _job_queue
+
+
+def shutdown_job_queue() -> None:
+    """Stop the workers after their current job (call on application shutdown)"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is not None:
+            _job_queue.stop()
+            _job_queue = None
@@ -0,0 +1,100 @@
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional
+import uuid
+
+from src.models.models import GroupMember, Expense, SettlementPlan
+from src.services.expense_stream import expense_split_dict, stream_group_balances
+from ai_agent.money import DEFAULT_CURRENCY, expense_shares, from_minor
+from ai_agent.tex import tex_optimize, tex_update_plan
+
+
+def group_member_ids(db: Session, group_id: str) -> List[str]:
+    rows = db.query(GroupMember.user_id).filter(GroupMember.group_id == group_id).all()
+    return [row.user_id for row in rows]
+
+
+def expense_deltas(expense: Expense, member_ids: List[str]) -> Dict[str, int]:
+    """Balance change (minor units) one expense causes, same split as compute_balances"""
+    deltas = {uid: -share for uid, share in expense_shares(expense_split_dict(expense), member_ids).items()}
+    if expense.paid_by_id in member_ids:
+        deltas[expense.paid_by_id] = deltas.get(expense.paid_by_id, 0) + expense.amount_minor
+    return deltas
+
+
+def build_plan(db: Session, group_id: str, currency: str = DEFAULT_CURRENCY, exclude_expense_id: str = None) -> SettlementPlan:
+    """Full rebuild from every unsettled expense (only needed once per group / after invalidation)"""
+    member_ids = group_member_ids(db, group_id)
+    streamed = stream_group_balances(db, [group_id], currency=currency, exclude_expense_id=exclude_expense_id)
+    balances = streamed.get((group_id, currency)) or {uid: 0 for uid in member_ids}
+    transfers = tex_optimize({uid: from_minor(v, currency) for uid, v in balances.items()}, currency=currency)
+
+    plan = SettlementPlan(
+        id=str(uuid.uuid4()),
+        group_id=group_id,
+        currency=currency,
+        balances=balances,
+        transfers=transfers,
+        version=0
+    )
+    db.add(plan)
+    return plan
+
+
+def _plan_query(db: Session, group_id: str, currency: str):
+    return db.query(SettlementPlan).filter(
+        SettlementPlan.group_id == group_id,
+        SettlementPlan.currency == currency
+    )
+
+
+def create_plan(db: Session, group_id: str, currency: str = DEFAULT_CURRENCY, exclude_expense_id: Optional[str] = None) -> SettlementPlan:
+    """
+    build_plan and INSERT it now, in a savepoint. When a concurrent request
+    created the group's plan first (uq_settlement_plan_group_currency),
+    only the savepoint is rolled back and their plan is returned, locked.
+    """
+
+    db.flush()   # pending writes (the new expense) stay outside the savepoint
+    try:
+        with db.begin_nested():
+            plan = build_plan(db, group_id, currency, exclude_expense_id=exclude_expense_id)
+        return plan
+    except IntegrityError:
+        return _plan_query(db, group_id, currency).with_for_update().one()
+
+
+def get_plan(db: Session, group_id: str, currency: str = DEFAULT_CURRENCY) -> SettlementPlan:
+    """Current plan for a group; one row read once it exists"""
+    plan = _plan_query(db, group_id, currency).first()
+    return plan or create_plan(db, group_id, currency)
+
+
+def apply_expense_to_plan(db: Session, expense: Expense) -> SettlementPlan:
+    """
+    Fold one new expense into the group's plan. Call in the same transaction
+    as the expense insert (before commit).
+    """
+
+    plan = _plan_query(db, expense.group_id, expense.currency).with_for_update().first()
+
+    if plan is None:
+        plan = create_plan(db, expense.group_id, expense.currency, exclude_expense_id=expense.id)
+
+    deltas = expense_deltas(expense, group_member_ids(db, expense.group_id))
+    balances, transfers = tex_update_plan(plan.balances or {}, plan.transfers or [], deltas, expense.currency)
+
+    # Reassign (not mutate) so SQLAlchemy sees the JSON columns as changed
+    plan.balances = balances
+    plan.transfers = transfers
+    plan.version = (plan.version or 0) + 1
+    return plan
+
+
+def invalidate_plans(db: Session, group_id: str) -> None:
+    """
+    Drop a group's plans; they are rebuilt on next read. Needed whenever the
+    equal-split basis changes (members added/removed) or expenses are settled.
+    """
+
+    db.query(SettlementPlan).filter(SettlementPlan.group_id == group_id).delete(synchronize_session=False)
@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Callable, Dict, Tuple
+import asyncio
+import logging
+import os
+
+from ai_agent.graph import get_graph
+
+logger = logging.getLogger(__name__)
+
+# Settlement graphs block on LLM and algod HTTP calls; at most this many run
+# at once, the rest queue here instead of on the event loop
+SETTLEMENT_WORKERS = int(os.getenv("SETTLEMENT_WORKERS", 4))
+# Batch runs take minutes and have their own process pool; they queue on a
+# separate thread so they never hold settlement workers
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", 1))
+
+_executor = ThreadPoolExecutor(max_workers=SETTLEMENT_WORKERS, thread_name_prefix="settlement")
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch")
+
+
+async def run_blocking(fn: Callable, *args, **kwargs):
+    """Run a blocking settlement step on the bounded pool and await it"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(fn, *args, **kwargs))
+
+
+def run_on_pool(fn: Callable, *args, **kwargs):
+    """Run a settlement step on the bounded pool from a plain thread (job workers) and wait for it"""
+    return _executor.submit(fn, *args, **kwargs).result()
+
+
+async def run_quick(fn: Callable, *args, **kwargs):
+    """
+    Run a short blocking call (a few queries, a job lookup) on the loop's
+    default executor, so it never waits behind in-flight settlements
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(fn, *args, **kwargs))
+
+
+async def run_batch(fn: Callable, *args, **kwargs):
+    """Run a whole batch settlement on its own thread and await it"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_batch_executor, partial(fn, *args, **kwargs))
+
+
+def _invoke_graph(variant: str, state: Dict) -> Dict:
+    return get_graph(variant).invoke(state)
+
+
+async def run_settlement_graph(state: Dict, variant: str = "full") -> Dict:
+    """
+    Invoke a compiled settlement graph off the event loop, so cheap
+    endpoints keep answering while settlements are in flight. The graph
+    only reads the state it is given; database work stays with the caller.
+    """
+    return await run_blocking(_invoke_graph, variant, state)
+
+
+async def stream_settlement_graph(state: Dict, variant: str = "full") -> AsyncIterator[Tuple[str, Dict]]:
+    """
+    Run a settlement graph on the pool and yield its stream as it is
+    produced: ("updates", {node: update}) after each node and ("custom",
+    {"text": ...}) for explanation tokens. Node errors are re-raised here.
+    """
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    finished = object()
+
+    def produce():
+        try:
+            for item in get_graph(variant).stream(state, stream_mode=["updates", "custom"]):
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+    producer = loop.run_in_executor(_executor, produce)
+    while True:
+        item = await queue.get()
+        if item is finished:
+            break
+        if isinstance(item, Exception):
+            raise item
+        yield item
+    await producer
+
+
+def shutdown_settlement_runner() -> None:
+    """Wait for in-flight settlements and batches (call on application shutdown)"""
+    _executor.shutdown(wait=True)
+    _batch_executor.shutdown(wait=True)
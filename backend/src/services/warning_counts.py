@@ -0,0 +1,104 @@
+from sqlalchemy import Float, and_, bindparam, func, insert, update
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Dict, List, Optional
+import uuid
+
+from src.models.models import GroupMember, AuditLog
+from src.services.risk_features import record_warnings
+
+
+def warning_count_changes(group_id: str, before: Dict[str, int], result: Dict) -> List[Dict]:
+    """
+    Members of one group whose warning state must be written back after a
+    run: warning count changed, level differs from the persisted one, or
+    the member was evaluated (every scored member in full mode, the
+    re-evaluated ones in change-driven mode), so their new score is the
+    baseline. `audit` marks the rows whose count or level moved.
+    `before` is the warning_counts the run started from.
+    """
+
+    after = result.get("warning_counts", {})
+    levels = result.get("warning_levels", {})
+    previous_levels = result.get("previous_warning_levels", {})
+    risk_scores = result.get("risk_scores", {})
+    evaluated = result.get("warning_changes")
+    if evaluated is None:
+        evaluated = risk_scores
+
+    changes = []
+    for user_id in sorted(set(after) | set(levels) | set(evaluated)):
+        old_count, new_count = before.get(user_id, 0), after.get(user_id, before.get(user_id, 0))
+        old_level = previous_levels.get(user_id, "NONE")
+        level = levels.get(user_id, old_level)
+        moved = old_count != new_count or old_level != level
+        if not moved and user_id not in evaluated:
+            continue
+        changes.append({
+            "group_id": group_id,
+            "user_id": user_id,
+            "old_count": old_count,
+            "new_count": new_count,
+            "old_level": old_level,
+            "level": level,
+            "risk_score": risk_scores.get(user_id),
+            "audit": moved
+        })
+    return changes
+
+
+def persist_warning_counts(db: Session, changes: List[Dict], actor_id: Optional[str] = None) -> int:
+    """
+    Write warning counts, levels and risk scores back to GroupMember with
+    one bulk UPDATE (executemany keyed on group_id + user_id), one bulk
+    INSERT of audit rows for the counts / levels that moved, and the
+    strikes added to each user's risk aggregates. Call once at the end of
+    a run, before commit. Returns the number of members updated.
+    """
+
+    if not changes:
+        return 0
+
+    members = GroupMember.__table__
+    db.execute(
+        update(members)
+        .where(and_(members.c.group_id == bindparam("b_group_id"), members.c.user_id == bindparam("b_user_id")))
+        .values(
+            warning_count=bindparam("b_count"),
+            warning_level=bindparam("b_level"),
+            risk_score=func.coalesce(bindparam("b_risk", type_=Float), members.c.risk_score)
+        ),
+        [
+            {
+                "b_group_id": c["group_id"], "b_user_id": c["user_id"],
+                "b_count": c["new_count"], "b_level": c["level"], "b_risk": c["risk_score"]
+            }
+            for c in changes
+        ]
+    )
+
+    now = datetime.utcnow()
+    audited = [c for c in changes if c.get("audit", True)]
+    if audited:
+        db.execute(insert(AuditLog), [
+            {
+                "id": str(uuid.uuid4()),
+                "action": "warning_count_updated",
+                "entity_type": "GroupMember",
+                "entity_id": f"{c['group_id']}:{c['user_id']}",
+                "old_value": {"warning_count": c["old_count"], "level": c["old_level"]},
+                "new_value": {"warning_count": c["new_count"], "level": c["level"], "risk_score": c["risk_score"]},
+                "created_by": actor_id,
+                "created_at": now
+            }
+            for c in audited
+        ])
+
+    strikes: Dict[str, int] = {}
+    for c in changes:
+        if c["new_count"] > c["old_count"]:
+            strikes[c["user_id"]] = strikes.get(c["user_id"], 0) + c["new_count"] - c["old_count"]
+    if strikes:
+        record_warnings(db, strikes, now)
+
+    return len(changes)
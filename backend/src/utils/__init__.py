@@ -4,7 +4,8 @@ from .schemas import (
     CreateGroupRequest, GroupResponse, GroupDetailResponse,
     GroupMemberResponse, AddMemberRequest,
     CreateExpenseRequest, ExpenseResponse,
-    SettlementRequest, SettlementResponse, SettlementDetailResponse,
+    SettlementRequest, SettlementResponse, SettlementDetailResponse, SettlementPlanResponse,
+    BatchSettlementRequest, BatchSettlementResponse,
     HealthResponse, ConnectWallet
 )
 
@@ -14,6 +15,7 @@ __all__ = [
     'CreateGroupRequest', 'GroupResponse', 'GroupDetailResponse',
     'GroupMemberResponse', 'AddMemberRequest',
     'CreateExpenseRequest', 'ExpenseResponse',
-    'SettlementRequest', 'SettlementResponse', 'SettlementDetailResponse',
+    'SettlementRequest', 'SettlementResponse', 'SettlementDetailResponse', 'SettlementPlanResponse',
+    'BatchSettlementRequest', 'BatchSettlementResponse',
     'HealthResponse', 'ConnectWallet'
 ]
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List, Dict
 from datetime import datetime
 
@@ -38,6 +38,7 @@ class ConnectWallet(BaseModel):
 class CreateGroupRequest(BaseModel):
     name: str
     description: Optional[str] = ""
+    currency_default: Optional[str] = "USD"
 
 
 class GroupResponse(BaseModel):
@@ -80,7 +81,12 @@ class AddMemberRequest(BaseModel):
 class CreateExpenseRequest(BaseModel):
     group_id: str
     amount: float
+    currency: Optional[str] = "USD"
     description: Optional[str] = ""
+    split_type: Optional[str] = "equal"  # equal / weighted / exact
+    split_among: Optional[List[str]] = None  # equal: participants (default: all members)
+    split_weights: Optional[Dict[str, float]] = None  # weighted: user_id -> weight
+    split_amounts: Optional[Dict[str, float]] = None  # exact: user_id -> amount (must sum to amount)
 
 
 class ExpenseResponse(BaseModel):
@@ -88,6 +94,11 @@ class ExpenseResponse(BaseModel):
     group_id: str
     paid_by_id: str
     amount: float
+    amount_minor: int
+    currency: str
+    split_type: Optional[str] = "equal"
+    split_among: Optional[List[str]] = None
+    split_shares: Optional[Dict[str, int]] = None
     description: Optional[str]
     created_at: datetime
     settled: bool
@@ -99,6 +110,28 @@ class ExpenseResponse(BaseModel):
 # ============== SETTLEMENT SCHEMAS ==============
 class SettlementRequest(BaseModel):
     group_id: str
+    settlement_mode: Optional[str] = "greedy"  # greedy / min_transfers / min_fee
+    pair_fees: Optional[Dict[str, Dict[str, int]]] = None  # min_fee: fee per from -> to transfer
+    fx_mode: Optional[str] = "per_currency"  # per_currency / convert (uses the local FX table)
+    risk_mode: Optional[str] = "lifetime"  # lifetime / decayed (recent payment history weighs more)
+    warning_mode: Optional[str] = "full"  # full / changes (only members whose risk moved are re-evaluated)
+    graph_variant: Optional[str] = "full"  # full / offchain (no on-chain execution) / deterministic (no LLM, no on-chain)
+    explain: Optional[bool] = None  # force the explanation report on / off (default: template always, rich only when warnings were issued)
+    explanation_mode: Optional[str] = "template"  # template (local, instant) / rich (LLM-written)
+
+
+class BatchSettlementRequest(BaseModel):
+    group_ids: Optional[List[str]] = None  # None = every due group the caller created
+    settlement_mode: Optional[str] = "greedy"
+    max_workers: Optional[int] = Field(None, ge=1)  # capped at the CPU count
+
+
+class BatchSettlementResponse(BaseModel):
+    groups: Dict[str, Dict]  # group_id -> {status, settlement_id / error, transfer_count}
+    succeeded: int
+    failed: int
+    elapsed_seconds: float
+    groups_per_second: float
 
 
 class SettlementResponse(BaseModel):
@@ -110,6 +143,19 @@ class SettlementResponse(BaseModel):
     explanation: str
 
 
+class SettlementJobResponse(BaseModel):
+    job_id: str
+    group_id: str
+    status: str  # queued / running / succeeded / failed
+    deduplicated: bool = False  # an active job for the group was returned instead of a new one
+    settlement_id: Optional[str] = None
+    result: Optional[SettlementResponse] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
 class SettlementDetailResponse(BaseModel):
     id: str
     group_id: str
@@ -128,6 +174,15 @@ class SettlementDetailResponse(BaseModel):
         from_attributes = True
 
 
+class SettlementPlanResponse(BaseModel):
+    group_id: str
+    currency: str
+    balances: Dict[str, int]  # minor units
+    transfers: List[Dict]
+    version: int
+    updated_at: Optional[datetime]
+
+
 # ============== HEALTH CHECK ==============
 class HealthResponse(BaseModel):
     status: str
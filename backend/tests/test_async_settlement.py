@@ -0,0 +1,351 @@
+import sys
+import os
+import time
+import uuid
+import asyncio
+import json
+import threading
+import tempfile
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.models import Base, User, Group, GroupMember, Expense, Settlement
+from src.config.db import get_db
+from src.services.member_balances import apply_expense_balances
+from ai_agent.graph import get_graph, register_graph
+from ai_agent.llm import register_llm_provider
+from ai_agent.llm_cache import llm_cache
+from src.services.settlement_jobs import (
+    JOB_MAX_ATTEMPTS, SettlementJobQueue, InProcessJobBackend, RedisJobBackend, get_job_queue, new_job
+)
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from app import app
+import fakeredis
+
+# One database file shared by the app and the test. A file, not StaticPool
+# in-memory: settlements load and save on pool threads concurrently, and
+# each session needs its own connection as it has in production.
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="async_settlement_"), "test.db")
+engine = create_engine(f"sqlite:///{DB_PATH}", connect_args={"check_same_thread": False, "timeout": 30})
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+LLM_LATENCY = 0.5
+
+
+class BlockingLLMGraph:
+    """Deterministic graph plus a blocking call standing in for the LLM round trips"""
+
+    def invoke(self, state):
+        time.sleep(LLM_LATENCY)
+        return get_graph("deterministic").invoke(state)
+
+
+class GatedLLMGraph:
+    """Deterministic graph that holds its pool thread until the test opens the gate"""
+
+    # All settlements must be on the pool at once to pass `entered`; the
+    # timeouts only keep a regression from hanging the suite
+    entered = None
+    release = None
+    order = None
+
+    def invoke(self, state):
+        self.entered.wait(timeout=10)
+        if not self.release.wait(timeout=10):
+            raise TimeoutError("settlement was never released")
+        self.order.append("settlement")
+        return get_graph("deterministic").invoke(state)
+
+
+def override_get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def seed():
+    db = SessionLocal()
+    for uid in ["u1", "u2", "u3"]:
+        db.add(User(id=uid, email=f"{uid}@example.com", password_hash="x"))
+    db.add(Group(id="g1", name="Trip", creator_id="u1"))
+    for uid in ["u1", "u2", "u3"]:
+        db.add(GroupMember(id=str(uuid.uuid4()), group_id="g1", user_id=uid))
+    expense = Expense(id="e1", group_id="g1", paid_by_id="u1", amount_minor=3000, currency="USD")
+    db.add(expense)
+    db.flush()
+    apply_expense_balances(db, expense)
+    db.commit()
+    db.close()
+
+
+async def benchmark(settlements=4, probes=10):
+    """Settlement responses; the probes answer while every settlement is still held on the pool"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        in_flight = [
+            asyncio.create_task(client.post(
+                "/api/settlements/calculate?user_id=u1",
+                json={"group_id": "g1", "graph_variant": "gated_llm"}
+            ))
+            for _ in range(settlements)
+        ]
+        await asyncio.sleep(0.05)
+
+        for _ in range(probes):
+            assert (await client.get("/health")).status_code == 200
+            assert (await client.get("/api/groups/?user_id=u1")).status_code == 200
+        GatedLLMGraph.order.append("probes")
+        GatedLLMGraph.release.set()
+
+        return await asyncio.gather(*in_flight)
+
+
+@pytest.fixture
+def api_db():
+    """Seeded shared database wired into the app"""
+    Base.metadata.create_all(bind=engine)
+    seed()
+    app.dependency_overrides[get_db] = override_get_db
+    yield
+    app.dependency_overrides.pop(get_db, None)
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_cheap_endpoints_stay_fast_during_settlements(api_db):
+    """Benchmark: /health and list_groups answer while blocking settlements are in flight"""
+    GatedLLMGraph.entered = threading.Barrier(4)
+    GatedLLMGraph.release = threading.Event()
+    GatedLLMGraph.order = []
+    register_graph("gated_llm", GatedLLMGraph)
+    responses = asyncio.run(benchmark())
+
+    # Every settlement reached the graph together (a broken barrier means
+    # they ran one after another) and was only released after all 20
+    # probes had answered, so none of the probes queued behind them
+    assert not GatedLLMGraph.entered.broken
+    assert [r.status_code for r in responses] == [200] * 4
+    assert all(len(r.json()["settlements"]) == 2 for r in responses)
+    assert GatedLLMGraph.order == ["probes"] + ["settlement"] * 4
+
+
+@pytest.mark.parametrize("field", ["settlement_mode", "fx_mode", "warning_mode", "risk_mode", "explanation_mode"])
+def test_unknown_mode_is_rejected(api_db, field):
+    """Test every mode setting is checked against the modes its node supports"""
+    from fastapi.testclient import TestClient
+
+    response = TestClient(app).post(
+        "/api/settlements/calculate?user_id=u1",
+        json={"group_id": "g1", "graph_variant": "deterministic", field: "bogus"}
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith(f"{field} must be one of")
+
+
+def test_quick_calls_skip_the_settlement_queue():
+    """Test job polls / request checks do not wait for a saturated settlement pool"""
+    from src.services.settlement_runner import SETTLEMENT_WORKERS, run_blocking, run_quick
+
+    order = []
+
+    async def settlement():
+        await run_blocking(time.sleep, LLM_LATENCY)
+        order.append("settlement")
+
+    async def main():
+        busy = [asyncio.create_task(settlement()) for _ in range(2 * SETTLEMENT_WORKERS)]
+        await asyncio.sleep(0.05)
+        await run_quick(lambda: None)
+        order.append("quick")
+        await asyncio.gather(*busy)
+
+    # Behind the pool it would come after the first wave of settlements
+    asyncio.run(main())
+    assert order[0] == "quick"
+
+
+def parse_sse(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_stream_emits_node_results_then_explanation_tokens(api_db, monkeypatch):
+    """Test the SSE endpoint reports each stage as it finishes and streams the rich explanation"""
+    register_llm_provider(
+        "streaming",
+        lambda model, temperature, timeout: GenericFakeChatModel(
+            messages=iter([AIMessage(content="u2 and u3 each pay u1 10.00 USD")])
+        )
+    )
+    monkeypatch.setenv("LLM_EXPLANATION_PROVIDER", "streaming")
+    llm_cache.clear()
+
+    async def stream():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/settlements/calculate/stream?user_id=u1", json={
+                "group_id": "g1", "graph_variant": "offchain", "explain": True, "explanation_mode": "rich"
+            })
+
+    response = asyncio.run(stream())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = parse_sse(response.text)
+    names = [name for name, _ in events]
+    assert names[:4] == ["balances", "transfers", "risk", "warnings"]
+    assert names[-2:] == ["explanation", "done"]
+    assert len(events[1][1]["pending_settlements"]) == 2
+
+    tokens = "".join(data["text"] for name, data in events if name == "token")
+    assert names.count("token") > 1
+    assert tokens == events[-2][1]["explanation"] == "u2 and u3 each pay u1 10.00 USD"
+
+    done = events[-1][1]
+    db = SessionLocal()
+    assert db.get(Settlement, done["settlement_id"]).explanation == tokens
+    db.close()
+
+
+def wait_for_job(client, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get(f"/api/settlements/jobs/{job_id}?user_id=u1")
+        assert response.status_code == 200
+        if response.json()["status"] not in ("queued", "running"):
+            return response.json()
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still active after {timeout}s")
+
+
+@pytest.mark.parametrize("backend", ["memory", "redis"])
+def test_settlement_job_is_deduplicated_and_polled(api_db, backend):
+    """Test POST /jobs returns at once, repeats for the group share a job, and polling returns the stored settlement"""
+    from fastapi.testclient import TestClient
+
+    register_graph("blocking_llm", BlockingLLMGraph)
+    if backend == "redis":
+        job_backend = RedisJobBackend(fakeredis.FakeRedis(decode_responses=True))
+    else:
+        job_backend = InProcessJobBackend()
+    jobs = SettlementJobQueue(job_backend, SessionLocal, workers=2, poll_seconds=0.05).start()
+    app.dependency_overrides[get_job_queue] = lambda: jobs
+
+    try:
+        client = TestClient(app)
+        body = {"group_id": "g1", "graph_variant": "blocking_llm"}
+
+        first = client.post("/api/settlements/jobs?user_id=u1", json=body)
+        second = client.post("/api/settlements/jobs?user_id=u2", json=body)
+
+        # Both answered while the job (at least LLM_LATENCY long) was still active
+        assert first.status_code == second.status_code == 202
+        assert first.json()["status"] == "queued"
+        assert second.json()["status"] in ("queued", "running")
+        assert first.json()["deduplicated"] is False
+        assert second.json()["deduplicated"] is True
+        assert second.json()["job_id"] == first.json()["job_id"]
+
+        job = wait_for_job(client, first.json()["job_id"])
+        assert job["status"] == "succeeded"
+        assert job["started_at"] and job["finished_at"]
+        assert len(job["result"]["settlements"]) == 2
+
+        db = SessionLocal()
+        assert db.query(Settlement).count() == 1
+        assert db.get(Settlement, job["settlement_id"]).settlements == job["result"]["settlements"]
+        db.close()
+
+        # The group is free again once its job has finished
+        third = client.post("/api/settlements/jobs?user_id=u1", json=body)
+        assert third.json()["deduplicated"] is False
+        assert third.json()["job_id"] != first.json()["job_id"]
+        assert wait_for_job(client, third.json()["job_id"])["status"] == "succeeded"
+
+        assert client.get("/api/settlements/jobs/missing?user_id=u1").status_code == 404
+        assert client.get(f"/api/settlements/jobs/{job['job_id']}?user_id=outsider").status_code == 403
+    finally:
+        app.dependency_overrides.pop(get_job_queue, None)
+        jobs.stop()
+
+
+def test_failed_settlement_job_reports_error(api_db):
+    """Test a job whose graph raises is marked failed with the error and releases the group"""
+    jobs = SettlementJobQueue(InProcessJobBackend(), SessionLocal, workers=1)
+    job, _ = jobs.submit("g1", "u1", {}, graph_variant="no_such_variant")
+    jobs.run_job(job)
+
+    failed = jobs.get(job["job_id"])
+    assert failed["status"] == "failed"
+    assert "no_such_variant" in failed["error"]
+    assert jobs.submit("g1", "u1", {})[1] is True
+
+
+def crash_worker(backend, job_id, attempts=1):
+    """A worker took the job and died: running, no lease renewal"""
+    assert backend.dequeue(1) == job_id
+    backend.update(job_id, status="running", attempts=attempts)
+    backend.redis.delete(backend._lease_key(job_id))
+
+
+def test_redis_job_lost_by_a_worker_is_run_again(api_db):
+    """Test a job whose worker died stays in the processing list and is queued again once its lease lapses"""
+    redis = fakeredis.FakeRedis(decode_responses=True)
+    backend = RedisJobBackend(redis, lease_seconds=1)
+    job, _ = backend.enqueue(new_job("g1", "u1", {}, "deterministic"))
+    crash_worker(backend, job["job_id"])
+    assert redis.lrange(backend.processing_key, 0, -1) == [job["job_id"]]
+
+    # The next submit for the group finds the dead job and puts it back in the queue
+    again, created = backend.enqueue(new_job("g1", "u1", {}, "deterministic"))
+    assert not created and again["job_id"] == job["job_id"] and again["status"] == "queued"
+    assert redis.lrange(backend.processing_key, 0, -1) == []
+
+    jobs = SettlementJobQueue(backend, SessionLocal, workers=1, poll_seconds=0.05)
+    jobs.run_job(backend.get(backend.dequeue(1)))
+    finished = backend.get(job["job_id"])
+    assert finished["status"] == "succeeded" and finished["attempts"] == 2
+    assert redis.lrange(backend.processing_key, 0, -1) == []
+    assert backend.enqueue(new_job("g1", "u1", {}, "deterministic"))[1] is True
+
+
+def test_redis_job_failing_every_attempt_frees_the_group():
+    """Test the recovery sweep fails a job after JOB_MAX_ATTEMPTS lost workers and releases its group"""
+    redis = fakeredis.FakeRedis(decode_responses=True)
+    backend = RedisJobBackend(redis, lease_seconds=1)
+    job, _ = backend.enqueue(new_job("g1", "u1", {}, "deterministic"))
+    crash_worker(backend, job["job_id"], attempts=JOB_MAX_ATTEMPTS)
+
+    assert backend.recover_stale() == [job["job_id"]]
+    assert backend.get(job["job_id"])["status"] == "failed"
+    assert backend.enqueue(new_job("g1", "u1", {}, "deterministic"))[1] is True
+
+
+def test_redis_concurrent_submits_create_one_job():
+    """Test racing submitters for one group get a single job, and a marker whose record is missing is kept"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    redis = fakeredis.FakeRedis(decode_responses=True)
+    backend = RedisJobBackend(redis)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: backend.enqueue(new_job("g1", "u1", {}, "deterministic")), range(16)))
+
+    assert sum(created for _, created in results) == 1
+    assert len({job["job_id"] for job, _ in results}) == 1
+    assert redis.llen(backend.queue_key) == 1
+
+    # A marker without its record is never cleared by a submitter
+    redis.delete(backend._job_key(results[0][0]["job_id"]))
+    with pytest.raises(RuntimeError):
+        backend.enqueue(new_job("g1", "u1", {}, "deterministic"))
+    assert redis.get(backend._group_key("g1")) == results[0][0]["job_id"]
+    assert redis.llen(backend.queue_key) == 1
@@ -0,0 +1,195 @@
+import sys
+import os
+import time
+import fakeredis
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_agent.llm import get_llm, invoke_llm, llm_config, register_llm_provider
+from ai_agent.llm_cache import LLMResponseCache, llm_cache
+from ai_agent.graph import governance_node, needs_onchain
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_core.prompts import ChatPromptTemplate
+
+
+# ============== LLM REGISTRY TESTS ==============
+def test_llm_clients_built_on_first_use_and_reused(monkeypatch):
+    """Test clients are created lazily, cached per config and selectable per node"""
+    built = []
+    register_llm_provider("fake", lambda model, temperature, timeout: built.append((model, temperature)) or object())
+    monkeypatch.setenv("LLM_GOVERNANCE_PROVIDER", "fake")
+    monkeypatch.setenv("LLM_GOVERNANCE_MODEL", "m1")
+    assert built == []
+
+    client = get_llm("governance")
+    assert get_llm("governance") is client
+    assert built == [("m1", 0.7)]
+
+    settings = {"llm": {"governance": {"model": "m2", "temperature": 0}}}
+    config = llm_config("governance", settings)
+    assert (config["provider"], config["model"], config["temperature"]) == ("fake", "m2", 0.0)
+    assert get_llm("governance", settings) is not client
+    assert get_llm("explanation", {"llm": {"explanation": {"provider": "missing"}}}) is None
+
+
+def test_failed_llm_build_is_retried_after_ttl(monkeypatch):
+    """Test a client that failed to build is not cached forever"""
+    import ai_agent.llm as llm
+
+    attempts = []
+
+    def flaky(model, temperature, timeout):
+        attempts.append(model)
+        if len(attempts) == 1:
+            raise RuntimeError("API key not set")
+        return object()
+
+    register_llm_provider("flaky", flaky)
+    settings = {"llm": {"governance": {"provider": "flaky", "model": "m1"}}}
+    assert get_llm("governance", settings) is None
+    assert get_llm("governance", settings) is None
+    assert attempts == ["m1"]
+
+    # Past the retry window the client is built and then kept
+    now = time.monotonic() + llm.LLM_RETRY_SECONDS + 1
+    monkeypatch.setattr(llm.time, "monotonic", lambda: now)
+    client = get_llm("governance", settings)
+    assert client is not None
+    assert get_llm("governance", settings) is client
+    assert attempts == ["m1", "m1"]
+
+
+def test_governance_calls_run_concurrently_with_timeouts():
+    """Test flagged members are decided in parallel, in order, with safe defaults on failure"""
+    delay = 0.2
+
+    def fake_llm(model, temperature, timeout):
+        def reply(messages):
+            text = "\n".join(m.content for m in messages)
+            if "User: boom" in text:
+                raise RuntimeError("provider down")
+            time.sleep(2 if "User: hang" in text else delay)
+            return AIMessage(content='{"remove_user": true, "deduct_wallet": false, "amount_to_deduct": 0, "reason": "ok"}')
+        return RunnableLambda(reply)
+
+    register_llm_provider("slow", fake_llm)
+    flagged = [f"u{i}" for i in range(6)] + ["boom", "hang"]
+    state = {
+        "warning_levels": {"ok": "LEVEL_1", **{uid: "LEVEL_3" for uid in flagged}},
+        "balances": {},
+        "settings": {"llm": {"governance": {"provider": "slow", "concurrency": 8, "timeout": 1}}}
+    }
+
+    start = time.perf_counter()
+    decisions = governance_node(state)["governance_actions"]
+    elapsed = time.perf_counter() - start
+
+    assert list(decisions) == ["ok"] + flagged
+    assert all(decisions[uid]["remove_user"] for uid in flagged[:6])
+    assert decisions["boom"]["reason"] == "Error: provider down"
+    assert decisions["hang"] == {
+        "remove_user": False, "deduct_wallet": False, "amount_to_deduct": 0, "reason": "Error: no decision within 1s"
+    }
+    assert not decisions["ok"]["remove_user"]
+    assert elapsed < 1.5   # sequential: 6 * 0.2s plus the 2s hang
+
+
+def test_malformed_governance_replies_never_reach_onchain():
+    """Test string amounts are coerced, other shapes become no action, and routing never raises"""
+    replies = {
+        "text_amount": '{"remove_user": false, "deduct_wallet": true, "amount_to_deduct": "50", "reason": "owes"}',
+        "bad_amount": '{"remove_user": true, "deduct_wallet": true, "amount_to_deduct": "lots"}',
+        "list": '[{"remove_user": true}]',
+        "string_flag": '{"remove_user": "false", "deduct_wallet": "false", "amount_to_deduct": 0}',
+    }
+
+    def fake_llm(model, temperature, timeout):
+        def reply(messages):
+            text = "\n".join(m.content for m in messages)
+            return AIMessage(content=next(r for uid, r in replies.items() if f"User: {uid}\n" in text))
+        return RunnableLambda(reply)
+
+    register_llm_provider("sloppy", fake_llm)
+    llm_cache.clear()
+    state = {
+        "warning_levels": {uid: "LEVEL_3" for uid in replies},
+        "balances": {},
+        "settings": {"llm": {"governance": {"provider": "sloppy"}}}
+    }
+    decisions = governance_node(state)["governance_actions"]
+
+    assert decisions["text_amount"]["amount_to_deduct"] == 50.0
+    assert decisions["bad_amount"]["reason"] == "Invalid amount_to_deduct"
+    assert decisions["list"]["reason"] == "Invalid LLM response format"
+    assert not decisions["string_flag"]["remove_user"]
+    assert needs_onchain({"governance_actions": decisions})
+    assert not needs_onchain({"governance_actions": {uid: decisions[uid] for uid in ("bad_amount", "list", "string_flag")}})
+
+    # Raw, unnormalized actions (e.g. restored state) are tolerated too
+    assert not needs_onchain({"governance_actions": {"a": ["x"], "b": {"deduct_wallet": True, "amount_to_deduct": "x"}}})
+    assert needs_onchain({"governance_actions": {"a": {"deduct_wallet": True, "amount_to_deduct": "5"}}})
+
+
+def test_unusable_llm_replies_are_not_cached():
+    """Test a reply the caller rejects is asked for again, a valid one is served from the cache"""
+    replies = iter(["not json", '{"remove_user": true, "amount_to_deduct": 0}'])
+    calls = []
+
+    def fake_llm(model, temperature, timeout):
+        return RunnableLambda(lambda messages: calls.append(1) or AIMessage(content=next(replies)))
+
+    register_llm_provider("flaky", fake_llm)
+    llm_cache.clear()
+    state = {
+        "warning_levels": {"u1": "LEVEL_3"},
+        "balances": {},
+        "settings": {"llm": {"governance": {"provider": "flaky"}}}
+    }
+
+    assert governance_node(state)["governance_actions"]["u1"]["reason"] == "Invalid LLM response format"
+    assert governance_node(state)["governance_actions"]["u1"]["remove_user"]
+    assert governance_node(state)["governance_actions"]["u1"]["remove_user"]
+    assert len(calls) == 2
+
+
+# ============== LLM CACHE TESTS ==============
+def test_llm_cache_evicts_lru_and_expires(monkeypatch):
+    """Test entries expire after the TTL, the least recently used is evicted, Redis is read through"""
+    clock = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+    redis = fakeredis.FakeRedis(decode_responses=True)
+
+    cache = LLMResponseCache(max_entries=2, ttl_seconds=60, redis=redis)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    assert cache.get("a") == "A"
+    cache.set("c", "C")                     # evicts b, the least recently used
+    assert cache.stats()["entries"] == 2
+
+    assert cache.get("b") == "B"            # still in Redis
+    clock[0] += 61
+    redis.delete("llm:response:a")
+    assert cache.get("a") is None           # expired locally, gone from Redis
+    assert cache.stats() == {"hits": 2, "redis_hits": 1, "misses": 1, "entries": 2}
+
+
+def test_identical_llm_calls_hit_the_cache():
+    """Test a byte-identical prompt reaches the model once; whitespace and other models do not collide"""
+    calls = []
+
+    def fake_llm(model, temperature, timeout):
+        return RunnableLambda(lambda messages: calls.append(model) or AIMessage(content=f"answer from {model}"))
+
+    register_llm_provider("cached", fake_llm)
+    prompt = ChatPromptTemplate.from_messages([("human", "Explain {data}")])
+    settings = {"llm": {"explanation": {"provider": "cached", "model": "m1"}}}
+    other = {"llm": {"explanation": {"provider": "cached", "model": "m2"}}}
+    llm_cache.clear()
+
+    first = invoke_llm("explanation", get_llm("explanation", settings), prompt, {"data": "a  b"}, settings)
+    again = invoke_llm("explanation", get_llm("explanation", settings), prompt, {"data": "a b "}, settings)
+    assert first == again == "answer from m1"
+    assert invoke_llm("explanation", get_llm("explanation", other), prompt, {"data": "a b"}, other) == "answer from m2"
+    assert calls == ["m1", "m2"]
+    assert llm_cache.stats()["hits"] == 1 and llm_cache.stats()["misses"] == 2
@@ -0,0 +1,65 @@
+import sys
+import os
+import pytest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_agent.risk import (
+    bump_decayed_counters, calculate_risk_scores, calculate_risk_scores_from_features, decay_counters,
+    score_risk_columns
+)
+
+
+# ============== RISK TESTS ==============
+def test_columnar_risk_matches_per_user_scores():
+    """Test the vectorized scorer gives the same scores as calculate_risk_scores"""
+    due, on_time, late = datetime(2026, 1, 1), datetime(2025, 12, 31), datetime(2026, 1, 9)
+    users = [f"u{i}" for i in range(40)]
+    balances = {u: ((i * 7919) % 30000) - 15000 + 0.5 * i for i, u in enumerate(users)}
+    payments = {u: [{"due_date": due, "paid_date": late if j < i % 4 else on_time} for j in range(i % 6)] for i, u in enumerate(users)}
+    warnings = {u: i % 7 for i, u in enumerate(users)}
+    missed = {u: i % 3 for i, u in enumerate(users)}
+
+    expected = calculate_risk_scores(balances, payments, warnings, missed)
+    scores = score_risk_columns(
+        [balances[u] for u in users],
+        [sum(p["paid_date"] > p["due_date"] for p in payments[u]) for u in users],
+        [len(payments[u]) for u in users],
+        [warnings[u] for u in users],
+        [missed[u] for u in users]
+    )
+    assert scores.tolist() == pytest.approx([expected[u] for u in users], abs=1e-9)
+
+
+def test_risk_from_aggregates_matches_history():
+    """Test aggregate counters give the same scores as raw payment history"""
+    due = datetime(2026, 1, 1)
+    history = {"a": [{"due_date": due, "paid_date": datetime(2026, 1, 5)}, {"due_date": due, "paid_date": due}]}
+    features = {"a": {"payment_count": 2, "late_count": 1, "warning_count": 3, "missed_settlements": 1}}
+    balances = {"a": -2500.0, "b": 4000.0}
+
+    expected = calculate_risk_scores(balances, history, {"a": 3}, {"a": 1})
+    assert calculate_risk_scores_from_features(balances, features) == pytest.approx(expected)
+
+
+def test_decayed_counters_halve_per_half_life_in_any_order():
+    """Test decayed counters halve every half-life and ignore event arrival order"""
+    start = datetime(2026, 1, 1)
+    events = [(start, {"late_count": 1}), (start + timedelta(days=90), {"late_count": 1, "payment_count": 2})]
+
+    counters, as_of = {}, None
+    for event_at, increments in events:
+        counters, as_of = bump_decayed_counters(counters, as_of, event_at, increments, half_life_days=90)
+    assert counters == pytest.approx({"late_count": 1.5, "payment_count": 2.0})
+
+    reversed_counters, reversed_as_of = {}, None
+    for event_at, increments in reversed(events):
+        reversed_counters, reversed_as_of = bump_decayed_counters(
+            reversed_counters, reversed_as_of, event_at, increments, half_life_days=90
+        )
+    assert reversed_counters == pytest.approx(counters)
+    assert reversed_as_of == as_of
+
+    later = decay_counters(counters, as_of, as_of + timedelta(days=180), half_life_days=90)
+    assert later == pytest.approx({"late_count": 0.375, "payment_count": 0.5})
@@ -0,0 +1,596 @@
+import sys
+import os
+import uuid
+import pytest
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.models import Base, User, Group, GroupMember, Expense, SettlementPlan
+from src.services.settlement_plan import apply_expense_to_plan, build_plan, get_plan, invalidate_plans
+from src.services.fx_rates import load_rate_table, publish_rates
+from src.services.global_netting import net_across_groups, run_global_netting
+from src.services.batch_settlement import DEFAULT_MAX_WORKERS, clamp_workers, run_batch_settlement
+from src.services.member_balances import (
+    apply_expense_balances, load_member_balances, rebuild_member_balances, reconcile_member_balances,
+    revert_expense_balances
+)
+from src.services.expense_stream import stream_group_balances
+from src.services.risk_rescoring import run_risk_rescoring
+from ai_agent.risk import RISK_HALF_LIFE_DAYS
+from src.services.risk_features import load_risk_features, record_missed_settlement, record_settlement_payments
+from src.models.models import AuditLog, GroupMemberBalance, MemberRiskStats, PaymentEvent
+from src.models.models import Settlement
+from src.services.group_state import build_group_state
+from ai_agent.graph import get_graph
+from ai_agent.llm import register_llm_provider
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+# In-memory database, independent of the API test database
+engine = create_engine("sqlite://", connect_args={"check_same_thread": False})
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+# ============== FIXTURES ==============
+@pytest.fixture
+def db():
+    """Fresh schema and session for each test"""
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def group(db):
+    """A group with four members"""
+    for uid in ["u1", "u2", "u3", "u4"]:
+        db.add(User(id=uid, email=f"{uid}@example.com", password_hash="x"))
+    db.add(Group(id="g1", name="Trip", creator_id="u1"))
+    for uid in ["u1", "u2", "u3", "u4"]:
+        db.add(GroupMember(id=str(uuid.uuid4()), group_id="g1", user_id=uid))
+    db.commit()
+    return "g1"
+
+
+def add_expense(db, group_id, paid_by, amount_minor, currency="USD", **split):
+    expense = Expense(
+        id=str(uuid.uuid4()), group_id=group_id, paid_by_id=paid_by,
+        amount_minor=amount_minor, currency=currency, **split
+    )
+    db.add(expense)
+    apply_expense_to_plan(db, expense)
+    apply_expense_balances(db, expense)
+    db.commit()
+    return expense
+
+
+# ============== SETTLEMENT PLAN TESTS ==============
+def test_plan_tracks_full_recompute(db, group):
+    """Test incremental plan balances equal a full rebuild after many inserts"""
+    for i, payer in enumerate(["u1", "u2", "u1", "u3", "u4", "u2", "u1"]):
+        add_expense(db, group, payer, 1000 + 37 * i)
+
+    plan = get_plan(db, group)
+    assert plan.version == 7
+    assert sum(plan.balances.values()) == 0
+
+    rebuilt = build_plan(db, group)
+    db.expunge(rebuilt)
+    assert plan.balances == rebuilt.balances
+
+    # Transfers settle the maintained balances exactly
+    net = dict(plan.balances)
+    for t in plan.transfers:
+        net[t["from"]] += t["amount_minor"]
+        net[t["to"]] -= t["amount_minor"]
+    assert all(v == 0 for v in net.values())
+    assert len(plan.transfers) <= 3
+
+
+def test_first_plan_insert_race_uses_the_winning_plan(db, group, monkeypatch):
+    """Test a plan created by a concurrent request between our read and insert gets the delta instead of a 500"""
+    from sqlalchemy import insert
+    import src.services.settlement_plan as settlement_plan
+
+    plan_query = settlement_plan._plan_query
+    reads = []
+
+    def racing_plan_query(db, group_id, currency):
+        if not reads:
+            reads.append(group_id)
+            # Our read misses; meanwhile the other request commits its plan
+            # (it already holds a 10.00 expense paid by u1)
+            db.execute(insert(SettlementPlan).values(
+                id="theirs", group_id=group_id, currency=currency, version=1,
+                balances={"u1": 750, "u2": -250, "u3": -250, "u4": -250}, transfers=[]
+            ))
+            return plan_query(db, "not-yet-visible", currency)
+        return plan_query(db, group_id, currency)
+
+    monkeypatch.setattr(settlement_plan, "_plan_query", racing_plan_query)
+    expense = add_expense(db, group, "u2", 400)
+
+    plans = db.query(SettlementPlan).all()
+    assert [(p.id, p.version) for p in plans] == [("theirs", 2)]
+    assert plans[0].balances == {"u1": 650, "u2": 50, "u3": -350, "u4": -350}
+    assert db.get(Expense, expense.id) is not None
+
+
+def test_plan_honors_expense_splits(db, group):
+    """Test subset, weighted and exact splits flow through the incremental plan"""
+    add_expense(db, group, "u1", 900, split_among=["u1", "u2", "u3"])
+    add_expense(db, group, "u2", 1000, split_type="weighted", split_shares={"u3": 1, "u4": 3})
+    add_expense(db, group, "u3", 500, split_type="exact", split_shares={"u1": 200, "u4": 300})
+
+    plan = get_plan(db, group)
+    assert plan.balances == {"u1": 400, "u2": 700, "u3": -50, "u4": -1050}
+
+    rebuilt = build_plan(db, group)
+    db.expunge(rebuilt)
+    assert plan.balances == rebuilt.balances
+
+
+def test_plan_is_per_currency(db, group):
+    """Test expenses in another currency keep their own plan"""
+    add_expense(db, group, "u1", 4000)
+    add_expense(db, group, "u2", 800, currency="EUR")
+
+    assert db.query(SettlementPlan).filter(SettlementPlan.group_id == group).count() == 2
+    assert get_plan(db, group, "USD").balances["u1"] == 3000
+    assert get_plan(db, group, "EUR").balances["u2"] == 600
+
+
+# ============== MEMBER BALANCE TESTS ==============
+def test_member_balances_follow_insert_and_delete(db, group):
+    """Test materialized balances match a full recompute after inserts and a delete"""
+    add_expense(db, group, "u1", 1001)
+    doomed = add_expense(db, group, "u2", 2500, split_among=["u2", "u3"])
+    add_expense(db, group, "u3", 700, currency="EUR")
+
+    revert_expense_balances(db, doomed)
+    invalidate_plans(db, group)
+    db.delete(doomed)
+    db.commit()
+
+    balances = load_member_balances(db, group)
+    assert set(balances) == {"USD", "EUR"}
+    assert balances["USD"] == {k: v for k, v in get_plan(db, group).balances.items() if v}
+
+    report = reconcile_member_balances(db)
+    assert report["checked"] == 1
+    assert report["mismatched"] == {}
+
+
+def test_reconcile_repairs_drifted_balances(db, group):
+    """Test the reconciliation job reports and rebuilds a tampered row"""
+    add_expense(db, group, "u1", 4000)
+    row = db.query(GroupMemberBalance).filter(GroupMemberBalance.user_id == "u2").one()
+    row.balance_minor += 5
+    db.commit()
+
+    report = reconcile_member_balances(db, repair=True)
+    assert report["mismatched"][group]["USD"]["u2"] == {"materialized": -995, "expected": -1000}
+    assert report["repaired"] == [group]
+    assert reconcile_member_balances(db)["mismatched"] == {}
+
+
+def test_load_member_balances_rebuilds_legacy_group(db, group):
+    """Test a group with expenses but no materialized rows is rebuilt on first read"""
+    db.add(Expense(id="old", group_id=group, paid_by_id="u4", amount_minor=800, currency="USD"))
+    db.commit()
+
+    assert load_member_balances(db, group) == {"USD": {"u1": -200, "u2": -200, "u3": -200, "u4": 600}}
+    db.commit()
+    assert db.query(GroupMemberBalance).count() == 4
+
+
+def test_first_expense_after_deploy_rebuilds_legacy_group(db, group):
+    """Test the first balance write for a legacy group starts from its full history, not just the new expense"""
+    db.add(Expense(id="old", group_id=group, paid_by_id="u1", amount_minor=10000, currency="USD",
+                   split_among=["u1", "u2"]))
+    db.commit()
+
+    add_expense(db, group, "u2", 200, split_among=["u1", "u2"])
+
+    assert load_member_balances(db, group) == {"USD": {"u1": 4900, "u2": -4900}}
+    assert reconcile_member_balances(db)["mismatched"] == {}
+
+
+def test_revert_on_legacy_group_keeps_other_expenses(db, group):
+    """Test deleting an expense from a group without rows leaves the rest of its history"""
+    db.add(Expense(id="old", group_id=group, paid_by_id="u4", amount_minor=800, currency="USD"))
+    doomed = Expense(id="doomed", group_id=group, paid_by_id="u1", amount_minor=400, currency="USD")
+    db.add(doomed)
+    db.commit()
+
+    revert_expense_balances(db, doomed)
+    db.delete(doomed)
+    db.commit()
+
+    assert load_member_balances(db, group) == {"USD": {"u1": -200, "u2": -200, "u3": -200, "u4": 600}}
+    assert reconcile_member_balances(db)["mismatched"] == {}
+
+
+def test_zero_balance_group_is_not_rebuilt_on_write(db, group, monkeypatch):
+    """Test a materialized group whose balances net to zero (no rows) takes later writes incrementally"""
+    add_expense(db, group, "u1", 400, split_among=["u1", "u2"])
+    add_expense(db, group, "u2", 400, split_among=["u1", "u2"])
+    rebuild_member_balances(db, group)
+    db.commit()
+    assert db.query(GroupMemberBalance).count() == 0
+
+    def no_rebuild(*args, **kwargs):
+        raise AssertionError("materialized group was rebuilt")
+
+    monkeypatch.setattr("src.services.member_balances.rebuild_member_balances", no_rebuild)
+    add_expense(db, group, "u3", 300, split_among=["u3", "u4"])
+    assert load_member_balances(db, group) == {"USD": {"u3": 150, "u4": -150}}
+
+
+# ============== STREAMING INGESTION TESTS ==============
+def test_streamed_balances_match_single_pass(db, group):
+    """Test folding expenses in small chunks gives the same balances as one pass"""
+    for i in range(23):
+        split = {"split_among": ["u2", "u3"]} if i % 4 == 0 else {}
+        add_expense(db, group, f"u{i % 4 + 1}", 1000 + 13 * i, currency="EUR" if i % 5 == 0 else "USD", **split)
+
+    chunked = stream_group_balances(db, batch_size=3)
+    assert chunked == stream_group_balances(db, batch_size=1000)
+    assert set(chunked) == {(group, "USD"), (group, "EUR")}
+    assert chunked[(group, "USD")] == get_plan(db, group, "USD").balances
+    assert all(sum(b.values()) == 0 for b in chunked.values())
+
+
+# ============== FX RATE TABLE TESTS ==============
+def test_publish_rates_creates_new_version(db):
+    """Test each publish adds a version and the latest one is loaded"""
+    assert load_rate_table(db) is None
+    publish_rates(db, {"EUR": "1.08", "INR": "0.012"})
+    publish_rates(db, {"EUR": "1.10"})
+
+    table = load_rate_table(db)
+    assert table.version == 2
+    assert table.convert_minor(1000, "EUR", "USD") == 1100
+    assert load_rate_table(db, version=1).has("INR")
+
+
+# ============== GLOBAL NETTING TESTS ==============
+def test_net_across_groups_cancels_opposite_debts():
+    """Test A->B in one group and B->A in another collapse to one transfer"""
+    result = net_across_groups({
+        ("g1", "USD"): {"a": -500, "b": 500},
+        ("g2", "USD"): {"a": 300, "b": -300},
+    })
+    assert result["group_transfer_count"] == 2
+    assert result["transfer_count"] == 1
+
+    transfer = result["transfers"][0]
+    assert (transfer["from"], transfer["to"], transfer["amount_minor"]) == ("a", "b", 200)
+    assert transfer["from_groups"] == {"g1": 200}
+    assert transfer["to_groups"] == {"g1": 200}
+    assert result["netted"]["USD"]["a"] == {"g2": 300, "g1": 300}
+
+
+def test_run_global_netting_for_cohort(db, group):
+    """Test the batch job loads group balances in bulk for a cohort"""
+    add_expense(db, group, "u1", 4000)
+    result = run_global_netting(db, user_ids=["u2"])
+    assert result["transfer_count"] == 3
+    assert sum(t["amount_minor"] for t in result["transfers"]) == 3000
+    assert all(t["to_groups"] == {group: t["amount_minor"]} for t in result["transfers"])
+
+
+# ============== BATCH SETTLEMENT TESTS ==============
+def test_batch_settlement_writes_all_due_groups(db, group):
+    """Test due groups are settled across the pool and missing ids are reported"""
+    db.add(Group(id="g2", name="Flat", creator_id="u2"))
+    db.add(GroupMember(id=str(uuid.uuid4()), group_id="g2", user_id="u2"))
+    db.add(GroupMember(id=str(uuid.uuid4()), group_id="g2", user_id="u3"))
+    db.commit()
+    add_expense(db, group, "u1", 4000)
+    add_expense(db, "g2", "u2", 1000)
+
+    summary = run_batch_settlement(db, group_ids=["g1", "g2", "missing"], max_workers=2)
+    assert summary["succeeded"] == 2
+    assert summary["groups"]["missing"]["status"] == "failed"
+    assert summary["groups"]["g1"]["transfer_count"] == 3
+    assert summary["groups"]["g2"]["transfer_count"] == 1
+    assert db.query(Settlement).count() == 2
+
+    assert run_batch_settlement(db, max_workers=1)["succeeded"] == 2
+
+
+def test_batch_process_pool_matches_serial_run(db, group, monkeypatch):
+    """Test the spawn process pool persists the same Settlement rows as the in-process run"""
+    import src.services.batch_settlement as batch_settlement
+
+    db.add(Group(id="g2", name="Flat", creator_id="u2"))
+    for uid in ["u2", "u3", "u4"]:
+        db.add(GroupMember(id=str(uuid.uuid4()), group_id="g2", user_id=uid))
+    db.commit()
+    add_expense(db, group, "u1", 4000)
+    add_expense(db, group, "u3", 1234, split_among=["u2", "u3"])
+    add_expense(db, "g2", "u2", 1000)
+    add_expense(db, "g2", "u4", 700, currency="EUR")
+
+    def persisted():
+        return {
+            s.group_id: (s.settlements, s.risk_scores, s.warnings, s.excluded_members, s.explanation)
+            for s in db.query(Settlement)
+        }
+
+    assert run_batch_settlement(db, group_ids=[group, "g2"], max_workers=1)["succeeded"] == 2
+    serial = persisted()
+    db.query(Settlement).delete()
+    db.commit()
+
+    # clamp_workers caps at the CPU count; lift it so the pool is used here too
+    pools = []
+
+    class RecordingPool(ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            pools.append(kwargs["max_workers"])
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(batch_settlement, "DEFAULT_MAX_WORKERS", 2)
+    monkeypatch.setattr(batch_settlement, "ProcessPoolExecutor", RecordingPool)
+    assert run_batch_settlement(db, group_ids=[group, "g2"], max_workers=2)["succeeded"] == 2
+    assert pools == [2]
+    assert persisted() == serial
+
+
+def test_batch_workers_are_capped_at_cpu_count():
+    """Test a client-supplied worker count can never exceed the CPUs"""
+    from pydantic import ValidationError
+    from src.utils.schemas import BatchSettlementRequest
+
+    assert clamp_workers(10_000) == DEFAULT_MAX_WORKERS
+    assert clamp_workers(None) == DEFAULT_MAX_WORKERS
+    assert clamp_workers(1) == 1
+    with pytest.raises(ValidationError):
+        BatchSettlementRequest(max_workers=0)
+
+
+# ============== PAYMENT HISTORY TESTS ==============
+def test_payments_update_risk_aggregates(db, group):
+    """Test executed and failed settlements maintain per-user aggregates"""
+    created = datetime(2026, 3, 1)
+    transfers = [
+        {"from": "u2", "to": "u1", "amount_minor": 500, "currency": "USD"},
+        {"from": "u3", "to": "u1", "amount_minor": 700, "currency": "USD"},
+    ]
+    on_time = Settlement(id="s1", group_id=group, settlements=transfers, created_at=created)
+    late = Settlement(id="s2", group_id=group, settlements=transfers[:1], created_at=created)
+    failed = Settlement(id="s3", group_id=group, settlements=transfers, created_at=created)
+    db.add_all([on_time, late, failed])
+    db.commit()
+
+    assert record_settlement_payments(db, on_time, paid_at=created + timedelta(days=1)) == 2
+    db.commit()
+    record_settlement_payments(db, late, paid_at=created + timedelta(days=30))
+    db.commit()
+    record_missed_settlement(db, failed)
+    db.commit()
+
+    features = load_risk_features(db, ["u1", "u2", "u3"])
+    assert features["u1"] == {"payment_count": 0, "late_count": 0, "missed_settlements": 0, "warning_count": 0}
+    assert features["u2"] == {"payment_count": 2, "late_count": 1, "missed_settlements": 1, "warning_count": 0}
+    assert features["u3"] == {"payment_count": 1, "late_count": 0, "missed_settlements": 1, "warning_count": 0}
+    assert db.query(PaymentEvent).filter(PaymentEvent.kind == "missed").count() == 2
+
+
+def test_decayed_risk_features_fade_old_lateness(db, group):
+    """Test decayed features weigh an old late payment less than lifetime counts"""
+    created = datetime(2024, 1, 1)
+    late = Settlement(id="s1", group_id=group, settlements=[{"from": "u2", "to": "u1", "amount_minor": 500}], created_at=created)
+    db.add(late)
+    db.commit()
+    record_settlement_payments(db, late, paid_at=created + timedelta(days=30))
+    db.commit()
+
+    now = created + timedelta(days=30 + 2 * RISK_HALF_LIFE_DAYS)
+    lifetime = load_risk_features(db, ["u2"])["u2"]
+    decayed = load_risk_features(db, ["u2"], mode="decayed", now=now)["u2"]
+    assert lifetime["late_count"] == 1
+    assert decayed["late_count"] == pytest.approx(0.25)
+    assert decayed["payment_count"] == pytest.approx(0.25)
+
+
+# ============== WARNING COUNT TESTS ==============
+def test_batch_persists_warning_counts_and_enforces_third_strike(db, group):
+    """Test persisted strikes are loaded, bumped in bulk, audited and enforced"""
+    add_expense(db, group, "u1", 40000_00)
+    db.add(MemberRiskStats(user_id="u2", payment_count=1, late_count=1, missed_settlements=5, warning_count=5))
+    db.query(GroupMember).filter(GroupMember.user_id == "u2").update({"warning_count": 2})
+    db.commit()
+
+    summary = run_batch_settlement(db, group_ids=[group], max_workers=1, actor_id="u1")
+    assert summary["succeeded"] == 1
+
+    counts = {m.user_id: m.warning_count for m in db.query(GroupMember)}
+    assert counts == {"u1": 0, "u2": 3, "u3": 0, "u4": 0}
+    assert db.query(Settlement).one().excluded_members == ["u2"]
+
+    audit = db.query(AuditLog).one()
+    assert audit.entity_id == f"{group}:u2"
+    assert audit.old_value == {"warning_count": 2, "level": "NONE"}
+    assert audit.new_value == {"warning_count": 3, "level": "LEVEL_3", "risk_score": 1.0}
+    assert db.get(MemberRiskStats, "u2").warning_count == 6
+
+    member = db.query(GroupMember).filter(GroupMember.user_id == "u2").one()
+    assert (member.warning_level, member.risk_score) == ("LEVEL_3", 1.0)
+
+
+def test_change_driven_warnings_skip_unmoved_members(db, group):
+    """Test the changes mode only re-evaluates members whose risk moved"""
+    add_expense(db, group, "u1", 40000_00)
+    db.add(MemberRiskStats(user_id="u2", payment_count=1, late_count=1, missed_settlements=5, warning_count=5))
+    db.commit()
+
+    settings = {"warning_mode": "changes"}
+    run_batch_settlement(db, group_ids=[group], max_workers=1, settings=settings)
+    first = {m.user_id: (m.warning_count, m.warning_level, m.risk_score) for m in db.query(GroupMember)}
+    assert first["u2"] == (1, "LEVEL_3", 1.0)
+    audits = db.query(AuditLog).count()
+
+    # Nothing moved: only the LEVEL_3 member is re-evaluated (and takes a strike)
+    run_batch_settlement(db, group_ids=[group], max_workers=1, settings=settings)
+    second = {m.user_id: (m.warning_count, m.warning_level, m.risk_score) for m in db.query(GroupMember)}
+    assert second == {**first, "u2": (2, "LEVEL_3", 1.0)}
+    assert db.query(AuditLog).count() == audits + 1
+
+
+@pytest.mark.parametrize("warning_mode", ["full", "changes"])
+def test_stable_level_3_member_reaches_exclusion(db, group, warning_mode):
+    """Test a member who stays at LEVEL_3 takes a strike every run and stays excluded in both modes"""
+    add_expense(db, group, "u1", 40000_00)
+    db.add(MemberRiskStats(user_id="u2", payment_count=1, late_count=1, missed_settlements=5, warning_count=5))
+    db.commit()
+
+    settings = {"warning_mode": warning_mode}
+    for _ in range(4):
+        run_batch_settlement(db, group_ids=[group], max_workers=1, settings=settings)
+
+    member = db.query(GroupMember).filter(GroupMember.user_id == "u2").one()
+    assert (member.warning_count, member.warning_level) == (4, "LEVEL_3")
+    excluded = [s.excluded_members for s in db.query(Settlement).order_by(Settlement.created_at)]
+    assert excluded == [[], [], ["u2"], ["u2"]]
+    # Every evaluated member has their score persisted, not only those that moved
+    assert all(m.risk_score is not None for m in db.query(GroupMember))
+
+
+# ============== RISK RESCORING TESTS ==============
+def test_risk_rescoring_scores_every_member(db, group):
+    """Test the nightly job scores all members from materialized balances in one pass"""
+    add_expense(db, group, "u1", 8000_00)
+    db.add(MemberRiskStats(user_id="u2", payment_count=0, late_count=0, missed_settlements=0, warning_count=5))
+    db.commit()
+
+    summary = run_risk_rescoring(db)
+    assert summary["scored"] == 4
+
+    scores = {m.user_id: m.risk_score for m in db.query(GroupMember)}
+    assert scores == {"u1": 0.18, "u2": 0.26, "u3": 0.06, "u4": 0.06}
+    assert all(m.risk_scored_at is not None for m in db.query(GroupMember))
+
+
+# ============== GRAPH TESTS ==============
+def test_graph_variants_compile_once_per_process(db, group):
+    """Test named variants are reused and the deterministic one runs without LLM or chain"""
+    assert get_graph("deterministic") is get_graph("deterministic")
+    assert get_graph("full") is not get_graph("deterministic")
+    with pytest.raises(KeyError):
+        get_graph("missing")
+
+    add_expense(db, group, "u1", 4000)
+    members = db.query(GroupMember).filter(GroupMember.group_id == group).all()
+    state = build_group_state(
+        db.get(Group, group), members, [], balances_by_currency=load_member_balances(db, group)
+    )
+    result = get_graph("deterministic").invoke(state)
+    assert len(result["pending_settlements"]) == 3
+    assert not result.get("explanation") and not result.get("onchain_results")
+
+
+def test_full_graph_skips_llm_nodes_for_quiet_groups(db, group):
+    """Test LLM nodes run only when requested or when a member reaches a warning level (rich mode)"""
+    calls = []
+
+    def fake_llm(model, temperature, timeout):
+        def reply(messages):
+            calls.append(model)
+            if model == "governance":
+                return AIMessage(content='{"remove_user": true, "deduct_wallet": false, "amount_to_deduct": 0, "reason": "LEVEL_3"}')
+            return AIMessage(content="report")
+        return RunnableLambda(reply)
+
+    register_llm_provider("fake_llm", fake_llm)
+    llm = {node: {"provider": "fake_llm", "model": node} for node in ("explanation", "governance")}
+    add_expense(db, group, "u1", 4000)
+
+    def run(**settings):
+        members = db.query(GroupMember).filter(GroupMember.group_id == group).all()
+        state = build_group_state(
+            db.get(Group, group), members, [], settings={"llm": llm, **settings},
+            balances_by_currency=load_member_balances(db, group)
+        )
+        return get_graph("offchain").invoke(state)
+
+    quiet = run(explanation_mode="rich")
+    assert calls == [] and quiet["explanation"] is None
+    assert len(quiet["pending_settlements"]) == 3
+
+    assert run(explain=True, explanation_mode="rich")["explanation"] == "report"
+    assert calls == ["explanation"]
+
+    calls.clear()
+    add_expense(db, group, "u1", 40000_00)
+    db.query(GroupMember).filter(GroupMember.user_id == "u2").update({"warning_count": 2})
+    db.add(MemberRiskStats(user_id="u2", payment_count=1, late_count=1, missed_settlements=5, warning_count=5))
+    db.commit()
+    members = db.query(GroupMember).filter(GroupMember.group_id == group).all()
+    state = build_group_state(
+        db.get(Group, group), members, [], settings={"llm": llm, "explanation_mode": "rich"},
+        balances_by_currency=load_member_balances(db, group),
+        risk_features=load_risk_features(db, ["u1", "u2", "u3", "u4"])
+    )
+    flagged = get_graph("offchain").invoke(state)
+    assert sorted(calls) == ["explanation", "governance"]
+    assert flagged["governance_actions"]["u2"]["remove_user"] is True
+    assert flagged["explanation"] == "report"
+
+
+def test_template_explanation_is_default(db, group):
+    """Test the default report is rendered locally from the state, with no LLM call"""
+    add_expense(db, group, "u1", 4000)
+    add_expense(db, group, "u2", 1000, split_type="exact", split_among=["u3"], split_shares={"u3": 1000})
+    members = db.query(GroupMember).filter(GroupMember.group_id == group).all()
+    state = build_group_state(
+        db.get(Group, group), members, [],
+        settings={"llm": {"explanation": {"provider": "missing"}}},
+        balances_by_currency=load_member_balances(db, group)
+    )
+    report = get_graph("offchain").invoke(state)["explanation"]
+
+    assert report.startswith("# Settlement Report\n\n## Summary\n- Members: 4\n- Transfers: 2 (greedy settlement)")
+    assert "- Total to settle: 30.00 USD" in report
+    assert "- u3 pays u1 20.00 USD" in report
+    assert "### u1\n- Balance: is owed 30.00 USD" in report
+    assert "### u3\n- Balance: owes 20.00 USD" in report
+    assert "- Warnings issued: none" in report and "## Exclusions" not in report
+
+
+# ============== SCHEMA UPGRADE TESTS ==============
+def test_legacy_float_amounts_are_migrated_to_minor_units(tmp_path):
+    """Test init-time upgrade backfills amount_minor / currency from the group and drops amount"""
+    from sqlalchemy import inspect, text
+    from src.config.migrations import upgrade_schema
+
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy.begin() as conn:
+        conn.execute(text("CREATE TABLE groups (id VARCHAR PRIMARY KEY, name VARCHAR, currency_default VARCHAR(8))"))
+        conn.execute(text(
+            "CREATE TABLE expenses (id VARCHAR PRIMARY KEY, group_id VARCHAR, paid_by_id VARCHAR, "
+            "amount FLOAT NOT NULL, description VARCHAR, created_at DATETIME, settled BOOLEAN)"
+        ))
+        conn.execute(text("INSERT INTO groups VALUES ('g1', 'Trip', 'EUR'), ('g2', 'Tokyo', 'JPY')"))
+        conn.execute(text(
+            "INSERT INTO expenses (id, group_id, paid_by_id, amount, settled) VALUES "
+            "('e1', 'g1', 'u1', 100.1, 0), ('e2', 'g1', 'u2', 0.3, 0), ('e3', 'g2', 'u1', 1500, 0)"
+        ))
+
+    Base.metadata.create_all(bind=legacy)
+    assert upgrade_schema(legacy) == ["upgrade_expense_amounts", "add_missing_columns"]
+    assert upgrade_schema(legacy) == []
+
+    assert "amount" not in {c["name"] for c in inspect(legacy).get_columns("expenses")}
+    session = sessionmaker(bind=legacy)()
+    expenses = {e.id: (e.amount_minor, e.currency, e.split_type) for e in session.query(Expense)}
+    assert expenses == {"e1": (10010, "EUR", "equal"), "e2": (30, "EUR", "equal"), "e3": (1500, "JPY", "equal")}
+    session.close()
@@ -0,0 +1,206 @@
+import sys
+import os
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_agent.tex import tex_optimize, tex_optimize_min_transfers
+from ai_agent.fx import FxRateCache, FxRateTable
+from ai_agent.money import Money, allocate_minor, expense_shares, split_equally
+from ai_agent.tex_array import compute_balances_array, tex_optimize_array
+from ai_agent.tex_fees import tex_optimize_min_fee
+from ai_agent.pipeline import compute_balances, tex_node
+
+
+def net_after(balances, settlements):
+    """Apply settlements to balances and return what is left over"""
+    remaining = dict(balances)
+    for s in settlements:
+        remaining[s["from"]] += s["amount"]
+        remaining[s["to"]] -= s["amount"]
+    return remaining
+
+
+# ============== GREEDY TESTS ==============
+def test_greedy_settles_all_balances():
+    """Test default greedy mode clears every balance"""
+    balances = {"a": -30.0, "b": 10.0, "c": 20.0}
+    settlements = tex_optimize(balances)
+    assert all(abs(v) < 0.01 for v in net_after(balances, settlements).values())
+
+
+# ============== MIN-TRANSFER TESTS ==============
+def test_min_transfers_finds_zero_sum_subgroups():
+    """Test two independent pairs settle with two transfers"""
+    balances = {"a": -10.0, "c": -7.5, "b": 7.5, "d": 10.0}
+    result = tex_optimize_min_transfers(balances)
+    assert result["transfer_count"] == 2
+    assert result["method"] == "exact"
+    assert all(abs(v) < 0.01 for v in net_after(balances, result["settlements"]).values())
+
+
+def test_min_transfers_never_worse_than_greedy():
+    """Test the solver reports and beats (or matches) the greedy baseline"""
+    balances = {f"u{i}": float(v) for i, v in enumerate([-5, 5, -3, -2, 4, 1, -6, 6, 0])}
+    result = tex_optimize_min_transfers(balances)
+    assert result["transfer_count"] <= result["baseline_transfer_count"]
+    assert result["transfer_count"] == 5
+
+
+def test_min_transfers_heuristic_for_large_groups():
+    """Test large groups use the time-budgeted heuristic and still balance"""
+    values = [((i * 37) % 101) - 50 for i in range(199)]
+    values.append(-sum(values))
+    balances = {f"u{i}": float(v) for i, v in enumerate(values)}
+    result = tex_optimize_min_transfers(balances, time_budget=0.05)
+    assert result["method"] == "heuristic"
+    assert result["transfer_count"] <= result["baseline_transfer_count"]
+    assert all(abs(v) < 0.01 for v in net_after(balances, result["settlements"]).values())
+
+
+def test_greedy_has_no_dust_transfers():
+    """Test thirds of a dollar settle without 0.00 transfers"""
+    shares = Money.of(100).allocate([1, 1, 1], seed="exp-1")
+    balances = {"payer": 100 - shares[0].amount, "b": -shares[1].amount, "c": -shares[2].amount}
+    settlements = tex_optimize(balances)
+    assert len(settlements) == 2
+    assert all(s["amount_minor"] > 0 for s in settlements)
+    assert sum(s["amount_minor"] for s in settlements) == 10000 - shares[0].minor
+
+
+# ============== MONEY TESTS ==============
+def test_allocate_minor_is_exact_and_deterministic():
+    """Test allocation sums back to the total and is reproducible"""
+    parts = allocate_minor(1000, [1, 1, 1], seed="exp-42")
+    assert sum(parts) == 1000
+    assert sorted(parts) == [333, 333, 334]
+    assert parts == allocate_minor(1000, [1, 1, 1], seed="exp-42")
+    assert allocate_minor(-1000, [1, 1, 1], seed="exp-42") == [-p for p in parts]
+
+
+# ============== ARRAY ENGINE TESTS ==============
+def test_array_balances_match_equal_split():
+    """Test array balances (minor units) match the equal-split rule"""
+    members = [{"user_id": "a"}, {"user_id": "b"}, {"user_id": "c"}, {"user_id": "d"}]
+    expenses = [{"paid_by": "a", "amount": 100.0}, {"paid_by": "b", "amount": 20.0}]
+    balances = compute_balances_array(members, expenses)
+    assert balances == {"a": 7000, "b": -1000, "c": -3000, "d": -3000}
+
+
+def test_array_balances_allocate_remainder_like_money():
+    """Test remainder cents land where split_equally puts them and net to zero"""
+    members = [{"user_id": u} for u in "bca"]
+    expenses = [
+        {"expense_id": f"exp-{i}", "paid_by": "abc"[i % 3], "amount_minor": 1000 + i}
+        for i in range(7)
+    ]
+    balances = compute_balances_array(members, expenses)
+    assert sum(balances.values()) == 0
+
+    expected = {u: 0 for u in "abc"}
+    for e in expenses:
+        for u, share in split_equally(e["amount_minor"], ["c", "a", "b"], seed=e["expense_id"]).items():
+            expected[u] -= share
+        expected[e["paid_by"]] += e["amount_minor"]
+    assert balances == expected
+
+
+def test_array_balances_honor_splits():
+    """Test weighted, exact and subset splits match the scalar expense_shares rule"""
+    members = [{"user_id": u} for u in "abcde"]
+    expenses = [
+        {"expense_id": "e1", "paid_by": "a", "amount_minor": 1001, "involved_members": ["b", "c", "x"]},
+        {"expense_id": "e2", "paid_by": "b", "amount_minor": 1000, "split_type": "weighted",
+         "split_shares": {"a": 1, "c": 2, "d": 4}},
+        {"expense_id": "e3", "paid_by": "c", "amount_minor": 900, "split_type": "exact",
+         "split_shares": {"a": 500, "e": 300}},
+        {"expense_id": "e4", "paid_by": "d", "amount_minor": 777},
+        {"expense_id": "e5", "paid_by": "e", "amount_minor": -250, "split_type": "weighted",
+         "split_shares": {"a": 1, "b": 1}},
+    ]
+    balances = compute_balances_array(members, expenses)
+    assert sum(balances.values()) == 0
+
+    member_ids = [m["user_id"] for m in members]
+    expected = {u: 0 for u in member_ids}
+    for e in expenses:
+        for u, share in expense_shares(e, member_ids).items():
+            expected[u] -= share
+        expected[e["paid_by"]] += e["amount_minor"]
+    assert balances == expected
+    assert expense_shares(expenses[2], member_ids) == {"a": 500, "e": 300, "c": 100}
+
+
+def test_array_engine_settles_like_greedy():
+    """Test the array engine clears balances with no more transfers than greedy"""
+    values = [((i * 53) % 97) - 48 + 0.25 * (i % 3) for i in range(499)]
+    values.append(-sum(values))
+    balances = {f"u{i}": v for i, v in enumerate(values)}
+    settlements = tex_optimize_array(balances)
+    assert len(settlements) <= len(tex_optimize(balances))
+    assert all(abs(v) < 0.01 for v in net_after(balances, settlements).values())
+
+
+# ============== FX TESTS ==============
+def test_fx_conversion_keeps_balances_zero_sum():
+    """Test converted balances still net to zero after rounding"""
+    fx = FxRateTable({"EUR": "1.0873", "INR": "0.011987"}, version=3)
+    converted = fx.convert_balances({"a": 3334, "b": -1667, "c": -1667}, "EUR", "INR")
+    assert sum(converted.values()) == 0
+    assert fx.convert_minor(10000, "EUR", "USD") == 10873
+
+
+def test_convert_mode_settles_currencies_without_rate_separately():
+    """Test a currency missing from the FX table keeps its own transfers instead of being dropped"""
+    state = {
+        "members": [{"user_id": uid} for uid in ("a", "b", "c")],
+        "currency_default": "USD",
+        "balances_by_currency": {"USD": {"a": 1000, "b": -1000}, "EUR": {"a": -500, "c": 500}, "JPY": {"b": 700, "c": -700}},
+        "fx_rates": {"version": 1, "pivot": "USD", "rates": {"EUR": "1.1"}},
+        "settings": {"fx_mode": "convert"},
+    }
+    state = tex_node(compute_balances(state))
+
+    assert state["unconverted_currencies"] == ["JPY"]
+    by_currency = {}
+    for t in state["pending_settlements"]:
+        by_currency.setdefault(t["currency"], []).append(t)
+    assert set(by_currency) == {"USD", "JPY"}
+    assert [(t["from"], t["to"], t["amount"]) for t in by_currency["JPY"]] == [("c", "b", 700)]
+    assert sum(t["amount"] for t in by_currency["USD"]) == pytest.approx(10.0)
+
+
+def test_fx_cache_reloads_after_invalidate():
+    """Test the cache only calls the loader when stale or invalidated"""
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return FxRateTable({"EUR": "1.1"}, version=len(calls))
+
+    cache = FxRateCache(ttl=60)
+    assert cache.get(loader).version == 1
+    assert cache.get(loader).version == 1
+    cache.invalidate()
+    assert cache.get(loader).version == 2
+
+
+# ============== FEE-AWARE TESTS ==============
+def test_min_fee_avoids_expensive_pairs():
+    """Test the fee solver routes around a costly pair"""
+    balances = {"a": -10.0, "b": -10.0, "c": 10.0, "d": 10.0}
+    pair_fees = {"a": {"c": 9000}, "b": {"d": 9000}}
+    result = tex_optimize_min_fee(balances, pair_fees=pair_fees)
+    assert result["method"] == "milp"
+    assert result["total_fee"] == 2000
+    assert result["baseline_fee"] == 18000
+    assert all(abs(v) < 0.01 for v in net_after(balances, result["settlements"]).values())
+
+
+def test_min_fee_falls_back_to_greedy():
+    """Test oversized problems use the greedy plan and still report its fee"""
+    balances = {f"d{i}": -1.0 for i in range(60)}
+    balances.update({f"c{i}": 1.0 for i in range(60)})
+    result = tex_optimize_min_fee(balances)
+    assert result["method"] == "greedy_fallback"
+    assert result["total_fee"] == 60 * 1000